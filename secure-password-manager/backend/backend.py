@@ -2,108 +2,636 @@ import sys
 import json
 import sqlite3
 from Cryptodome.Cipher import AES
-from Cryptodome.Protocol.KDF import PBKDF2
-from Cryptodome.Hash import SHA256
 import os
 import base64
+import csv
+import hashlib
+import heapq
 import hmac
+import math
+import mmap
 import stat
-import pyotp
-import qrcode
+import struct
 from io import BytesIO
 import logging
+import logging.handlers
+import queue
+import re
+import atexit
 import traceback
 import signal
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from argon2.low_level import hash_secret_raw, Type
 
+# pyotp and qrcode (which pulls in PIL) are imported inside the MFA functions that use them,
+# and PBKDF2 inside the legacy record path, keeping them off the startup path
+
+try:
+    import msgpack
+except ImportError:  # Optional: binary framing is only offered when msgpack is installed
+    msgpack = None
+
 DB_FILE = 'passwords.db'
 SALT_FILE = 'salt.bin'
 MASTER_PASSWORD_FILE = 'master_password.bin'
 TOTP_SECRET_FILE = 'totp_secret.bin'
+TOTP_REKEY_SUFFIX = '.rekey'  # TOTP secret sealed under the new key while a re-key is under way
+BREACH_INDEX_FILE = 'breach_index.bin'
 MFA_ENABLED = True  # Set to False to disable MFA globally
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stderr)
-    ]
+VERIFIER_VERSION = 2  # JSON master password file: KDF header plus key check
+KEY_CHECK_PREFIX = 'kcv1:'  # Previous verifier format; older files hold an Argon2 PHC hash
+KEY_CHECK_VALUE = b'secure-password-manager key check'
+KEY_CHECK_AAD = b'key-check-v1'
+
+RECORD_PREFIX = 'v1:'  # Prefix of the per-record format; v0 records have none
+VAULT_KEY_VERSION = 1
+VAULT_KEY_AAD = b'vault-key-v1'
+
+# Password index: every row carries an HMAC of its password under a key derived from the vault
+# key, so reuse shows up as equal column values, and a strength estimate in bits taken at write
+# time. The estimate is sealed under the vault key, so the database alone does not show which
+# entries are weak. Auditing reads only these columns; no password is decrypted.
+PASSWORD_HMAC_CONTEXT = b'password-hmac-v1'
+STRENGTH_AAD = b'strength-v1'
+STRENGTH_PREFIX = 's1:'  # Prefix of sealed scores; plaintext ones from older versions have none
+WEAK_PASSWORD_BITS = 60
+# Upper bound in bits of each strength level; anything above the last is 'very_strong'
+STRENGTH_LEVELS = (('very_weak', 28), ('weak', 36), ('fair', 60), ('strong', 128))
+
+# Bulk decryption and migration fan out over a thread pool sized to the core count. Work is
+# handed out in chunks; results come back in input order. Small vaults stay on the calling thread.
+DECRYPT_WORKERS = min(32, os.cpu_count() or 1)
+DECRYPT_CHUNK_ROWS = 256
+PARALLEL_DECRYPT_MIN_ROWS = 1024
+_decrypt_pool = None
+_decrypt_pool_lock = threading.Lock()
+
+# Decrypted-entry cache: plaintexts keyed by entry id and checked against the row's version
+# column. Entries expire after an idle TTL, the least recently used go first past the size cap,
+# and every eviction overwrites the bytearray that held the plaintext.
+# SPM_ENTRY_CACHE=0 turns it off, so benchmarks can time every decrypt instead of cache hits.
+ENTRY_CACHE_ENV = 'SPM_ENTRY_CACHE'
+ENTRY_CACHE_ENABLED = os.environ.get(ENTRY_CACHE_ENV, '1') != '0'
+ENTRY_CACHE_MAX_ENTRIES = 5000
+ENTRY_CACHE_TTL_SECONDS = 300
+_entry_cache = OrderedDict()  # id -> (version, plaintext bytearray, last used)
+_entry_cache_lock = threading.Lock()
+_entry_cache_timer = None
+
+BATCH_MAX_OPERATIONS = 10000  # Operations accepted by one apply_batch call
+BATCH_UPDATE_FIELDS = ('site', 'username', 'password', 'notes', 'category')
+
+IMPORT_BATCH_SIZE = 500  # Rows per executemany call and per progress line
+
+# Column names recognised when importing exports from other managers
+IMPORT_FIELD_ALIASES = {
+    'site': ('site', 'url', 'login_uri', 'name'),
+    'username': ('username', 'login_username', 'login', 'user'),
+    'password': ('password', 'login_password'),
+    'notes': ('notes', 'note', 'extra'),
+    'category': ('category', 'folder', 'grouping'),
+}
+
+# Backup file: magic, length-prefixed JSON header, then length-prefixed AES-GCM frames
+BACKUP_MAGIC = b'SPMBAK1\n'
+BACKUP_VERSION = 2  # Header carries the KDF header and key check; version 1 files still restore
+BACKUP_KEY_AAD = b'backup-key-v1'
+BACKUP_FRAME_ROWS = 256  # Rows fetched from the cursor and sealed per frame
+BACKUP_MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Breach index: magic, record count, then sorted fixed-width records of SHA-1 digest + count,
+# built from a Have I Been Pwned style "HASH:COUNT" text dump
+BREACH_INDEX_MAGIC = b'SPMHIBP1'
+BREACH_HEADER = struct.Struct('>Q')
+BREACH_RECORD = struct.Struct('>20sI')
+BREACH_SORT_CHUNK_RECORDS = 1_000_000  # Records sorted in memory per run (under 100 MB)
+BREACH_AUDIT_PAGE_ROWS = 500  # Entries decrypted and checked per progress line
+
+SEARCH_DEFAULT_LIMIT = 50
+# bm25 column weights for site, username, category, notes
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+search_index_available = False  # Set by init_db once the FTS5 index exists
+
+# Change feed: every write to passwords appends a row to the changelog; older rows are pruned
+# on startup and clients whose sequence predates the oldest kept row are told to refetch
+CHANGELOG_RETENTION = 10000
+
+# Password history: an update that changes the password first copies the old ciphertext into
+# password_history, keeping the newest PASSWORD_HISTORY_RETENTION per entry (0 keeps none)
+PASSWORD_HISTORY_RETENTION = 10
+
+# Replica sync: sync_rows gives every entry a stable uid plus its version, last-modified time and
+# content hash, and keeps a tombstone when it is deleted. A Merkle tree over uid prefixes (fanout
+# 16, SYNC_TREE_DEPTH levels) lets two replicas of the same vault find the differing rows in a few
+# round trips and exchange only those; conflicts go to the later write. Every message is sealed
+# under the vault key, so only replicas holding it can take part. Frame headers carry a short key
+# id, so replicas that generated their vault keys separately get a clear error rather than a
+# failed decryption.
+SYNC_TREE_DEPTH = 3  # 4096 leaves: about a dozen rows per leaf at 50k entries
+SYNC_HASH_HEX = 32  # Tree hashes are truncated SHA-256, hex encoded
+SYNC_BATCH_ROWS = 500  # Full rows per pull or push message
+SYNC_AAD = b'sync-v2'
+SYNC_KEY_ID_CONTEXT = b'sync-key-id-v1'
+SYNC_SESSION_HEADER = struct.Struct('>16sIB8s')  # session id, sequence number, direction, vault key id
+SYNC_KEY_MISMATCH = ('Vault key mismatch: these replicas were not copied from the same upgraded vault. '
+                     'Copy the vault to the other machine again and sync with that copy.')
+SYNC_TIMEOUT_SECONDS = 120
+SYNC_POLL_SECONDS = 0.05
+SYNC_REQUEST, SYNC_RESPONSE = 0, 1
+SYNC_TOMBSTONE_HASH = 'deleted'
+SQL_UNIX_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# Sort keys accepted by the paginated listing commands; each is paired with id for keyset paging
+ORDER_BY_COLUMNS = {
+    'id': None,
+    'site': 'site COLLATE NOCASE',
+    'category': "IFNULL(category, '') COLLATE NOCASE",
+}
+
+# Logging: SPM_LOG_LEVEL picks the level (INFO by default). Records are redacted in the calling
+# thread, then handed to a queue; a listener thread does the formatting and the stderr writes.
+LOG_LEVEL_ENV = 'SPM_LOG_LEVEL'
+DEFAULT_LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+REDACTED_FIELDS = ('password', 'master_password', 'secret', 'totp_secret', 'token', 'qr_code', 'pin')
+# Matches field: value / field=value in dict reprs, JSON and plain text
+REDACTION_PATTERN = re.compile(
+    r'''(?P<field>['"]?\b(?:''' + '|'.join(REDACTED_FIELDS) + r''')['"]?\s*[:=]\s*)'''
+    r'''(?P<value>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|[^\s,}\]]+)''',
+    re.IGNORECASE,
 )
+_log_listener = None
+
+def redact(text):
+    return REDACTION_PATTERN.sub(lambda m: m.group('field') + "'[REDACTED]'", text)
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
+
+def configure_logging(level=None):
+    global _log_listener
+    level_name = (level or os.environ.get(LOG_LEVEL_ENV) or DEFAULT_LOG_LEVEL).upper()
+    numeric_level = logging.getLevelName(level_name)
+    if not isinstance(numeric_level, int):
+        numeric_level = logging.getLevelName(DEFAULT_LOG_LEVEL)
+
+    stop_logging()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(numeric_level)
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+    if level_name != logging.getLevelName(numeric_level):
+        logging.warning(f'Unknown log level {level_name!r}; using {DEFAULT_LOG_LEVEL}.')
+
+def stop_logging():
+    # Drains queued records to stderr; called on shutdown and at exit
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+configure_logging()
+atexit.register(stop_logging)
 
-# Initialize Argon2 Password Hasher
+# Argon2 parameters for new vaults and for vaults whose verifier predates the KDF header
+DEFAULT_KDF_PARAMS = {
+    'algorithm': 'argon2id',
+    'time_cost': 2,
+    'memory_cost': 102400,  # in kibibytes (100 MB)
+    'parallelism': 8,
+    'hash_len': 32,
+}
+KDF_HEADER_VERSION = 1
+KDF_TARGET_SECONDS = 0.5  # Default unlock time calibrate_kdf_params aims for
+# Bounds for caller-supplied parameters; the floors follow the OWASP minimum for Argon2id
+KDF_MIN_TIME_COST = 2
+KDF_MAX_TIME_COST = 10
+KDF_MIN_MEMORY_COST = 19456  # in kibibytes (19 MiB)
+KDF_MAX_MEMORY_COST = 4194304  # in kibibytes (4 GiB)
+KDF_MAX_PARALLELISM = 16
+
+# Initialize Argon2 Password Hasher; only used to check legacy PHC-hash verifiers
 ph = PasswordHasher(
-    time_cost=2,
-    memory_cost=102400,  # in kibibytes (100 MB)
-    parallelism=8,
-    hash_len=32,
+    time_cost=DEFAULT_KDF_PARAMS['time_cost'],
+    memory_cost=DEFAULT_KDF_PARAMS['memory_cost'],
+    parallelism=DEFAULT_KDF_PARAMS['parallelism'],
+    hash_len=DEFAULT_KDF_PARAMS['hash_len'],
     salt_len=16,
     type=Type.ID
 )
 
+# Every command the backend answers; anything else is timed under command:unknown, so a client
+# cannot grow the metrics table by sending made-up names
+COMMANDS = {
+    'add_password', 'apply_batch', 'audit_breaches', 'audit_vault', 'calibrate_kdf', 'close_vault',
+    'delete_category', 'delete_password', 'disable_mfa', 'export_vault', 'get_changes_since', 'get_history',
+    'get_metrics', 'get_passwords', 'import_entries', 'is_master_password_set', 'is_mfa_enabled',
+    'list_entries', 'list_vaults', 'lock', 'open_vault', 'rename_category', 'restore_vault',
+    'reveal_password', 'search', 'serve_sync', 'set_auto_lock', 'set_framing', 'set_kdf_params',
+    'set_master_password', 'set_pin', 'setup_mfa', 'shutdown', 'sync_vault', 'unlock_with_pin',
+    'update_password', 'verify_mfa',
+}
+# Commands that change session state run alone, in arrival order; everything else goes to the pool
+SERIAL_COMMANDS = {
+    'set_master_password', 'set_kdf_params', 'lock', 'set_pin', 'unlock_with_pin', 'set_auto_lock',
+    'set_framing', 'shutdown', 'open_vault', 'close_vault',
+}
+# Commands that never touch the session or vault keys; they neither wait for nor hold up serial ones
+SESSION_FREE_COMMANDS = {'get_metrics', 'calibrate_kdf'}
+# set_framing and shutdown act on the stream itself, so every earlier response has to be out first
+STREAM_COMMANDS = {'set_framing', 'shutdown'}
+COMMAND_WORKERS = 4
+
+# Auto-lock: a background thread wipes the session key and entry cache once no command has run
+# for auto_lock_seconds. Quick unlock keeps the master key wrapped under a PIN-derived key in
+# memory for a limited time, so re-unlocking costs a small Argon2 pass instead of the full one.
+AUTO_LOCK_SECONDS = 300
+AUTO_LOCK_POLL_SECONDS = 5
+QUICK_UNLOCK_TTL_SECONDS = 3600
+QUICK_UNLOCK_MAX_ATTEMPTS = 3
+PIN_MIN_LENGTH = 4
+PIN_KDF_PARAMS = {
+    'algorithm': 'argon2id',
+    'time_cost': 3,
+    'memory_cost': 19456,  # in kibibytes (19 MiB)
+    'parallelism': 1,
+    'hash_len': 32,
+}
+PIN_WRAP_AAD = b'pin-wrap-v1'
+
+# Pipe framing: newline-delimited JSON until the client negotiates msgpack with set_framing,
+# after which both directions use a 4-byte big-endian length prefix followed by a msgpack map
+FRAMING_MODES = ('json', 'msgpack')
+REQUEST_ID_PATTERN = re.compile(r'"id"\s*:\s*(-?\d+|"(?:[^"\\]|\\.)*")')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+_framing_mode = 'json'
+
+# Long-lived connections, one per thread and vault database file; opened in main() or on first use.
+# close_db() bumps the generation so every thread reopens on its next call.
+_db_local = threading.local()
+_db_connections = []
+_db_generation = 0
+_db_lock = threading.Lock()
+
+# Vault registry: the default vault lives at the file globals above; further vaults (team, shared)
+# are opened by name from their own directories and stay unlocked alongside it, each with its own
+# files, connections, master key and entry cache. A command runs against one when its data names
+# it under "vault"; use_vault() sets that per thread.
+DEFAULT_VAULT = 'default'
+_vaults = {}  # name -> {'name', 'directory', 'master_key' (bytearray), 'cache'}
+_vaults_lock = threading.Lock()
+_vault_local = threading.local()
+
+# Timing spans: every command is timed as command:<name>, with kdf, db_query, decrypt and
+# serialize spans inside it. The last METRICS_WINDOW samples per span feed get_metrics;
+# setting SPM_TRACE_FILE also appends each span to that file as a JSON line.
+METRICS_WINDOW = 1024
+TRACE_FILE_ENV = 'SPM_TRACE_FILE'
+_metrics = {}
+_metrics_lock = threading.Lock()
+_bytes_written = 0
+_messages_written = 0
+_trace_file = None
+_span_context = threading.local()
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def record_span(name, seconds):
+    with _metrics_lock:
+        entry = _metrics.get(name)
+        if entry is None:
+            entry = _metrics[name] = {'count': 0, 'total': 0.0, 'samples': deque(maxlen=METRICS_WINDOW)}
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['samples'].append(seconds)
+        if _trace_file is not None:
+            _trace_file.write(json.dumps({
+                'ts': round(time.time(), 6),
+                'span': name,
+                'ms': round(seconds * 1000, 3),
+                'command': getattr(_span_context, 'command', None),
+                'request_id': getattr(_span_context, 'request_id', None),
+            }) + '\n')
+
+def _percentile(sorted_samples, fraction):
+    # Nearest-rank percentile over the retained window
+    index = max(0, min(len(sorted_samples) - 1, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+def get_metrics():
+    with _metrics_lock:
+        spans = {}
+        for name, entry in _metrics.items():
+            samples = sorted(entry['samples'])
+            spans[name] = {
+                'count': entry['count'],
+                'mean_ms': round(entry['total'] / entry['count'] * 1000, 3),
+                'p50_ms': round(_percentile(samples, 0.50) * 1000, 3),
+                'p95_ms': round(_percentile(samples, 0.95) * 1000, 3),
+                'p99_ms': round(_percentile(samples, 0.99) * 1000, 3),
+                'max_ms': round(samples[-1] * 1000, 3),
+            }
+        return {
+            'spans': spans,
+            'bytes_written': _bytes_written,
+            'messages_written': _messages_written,
+            'trace_file': _trace_file.name if _trace_file is not None else None,
+        }
+
+def reset_metrics():
+    global _bytes_written, _messages_written
+    with _metrics_lock:
+        _metrics.clear()
+        _bytes_written = 0
+        _messages_written = 0
+
+def open_trace_file(path):
+    global _trace_file
+    close_trace_file()
+    try:
+        _trace_file = open(path, 'a', buffering=1)
+        logging.info(f'Writing timing trace to {path}.')
+    except OSError as e:
+        logging.warning(f'Could not open trace file {path}: {e}')
+
+def close_trace_file():
+    global _trace_file
+    with _metrics_lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+
 def handle_exit_signals(signum, frame):
     logging.info(f"Received signal {signum}. Exiting backend process.")
+    clear_entry_cache()
+    close_vaults()
+    close_db()
     sys.exit(0)
 
-def get_master_key(password):
-    try:
-        if os.path.exists(SALT_FILE):
-            # Read the existing salt
-            with open(SALT_FILE, 'rb') as f:
-                salt = f.read()
-            logging.debug('Salt loaded from existing salt file.')
-        else:
-            # Generate a new salt and store it
-            salt = os.urandom(16)
-            with open(SALT_FILE, 'wb') as f:
-                f.write(salt)
-            os.chmod(SALT_FILE, stat.S_IRUSR | stat.S_IWUSR)
-            logging.debug('New salt generated and stored.')
-        
-        # Derive the master key using Argon2
-        master_key = hash_secret_raw(
-            secret=password.encode('utf-8'),
-            salt=salt,
-            time_cost=2,
-            memory_cost=102400,  # in kibibytes (100 MB)
-            parallelism=8,
-            hash_len=32,
-            type=Type.ID
-        )
+def current_vault():
+    return getattr(_vault_local, 'vault', None)
+
+def vault_file(default_path):
+    # Named vaults keep the default file names inside their own directory
+    vault = current_vault()
+    if vault is None:
+        return default_path
+    return os.path.join(vault['directory'], os.path.basename(default_path))
+
+@contextmanager
+def use_vault(vault):
+    # vault is a registry record, or None for the default vault
+    previous = current_vault()
+    _vault_local.vault = vault
+    try:
+        yield vault
+    finally:
+        _vault_local.vault = previous
+
+def _thread_connections():
+    if getattr(_db_local, 'generation', None) != _db_generation:
+        return {}
+    return _db_local.connections
+
+def open_db():
+    path = vault_file(DB_FILE)
+    conn = _thread_connections().get(path)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+    # WAL lets readers proceed during writes; NORMAL skips the per-commit fsync WAL does not need
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    # Writers on other worker threads wait for the lock instead of failing
+    conn.execute('PRAGMA busy_timeout=5000')
+    with _db_lock:
+        _db_connections.append(conn)
+        if getattr(_db_local, 'generation', None) != _db_generation:
+            _db_local.connections = {}
+            _db_local.generation = _db_generation
+    _db_local.connections[path] = conn
+    logging.debug(f'Database connection opened: {path}')
+    return conn
+
+def get_db():
+    return open_db()
+
+def rollback_db():
+    conn = _thread_connections().get(vault_file(DB_FILE))
+    if conn is not None:
+        conn.rollback()
+
+def close_db():
+    global _db_generation
+    with _db_lock:
+        connections = list(_db_connections)
+        _db_connections.clear()
+        _db_generation += 1
+    for conn in connections:
+        try:
+            conn.rollback()
+            conn.execute('PRAGMA optimize')
+            conn.close()
+            logging.debug('Database connection closed.')
+        except Exception as e:
+            logging.error('Error closing database connection:', exc_info=True)
+    _db_local.connections = {}
+
+def new_kdf_header(params=None):
+    header = {**DEFAULT_KDF_PARAMS, **(params or {})}
+    header['version'] = KDF_HEADER_VERSION
+    header['salt'] = base64.b64encode(os.urandom(16)).decode()
+    return header
+
+def read_verifier():
+    # Current verifiers are JSON holding the KDF header and key check; older ones are plain strings
+    path = vault_file(MASTER_PASSWORD_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        stored_verifier = f.read()
+    if stored_verifier.startswith('{'):
+        return json.loads(stored_verifier)
+    return stored_verifier
+
+def legacy_kdf_header():
+    salt_file = vault_file(SALT_FILE)
+    if os.path.exists(salt_file):
+        # Read the existing salt
+        with open(salt_file, 'rb') as f:
+            salt = f.read()
+        logging.debug('Salt loaded from existing salt file.')
+    else:
+        # Generate a new salt and store it
+        salt = os.urandom(16)
+        with open(salt_file, 'wb') as f:
+            f.write(salt)
+        os.chmod(salt_file, stat.S_IRUSR | stat.S_IWUSR)
+        logging.debug('New salt generated and stored.')
+    return {**DEFAULT_KDF_PARAMS, 'version': KDF_HEADER_VERSION, 'salt': base64.b64encode(salt).decode()}
+
+def load_kdf_header():
+    verifier = read_verifier()
+    if isinstance(verifier, dict):
+        return verifier['kdf']
+    return legacy_kdf_header()
+
+def get_master_key(password, kdf_header=None):
+    try:
+        if kdf_header is None:
+            kdf_header = load_kdf_header()
+        if kdf_header.get('algorithm') != 'argon2id':
+            raise ValueError(f"Unsupported KDF algorithm: {kdf_header.get('algorithm')}")
+
+        # Derive the master key using Argon2 with the parameters recorded for this vault
+        with span('kdf'):
+            master_key = hash_secret_raw(
+                secret=password.encode('utf-8'),
+                salt=base64.b64decode(kdf_header['salt']),
+                time_cost=kdf_header['time_cost'],
+                memory_cost=kdf_header['memory_cost'],
+                parallelism=kdf_header['parallelism'],
+                hash_len=kdf_header['hash_len'],
+                type=Type.ID
+            )
         logging.debug('Master key derived successfully.')
         return master_key
     except Exception as e:
         logging.error('Error generating master key:', exc_info=True)
         return None
 
-def hash_master_password(password):
+def calibrate_kdf_params(target_seconds=KDF_TARGET_SECONDS, memory_cost=DEFAULT_KDF_PARAMS['memory_cost']):
+    # One lane per core, then as many passes as fit in the target time on this machine
+    parallelism = max(1, min(os.cpu_count() or 1, KDF_MAX_PARALLELISM))
+    start = time.perf_counter()
+    hash_secret_raw(
+        secret=b'calibration',
+        salt=os.urandom(16),
+        time_cost=1,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        hash_len=DEFAULT_KDF_PARAMS['hash_len'],
+        type=Type.ID
+    )
+    per_pass = time.perf_counter() - start
+    time_cost = max(KDF_MIN_TIME_COST, min(KDF_MAX_TIME_COST, round(target_seconds / per_pass)))
+    logging.info(f'Calibrated Argon2: t={time_cost}, m={memory_cost} KiB, p={parallelism} ({per_pass:.3f}s per pass).')
+    return {
+        'algorithm': 'argon2id',
+        'time_cost': time_cost,
+        'memory_cost': memory_cost,
+        'parallelism': parallelism,
+        'hash_len': DEFAULT_KDF_PARAMS['hash_len'],
+    }
+
+def check_kdf_params(params):
+    # Only the three cost parameters are tunable; algorithm and hash length stay fixed
+    if not isinstance(params, dict) or set(params) - {'time_cost', 'memory_cost', 'parallelism'}:
+        return {'error': 'params may only set time_cost, memory_cost and parallelism'}
+    bounds = {
+        'time_cost': (KDF_MIN_TIME_COST, KDF_MAX_TIME_COST),
+        'memory_cost': (KDF_MIN_MEMORY_COST, KDF_MAX_MEMORY_COST),
+        'parallelism': (1, KDF_MAX_PARALLELISM),
+    }
+    checked = {'algorithm': 'argon2id', 'hash_len': DEFAULT_KDF_PARAMS['hash_len']}
+    for name, (low, high) in bounds.items():
+        value = params.get(name, DEFAULT_KDF_PARAMS[name])
+        if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+            return {'error': f'{name} must be an integer from {low} to {high}'}
+        checked[name] = value
+    return {'params': checked}
+
+def store_key_check(master_key, kdf_header):
+    # The verifier is a known value sealed under the derived key, so one Argon2 pass
+    # both checks the password and yields the key. It shares a file with the KDF header
+    # so the two are always replaced together.
+    key_check = base64.b64encode(_seal(master_key, KEY_CHECK_VALUE, aad=KEY_CHECK_AAD)).decode()
+    tmp_path = vault_file(MASTER_PASSWORD_FILE) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': VERIFIER_VERSION, 'kdf': kdf_header, 'key_check': key_check}, f)
+    os.chmod(tmp_path, stat.S_IRUSR | stat.S_IWUSR)
+    os.replace(tmp_path, vault_file(MASTER_PASSWORD_FILE))
+
+def check_key(master_key, key_check):
     try:
-        # Hash the password using argon2-cffi
-        password_hash = ph.hash(password)
-        with open(MASTER_PASSWORD_FILE, 'w') as f:
-            f.write(password_hash)
+        check = _open(master_key, base64.b64decode(key_check), aad=KEY_CHECK_AAD)
+    except ValueError:
+        return False
+    return hmac.compare_digest(check, KEY_CHECK_VALUE)
 
-        os.chmod(MASTER_PASSWORD_FILE, stat.S_IRUSR | stat.S_IWUSR)
+def hash_master_password(password, kdf_params=None):
+    try:
+        kdf_header = new_kdf_header(kdf_params)
+        master_key = get_master_key(password, kdf_header)
+        if master_key is None:
+            raise ValueError('Master key derivation failed.')
+        store_key_check(master_key, kdf_header)
         logging.info('Master password hashed and stored successfully.')
+        return master_key
     except Exception as e:
         logging.error('Error hashing master password:', exc_info=True)
+        return None
 
 def verify_master_password(password):
     try:
-        if not os.path.exists(MASTER_PASSWORD_FILE):
+        verifier = read_verifier()
+        if verifier is None:
             logging.warning('Master password file does not exist.')
             return False, None
 
-        with open(MASTER_PASSWORD_FILE, 'r') as f:
-            stored_password_hash = f.read()
+        if isinstance(verifier, dict):
+            master_key = get_master_key(password, verifier['kdf'])
+            if master_key is None:
+                raise ValueError('Master key derivation failed.')
+            if not check_key(master_key, verifier['key_check']):
+                raise VerifyMismatchError()
+            logging.info('Master password verified successfully.')
+            return True, master_key
 
-        # Verify the password
-        ph.verify(stored_password_hash, password)
-
-        # If verification is successful, derive the master key
-        master_key = get_master_key(password)
-        logging.info('Master password verified successfully.')
+        # Older verifiers use the default parameters and the separate salt file
+        kdf_header = legacy_kdf_header()
+        if verifier.startswith(KEY_CHECK_PREFIX):
+            master_key = get_master_key(password, kdf_header)
+            if master_key is None or not check_key(master_key, verifier[len(KEY_CHECK_PREFIX):]):
+                raise VerifyMismatchError()
+        else:
+            # Argon2 PHC hash: verify it once, then derive the key separately
+            ph.verify(verifier, password)
+            master_key = get_master_key(password, kdf_header)
+        # Same salt and parameters, so the key is unchanged; only the file format is upgraded
+        store_key_check(master_key, kdf_header)
+        logging.info('Master password verified; verifier upgraded to the KDF header format.')
         return True, master_key
 
     except VerifyMismatchError:
@@ -113,40 +641,543 @@ def verify_master_password(password):
         logging.error('Error verifying master password:', exc_info=True)
         return False, None
 
-def encrypt(master_key, plaintext):
+def rekey_master_key(master_key, password, kdf_params):
     try:
-        salt = os.urandom(16)  # Separate salt for encryption
-        # Derive a unique key for encryption using PBKDF2 with SHA256
-        aes_key = PBKDF2(master_key, salt, dkLen=32, count=100000, hmac_hash_module=SHA256)
-        nonce = os.urandom(12)
-        cipher = AES.new(aes_key, AES.MODE_GCM, nonce=nonce)
-        ciphertext, tag = cipher.encrypt_and_digest(plaintext.encode())
-        encrypted_data = base64.b64encode(salt + nonce + tag + ciphertext).decode()
-        logging.debug('Data encrypted successfully.')
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        totp_secret = None
+        if os.path.exists(vault_file(TOTP_SECRET_FILE)):
+            totp_secret = load_totp_secret(master_key)
+            if totp_secret is None:
+                raise ValueError('TOTP secret unavailable.')
+
+        kdf_header = new_kdf_header(kdf_params)
+        new_master_key = get_master_key(password, kdf_header)
+        if new_master_key is None:
+            raise ValueError('Master key derivation failed.')
+
+        # Entries stay encrypted under the vault key; only its wrapping changes.
+        # The new wrapping is committed next to the old one, so whichever verifier
+        # is on disk if the process dies mid-way still unlocks the vault.
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('INSERT INTO vault_keys (version, wrapped_key) VALUES (?, ?)',
+                  (VAULT_KEY_VERSION, base64.b64encode(_seal(new_master_key, vault_key, aad=VAULT_KEY_AAD)).decode()))
+        new_wrapping_id = c.lastrowid
+        conn.commit()
+
+        # The TOTP secret is staged under the new key before the verifier is swapped and moved into
+        # place after, so a crash at any point leaves a copy that the on-disk verifier's key opens
+        staged_totp = vault_file(TOTP_SECRET_FILE) + TOTP_REKEY_SUFFIX
+        if totp_secret is not None and not store_totp_secret(new_master_key, totp_secret, staged_totp):
+            raise ValueError('Failed to stage TOTP secret.')
+        store_key_check(new_master_key, kdf_header)
+        if totp_secret is not None:
+            os.replace(staged_totp, vault_file(TOTP_SECRET_FILE))
+
+        c.execute('DELETE FROM vault_keys WHERE id != ?', (new_wrapping_id,))
+        conn.commit()
+        logging.info('Master key re-keyed with new KDF parameters.')
+        return new_master_key
+    except Exception as e:
+        rollback_db()
+        logging.error('Error re-keying master key:', exc_info=True)
+        return None
+
+def _seal(key, data, aad=None):
+    # AES-GCM with a fresh nonce; returns nonce || tag || ciphertext
+    nonce = os.urandom(12)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if aad is not None:
+        cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(data)
+    return nonce + tag + ciphertext
+
+def _open(key, blob, aad=None):
+    nonce = blob[:12]
+    tag = blob[12:28]
+    ciphertext = blob[28:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if aad is not None:
+        cipher.update(aad)
+    return cipher.decrypt_and_verify(ciphertext, tag)
+
+def is_legacy_record(encrypted_data):
+    # v0 records are bare base64 (salt || nonce || tag || ct) and never contain ':'
+    return not encrypted_data.startswith(RECORD_PREFIX)
+
+def _decrypt_legacy(master_key, encrypted_data):
+    data = base64.b64decode(encrypted_data)
+    salt = data[:16]
+    nonce = data[16:28]
+    tag = data[28:44]
+    ciphertext = data[44:]
+    # v0 derived a per-record AES key with PBKDF2
+    from Cryptodome.Protocol.KDF import PBKDF2
+    from Cryptodome.Hash import SHA256
+    aes_key = PBKDF2(master_key, salt, dkLen=32, count=100000, hmac_hash_module=SHA256)
+    cipher = AES.new(aes_key, AES.MODE_GCM, nonce=nonce)
+    return cipher.decrypt_and_verify(ciphertext, tag).decode()
+
+def encrypt(key, plaintext):
+    try:
+        # v1 records use the key directly, no per-record KDF
+        encrypted_data = RECORD_PREFIX + base64.b64encode(_seal(key, plaintext.encode())).decode()
         return encrypted_data
     except (ValueError, KeyError) as e:
         logging.error(f"Encryption failed: {e}", exc_info=True)
         return None
 
-def decrypt(master_key, encrypted_data):
-    try:
-        data = base64.b64decode(encrypted_data)
-        salt = data[:16]
-        nonce = data[16:28]
-        tag = data[28:44]
-        ciphertext = data[44:]
-        # Derive the AES key using the same method as encryption
-        aes_key = PBKDF2(master_key, salt, dkLen=32, count=100000, hmac_hash_module=SHA256)
-        cipher = AES.new(aes_key, AES.MODE_GCM, nonce=nonce)
-        plaintext = cipher.decrypt_and_verify(ciphertext, tag).decode()
-        logging.debug('Data decrypted successfully.')
+def decrypt(key, encrypted_data):
+    try:
+        if is_legacy_record(encrypted_data):
+            plaintext = _decrypt_legacy(key, encrypted_data)
+        else:
+            blob = base64.b64decode(encrypted_data[len(RECORD_PREFIX):])
+            plaintext = _open(key, blob).decode()
         return plaintext
     except (ValueError, KeyError) as e:
         logging.error(f"Decryption failed: {e}", exc_info=True)
         return None
 
+def decrypt_entry(master_key, vault_key, encrypted_data):
+    # Rows that have not been migrated yet are still keyed by the master key
+    if is_legacy_record(encrypted_data):
+        return decrypt(master_key, encrypted_data)
+    return decrypt(vault_key, encrypted_data)
+
+def get_decrypt_pool():
+    global _decrypt_pool
+    with _decrypt_pool_lock:
+        if _decrypt_pool is None:
+            _decrypt_pool = ThreadPoolExecutor(max_workers=DECRYPT_WORKERS, thread_name_prefix='decrypt')
+        return _decrypt_pool
+
+def parallel_map(func, items):
+    # Same result as [func(item) for item in items]; AES and Argon2/PBKDF2 calls drop the GIL
+    # inside their C code, so chunks on separate threads overlap
+    items = list(items)
+    if DECRYPT_WORKERS < 2 or len(items) < PARALLEL_DECRYPT_MIN_ROWS:
+        return [func(item) for item in items]
+    chunks = [items[i:i + DECRYPT_CHUNK_ROWS] for i in range(0, len(items), DECRYPT_CHUNK_ROWS)]
+    results = []
+    for chunk_results in get_decrypt_pool().map(lambda chunk: [func(item) for item in chunk], chunks):
+        results.extend(chunk_results)
+    return results
+
+def _wipe(buffer):
+    buffer[:] = bytes(len(buffer))
+
+def _active_cache():
+    # Entry ids are only unique within a vault, so every vault has its own cache
+    vault = current_vault()
+    return _entry_cache if vault is None else vault['cache']
+
+def _all_caches():
+    with _vaults_lock:
+        return [_entry_cache] + [vault['cache'] for vault in _vaults.values()]
+
+def _evict_cached_entry(cache, entry_id):
+    # Caller holds _entry_cache_lock
+    _, buffer, _ = cache.pop(entry_id)
+    _wipe(buffer)
+
+def _prune_entry_cache(cache, now):
+    # Entries are kept in last-used order, so expired ones are at the front
+    while cache:
+        entry_id, (_, _, last_used) = next(iter(cache.items()))
+        if now - last_used < ENTRY_CACHE_TTL_SECONDS and len(cache) <= ENTRY_CACHE_MAX_ENTRIES:
+            break
+        _evict_cached_entry(cache, entry_id)
+
+def _schedule_cache_sweep():
+    # Caller holds _entry_cache_lock. Expiry must not depend on another request arriving.
+    global _entry_cache_timer
+    if _entry_cache_timer is None and any(_all_caches()):
+        _entry_cache_timer = threading.Timer(ENTRY_CACHE_TTL_SECONDS, _sweep_entry_cache)
+        _entry_cache_timer.daemon = True
+        _entry_cache_timer.start()
+
+def _sweep_entry_cache():
+    global _entry_cache_timer
+    with _entry_cache_lock:
+        _entry_cache_timer = None
+        now = time.monotonic()
+        for cache in _all_caches():
+            _prune_entry_cache(cache, now)
+        _schedule_cache_sweep()
+
+def cache_get(entry_id, version):
+    if not ENTRY_CACHE_ENABLED:
+        return None
+    cache = _active_cache()
+    with _entry_cache_lock:
+        now = time.monotonic()
+        _prune_entry_cache(cache, now)
+        cached = cache.get(entry_id)
+        if cached is None:
+            return None
+        if cached[0] != version:
+            _evict_cached_entry(cache, entry_id)
+            return None
+        cache[entry_id] = (cached[0], cached[1], now)
+        cache.move_to_end(entry_id)
+        # The returned str is an immutable copy that cannot be wiped; the cached buffer can
+        return cached[1].decode('utf-8')
+
+def cache_put(entry_id, version, plaintext):
+    if not ENTRY_CACHE_ENABLED:
+        return
+    cache = _active_cache()
+    with _entry_cache_lock:
+        if entry_id in cache:
+            _evict_cached_entry(cache, entry_id)
+        cache[entry_id] = (version, bytearray(plaintext.encode('utf-8')), time.monotonic())
+        _prune_entry_cache(cache, time.monotonic())
+        _schedule_cache_sweep()
+
+def cache_invalidate(entry_id):
+    cache = _active_cache()
+    with _entry_cache_lock:
+        if entry_id in cache:
+            _evict_cached_entry(cache, entry_id)
+
+def clear_entry_cache(cache=None):
+    # Clears the current vault's cache; the sweep timer stops once every cache is empty
+    global _entry_cache_timer
+    cache = _active_cache() if cache is None else cache
+    with _entry_cache_lock:
+        for entry_id in list(cache):
+            _evict_cached_entry(cache, entry_id)
+        if _entry_cache_timer is not None and not any(_all_caches()):
+            _entry_cache_timer.cancel()
+            _entry_cache_timer = None
+
+def decrypt_rows_cached(master_key, vault_key, rows):
+    # rows are (id, version, ciphertext); returns plaintexts in row order, None where decryption failed
+    plaintexts = [cache_get(entry_id, version) for entry_id, version, _ in rows]
+    misses = [i for i, plaintext in enumerate(plaintexts) if plaintext is None]
+    decrypted = parallel_map(lambda i: decrypt_entry(master_key, vault_key, rows[i][2]), misses)
+    for i, plaintext in zip(misses, decrypted):
+        plaintexts[i] = plaintext
+        if plaintext is not None:
+            cache_put(rows[i][0], rows[i][1], plaintext)
+    return plaintexts
+
+def new_session():
+    return {
+        'master_key': None,  # bytearray while unlocked, so it can be wiped
+        'lock': threading.Lock(),  # Guards active/last_activity against the auto-lock thread
+        'active': 0,
+        'last_activity': time.monotonic(),
+        'auto_lock_seconds': AUTO_LOCK_SECONDS,
+        'quick_unlock': None,
+    }
+
+def set_session_key(session, master_key):
+    # Only called with no other command in flight: from a serial command or the auto-lock thread.
+    # The bytes returned by the KDF cannot be wiped; the session's own copy can.
+    old_key = session['master_key']
+    session['master_key'] = None if master_key is None else bytearray(master_key)
+    if old_key is not None:
+        _wipe(old_key)
+
+def lock_session(session, forget_quick_unlock=False):
+    set_session_key(session, None)
+    clear_entry_cache()
+    # Named vaults hang off the same session: locking closes them and wipes their keys
+    close_vaults()
+    if forget_quick_unlock:
+        session['quick_unlock'] = None
+    logging.info('Vault locked.')
+
+def maybe_auto_lock(session, now=None):
+    now = time.monotonic() if now is None else now
+    with session['lock']:
+        timeout = session['auto_lock_seconds']
+        if not timeout or session['master_key'] is None or session['active']:
+            return False
+        if now - session['last_activity'] < timeout:
+            return False
+        lock_session(session)
+    logging.info(f'Vault auto-locked after {timeout} seconds idle.')
+    return True
+
+def auto_lock_worker(session, stop_event):
+    while not stop_event.wait(AUTO_LOCK_POLL_SECONDS):
+        if maybe_auto_lock(session):
+            send_message({"event": "locked", "reason": "idle"})
+
+def enable_quick_unlock(session, pin):
+    if not isinstance(pin, str) or len(pin) < PIN_MIN_LENGTH:
+        return {'error': f'PIN must be at least {PIN_MIN_LENGTH} characters'}
+    kdf_header = {**PIN_KDF_PARAMS, 'salt': base64.b64encode(os.urandom(16)).decode()}
+    pin_key = get_master_key(pin, kdf_header)
+    if pin_key is None:
+        return {'error': 'Failed to set PIN'}
+    session['quick_unlock'] = {
+        'kdf': kdf_header,
+        'wrapped_key': _seal(pin_key, bytes(session['master_key']), aad=PIN_WRAP_AAD),
+        'expires': time.monotonic() + QUICK_UNLOCK_TTL_SECONDS,
+        'attempts_left': QUICK_UNLOCK_MAX_ATTEMPTS,
+    }
+    logging.info('Quick unlock enabled.')
+    return {'status': 'PIN set', 'expires_in': QUICK_UNLOCK_TTL_SECONDS}
+
+def unlock_with_pin(session, pin):
+    state = session['quick_unlock']
+    if state is None or time.monotonic() >= state['expires']:
+        session['quick_unlock'] = None
+        return {'error': 'Quick unlock unavailable'}
+    pin_key = get_master_key(pin or '', state['kdf'])
+    try:
+        master_key = _open(pin_key, state['wrapped_key'], aad=PIN_WRAP_AAD)
+    except (TypeError, ValueError):
+        state['attempts_left'] -= 1
+        logging.warning('Quick unlock failed: incorrect PIN.')
+        if state['attempts_left'] <= 0:
+            # Out of guesses: only the master password can unlock from here
+            session['quick_unlock'] = None
+            return {'error': 'Too many incorrect PINs'}
+        return {'error': 'Incorrect PIN', 'attempts_left': state['attempts_left']}
+    state['attempts_left'] = QUICK_UNLOCK_MAX_ATTEMPTS
+    set_session_key(session, master_key)
+    logging.info('Vault unlocked with PIN.')
+    return {'status': 'Unlocked'}
+
+def open_vault(name, directory, master_password, create=False, token=None):
+    if not isinstance(name, str) or not name or name == DEFAULT_VAULT:
+        return {'error': 'Invalid vault name'}
+    if not directory:
+        return {'error': 'Vault directory required'}
+    directory = os.path.abspath(directory)
+    with _vaults_lock:
+        if name in _vaults:
+            return {'error': f'Vault "{name}" is already open'}
+        if any(vault['directory'] == directory for vault in _vaults.values()) \
+                or directory == os.path.dirname(os.path.abspath(DB_FILE)):
+            return {'error': 'That vault is already open'}
+    vault = {'name': name, 'directory': directory, 'master_key': None, 'cache': OrderedDict()}
+    try:
+        with use_vault(vault):
+            created = not os.path.exists(vault_file(MASTER_PASSWORD_FILE))
+            if not created:
+                success, master_key = verify_master_password(master_password)
+                if not success:
+                    return {'error': 'Incorrect master password'}
+            elif create:
+                os.makedirs(directory, exist_ok=True)
+                master_key = hash_master_password(master_password)
+                if master_key is None:
+                    return {'error': 'Failed to create vault'}
+            else:
+                return {'error': 'No vault found in that directory'}
+            # A vault with its own TOTP secret needs a token to open, as the default vault does to unlock
+            if MFA_ENABLED and os.path.exists(vault_file(TOTP_SECRET_FILE)):
+                if verify_mfa(master_key, token).get('status') != 'MFA verified':
+                    return {'error': 'Invalid MFA token'}
+            vault['master_key'] = bytearray(master_key)
+            init_db(master_key)
+        with _vaults_lock:
+            _vaults[name] = vault
+        logging.info(f'Vault "{name}" opened.')
+        return {'status': 'Vault opened', 'vault': name, 'created': created}
+    except Exception as e:
+        logging.error('Error opening vault:', exc_info=True)
+        return {'error': 'Failed to open vault'}
+
+def close_vault(name):
+    with _vaults_lock:
+        vault = _vaults.pop(name, None)
+    if vault is None:
+        return {'error': f'Vault "{name}" is not open'}
+    clear_entry_cache(vault['cache'])
+    _wipe(vault['master_key'])
+    # Only runs as a serial command, so no other thread is using a connection; they reopen the
+    # ones they still need on their next call
+    close_db()
+    logging.info(f'Vault "{name}" closed.')
+    return {'status': 'Vault closed', 'vault': name}
+
+def close_vaults():
+    with _vaults_lock:
+        names = list(_vaults)
+    for name in names:
+        close_vault(name)
+
+def list_vaults(session):
+    with _vaults_lock:
+        vaults = [{'name': vault['name'], 'directory': vault['directory'], 'unlocked': True}
+                  for vault in _vaults.values()]
+    return [{'name': DEFAULT_VAULT, 'directory': os.path.dirname(os.path.abspath(DB_FILE)),
+             'unlocked': session['master_key'] is not None}] + vaults
+
+def get_vault_key(master_key):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT wrapped_key FROM vault_keys ORDER BY id DESC')
+        rows = c.fetchall()
+        if not rows:
+            # First unlock: generate the vault key and wrap it once with the master key
+            vault_key = os.urandom(32)
+            wrapped_key = base64.b64encode(_seal(master_key, vault_key, aad=VAULT_KEY_AAD)).decode()
+            # OR IGNORE: if another worker stored a key first, unwrap that one instead
+            c.execute('INSERT OR IGNORE INTO vault_keys (id, version, wrapped_key) VALUES (1, ?, ?)',
+                      (VAULT_KEY_VERSION, wrapped_key))
+            conn.commit()
+            c.execute('SELECT wrapped_key FROM vault_keys ORDER BY id DESC')
+            rows = c.fetchall()
+            logging.info('New vault key generated and stored.')
+        # More than one wrapping only exists briefly while re-keying; use the one this key opens
+        for (wrapped_key,) in rows:
+            try:
+                vault_key = _open(master_key, base64.b64decode(wrapped_key), aad=VAULT_KEY_AAD)
+            except ValueError:
+                continue
+            logging.debug('Vault key unwrapped successfully.')
+            return vault_key
+        raise ValueError('No vault key wrapping matches the master key.')
+    except (ValueError, KeyError) as e:
+        logging.error(f"Failed to unwrap vault key: {e}", exc_info=True)
+        return None
+    except Exception as e:
+        rollback_db()
+        logging.error('Error loading vault key:', exc_info=True)
+        return None
+
+def migrate_legacy_entries(master_key):
+    try:
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT id, password FROM passwords WHERE password NOT LIKE ?", (RECORD_PREFIX + '%',))
+        rows = c.fetchall()
+        if not rows:
+            return 0
+
+        def reencrypt(row):
+            plaintext = decrypt(master_key, row[1])
+            return None if plaintext is None else encrypt(vault_key, plaintext)
+
+        # Each v0 record runs its own PBKDF2, so this is the slowest bulk path
+        updates = []
+        for (entry_id, _), encrypted_password in zip(rows, parallel_map(reencrypt, rows)):
+            if encrypted_password is None:
+                logging.warning(f"Skipping migration of entry ID {entry_id}: decryption failed")
+                continue
+            updates.append((encrypted_password, entry_id))
+
+        c.executemany('UPDATE passwords SET password = ?, version = version + 1 WHERE id = ?', updates)
+        conn.commit()
+        logging.info(f'Migrated {len(updates)} legacy entries to record format v1.')
+        return len(updates)
+    except Exception as e:
+        rollback_db()
+        logging.error('Error migrating legacy entries:', exc_info=True)
+        return 0
+
+def password_index_key(vault_key):
+    # Separate key for the HMAC column so the vault key itself is only ever used for AES-GCM
+    return hmac.new(vault_key, PASSWORD_HMAC_CONTEXT, hashlib.sha256).digest()
+
+def password_hmac(index_key, password):
+    return hmac.new(index_key, password.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def estimate_strength_bits(password):
+    # Length times log2 of the character pool in use; characters past twice the number of
+    # distinct ones add nothing, so 'aaaaaaaaaaaa' scores like 'aa'
+    pool = 0
+    if any(ch.islower() and ch.isascii() for ch in password):
+        pool += 26
+    if any(ch.isupper() and ch.isascii() for ch in password):
+        pool += 26
+    if any(ch.isdigit() and ch.isascii() for ch in password):
+        pool += 10
+    if any(ch.isascii() and not ch.isalnum() for ch in password):
+        pool += 33
+    if any(not ch.isascii() for ch in password):
+        pool += 100
+    if pool == 0:
+        return 0
+    length = min(len(password), 2 * len(set(password)))
+    return int(length * math.log2(pool))
+
+def strength_level(bits):
+    for name, upper in STRENGTH_LEVELS:
+        if bits < upper:
+            return name
+    return 'very_strong'
+
+def seal_strength(vault_key, bits):
+    return STRENGTH_PREFIX + base64.b64encode(_seal(vault_key, bits.to_bytes(4, 'big'), aad=STRENGTH_AAD)).decode()
+
+def open_strength(vault_key, sealed):
+    blob = base64.b64decode(sealed[len(STRENGTH_PREFIX):])
+    return int.from_bytes(_open(vault_key, blob, aad=STRENGTH_AAD), 'big')
+
+def password_columns(vault_key, password):
+    # Values for the password, password_hmac and strength columns; every write of a password
+    # goes through here so the index never drifts from the ciphertext
+    encrypted_password = encrypt(vault_key, password)
+    if encrypted_password is None:
+        raise ValueError('Password encryption failed.')
+    return (encrypted_password, password_hmac(password_index_key(vault_key), password),
+            seal_strength(vault_key, estimate_strength_bits(password)))
+
+def backfill_password_index(master_key):
+    try:
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
+        c = conn.cursor()
+        # Rows written before the index existed, and rows without a sealed score
+        c.execute("SELECT id, password FROM passwords WHERE password_hmac IS NULL OR IFNULL(strength, '') NOT LIKE ?",
+                  (STRENGTH_PREFIX + '%',))
+        rows = c.fetchall()
+        if not rows:
+            return 0
+        index_key = password_index_key(vault_key)
+
+        def index_row(row):
+            plaintext = decrypt_entry(master_key, vault_key, row[1])
+            if plaintext is None:
+                return None
+            return password_hmac(index_key, plaintext), seal_strength(vault_key, estimate_strength_bits(plaintext))
+
+        # One-time pass; the ciphertext is untouched, so version stays as it is
+        updates = []
+        for (entry_id, _), columns in zip(rows, parallel_map(index_row, rows)):
+            if columns is None:
+                logging.warning(f"Skipping password index for entry ID {entry_id}: decryption failed")
+                continue
+            updates.append((*columns, entry_id))
+        # These are index-only writes, but the change feed and sync triggers fire anyway. In the same
+        # transaction, put each row's modified_at back and drop the feed entries, so an upgrade does
+        # not make the next sync ship every row stamped with the upgrade time
+        c.execute('SELECT MAX(seq) FROM changelog')
+        last_seq = c.fetchone()[0] or 0
+        c.execute('SELECT entry_id, modified_at FROM sync_rows WHERE entry_id IS NOT NULL')
+        modified_at = dict(c.fetchall())
+        c.executemany('UPDATE passwords SET password_hmac = ?, strength = ? WHERE id = ?', updates)
+        c.executemany('UPDATE sync_rows SET modified_at = ? WHERE entry_id = ?',
+                      [(modified_at[update[-1]], update[-1]) for update in updates if update[-1] in modified_at])
+        c.execute('DELETE FROM changelog WHERE seq > ?', (last_seq,))
+        conn.commit()
+        logging.info(f'Indexed {len(updates)} existing passwords for auditing.')
+        return len(updates)
+    except Exception as e:
+        rollback_db()
+        logging.error('Error backfilling password index:', exc_info=True)
+        return 0
+
 def generate_totp_secret():
     try:
+        import pyotp
         totp_secret = pyotp.random_base32()
         logging.info('TOTP secret generated successfully.')
         return totp_secret
@@ -154,23 +1185,39 @@ def generate_totp_secret():
         logging.error('Error generating TOTP secret:', exc_info=True)
         return None
 
-def store_totp_secret(master_key, totp_secret):
+def store_totp_secret(master_key, totp_secret, path=None):
     try:
+        path = vault_file(TOTP_SECRET_FILE) if path is None else path
         encrypted_secret = encrypt(master_key, totp_secret)
-        with open(TOTP_SECRET_FILE, 'w') as f:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
             f.write(encrypted_secret)
+        os.replace(tmp_path, path)
         logging.info('TOTP secret encrypted and stored successfully.')
+        return True
     except Exception as e:
         logging.error('Error storing TOTP secret:', exc_info=True)
+        return False
 
 def load_totp_secret(master_key):
     try:
-        if not os.path.exists(TOTP_SECRET_FILE):
+        totp_secret_file = vault_file(TOTP_SECRET_FILE)
+        if not os.path.exists(totp_secret_file):
             logging.warning('TOTP secret file does not exist.')
             return None
-        with open(TOTP_SECRET_FILE, 'r') as f:
+        with open(totp_secret_file, 'r') as f:
             encrypted_secret = f.read()
         totp_secret = decrypt(master_key, encrypted_secret)
+        staged_file = totp_secret_file + TOTP_REKEY_SUFFIX
+        if os.path.exists(staged_file):
+            if totp_secret:
+                os.remove(staged_file)  # Left by a re-key that died before swapping the verifier
+            else:
+                # Left by a re-key that died after swapping the verifier: the staged copy is current
+                with open(staged_file, 'r') as f:
+                    totp_secret = decrypt(master_key, f.read())
+                if totp_secret:
+                    os.replace(staged_file, totp_secret_file)
         if totp_secret:
             logging.info('TOTP secret loaded and decrypted successfully.')
         else:
@@ -180,9 +1227,9 @@ def load_totp_secret(master_key):
         logging.error('Error loading TOTP secret:', exc_info=True)
         return None
 
-def init_db():
+def init_db(master_key=None):
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         c = conn.cursor()
         # Create table if it doesn't exist
         c.execute('''
@@ -192,7 +1239,10 @@ def init_db():
                 username TEXT NOT NULL,
                 password TEXT NOT NULL,
                 notes TEXT,
-                category TEXT
+                category TEXT,
+                version INTEGER NOT NULL DEFAULT 1,
+                password_hmac TEXT,
+                strength TEXT
             )
         ''')
 
@@ -207,83 +1257,1457 @@ def init_db():
             c.execute('ALTER TABLE passwords ADD COLUMN category TEXT')
             logging.info('Added "category" column to "passwords" table.')
 
+        if 'version' not in existing_columns:
+            c.execute('ALTER TABLE passwords ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+            logging.info('Added "version" column to "passwords" table.')
+
+        if 'password_hmac' not in existing_columns:
+            c.execute('ALTER TABLE passwords ADD COLUMN password_hmac TEXT')
+            c.execute('ALTER TABLE passwords ADD COLUMN strength TEXT')
+            logging.info('Added "password_hmac" and "strength" columns to "passwords" table.')
+        elif dict((row[1], row[2]) for row in c.execute('PRAGMA table_info(passwords)'))['strength'].upper() == 'INTEGER':
+            # Scores used to be plaintext integers and are now sealed text. Dropping the column discards
+            # the plaintext ones; the index backfill re-seals every row on the next unlock
+            c.execute('ALTER TABLE passwords DROP COLUMN strength')
+            c.execute('ALTER TABLE passwords ADD COLUMN strength TEXT')
+            logging.info('Recreated "strength" column as TEXT for sealed scores.')
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS vault_keys (
+                id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL,
+                wrapped_key TEXT NOT NULL
+            )
+        ''')
+
+        # Indexes backing keyset pagination on site and category
+        c.execute('CREATE INDEX IF NOT EXISTS idx_passwords_site ON passwords (site COLLATE NOCASE, id)')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_passwords_category ON passwords (IFNULL(category, '') COLLATE NOCASE, id)")
+        # Reuse audit groups on this
+        c.execute('CREATE INDEX IF NOT EXISTS idx_passwords_hmac ON passwords (password_hmac)')
+
         conn.commit()
-        conn.close()
+        init_search_index(c)
+        init_changelog(c)
+        init_history(c)
+        init_sync(c)
         logging.info('Database initialized successfully.')
+
+        if master_key is not None:
+            # One-time re-encryption of v0 rows under the vault key
+            migrate_legacy_entries(master_key)
+            backfill_password_index(master_key)
+            track_existing_rows()
     except Exception as e:
+        rollback_db()
         logging.error('Error initializing database:', exc_info=True)
 
+def init_search_index(c):
+    global search_index_available
+    try:
+        existed = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'passwords_fts'"
+        ).fetchone() is not None
+        # External-content trigram index over the plaintext metadata columns
+        c.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS passwords_fts USING fts5(
+                site, username, category, notes,
+                content='passwords', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+        # Triggers keep the index in sync with every insert, update and delete
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS passwords_fts_insert AFTER INSERT ON passwords BEGIN
+                INSERT INTO passwords_fts (rowid, site, username, category, notes)
+                VALUES (new.id, new.site, new.username, new.category, new.notes);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS passwords_fts_delete AFTER DELETE ON passwords BEGIN
+                INSERT INTO passwords_fts (passwords_fts, rowid, site, username, category, notes)
+                VALUES ('delete', old.id, old.site, old.username, old.category, old.notes);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS passwords_fts_update AFTER UPDATE OF site, username, category, notes ON passwords BEGIN
+                INSERT INTO passwords_fts (passwords_fts, rowid, site, username, category, notes)
+                VALUES ('delete', old.id, old.site, old.username, old.category, old.notes);
+                INSERT INTO passwords_fts (rowid, site, username, category, notes)
+                VALUES (new.id, new.site, new.username, new.category, new.notes);
+            END
+        ''')
+        if not existed:
+            # Index rows written before the search index existed
+            c.execute("INSERT INTO passwords_fts (passwords_fts) VALUES ('rebuild')")
+            logging.info('Search index built.')
+        c.connection.commit()
+        search_index_available = True
+    except sqlite3.OperationalError as e:
+        # SQLite builds without FTS5 or the trigram tokenizer fall back to LIKE scans
+        rollback_db()
+        search_index_available = False
+        logging.warning(f'Full-text search index unavailable, using LIKE search: {e}')
+
+def init_changelog(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS changelog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        )
+    ''')
+    # Triggers record every mutation, including bulk imports, restores and migrations
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS passwords_changelog_insert AFTER INSERT ON passwords BEGIN
+            INSERT INTO changelog (entry_id, op) VALUES (new.id, 'upsert');
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS passwords_changelog_update AFTER UPDATE ON passwords BEGIN
+            INSERT INTO changelog (entry_id, op) VALUES (new.id, 'upsert');
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS passwords_changelog_delete AFTER DELETE ON passwords BEGIN
+            INSERT INTO changelog (entry_id, op) VALUES (old.id, 'delete');
+        END
+    ''')
+    c.execute('DELETE FROM changelog WHERE seq <= (SELECT MAX(seq) FROM changelog) - ?', (CHANGELOG_RETENTION,))
+    c.connection.commit()
+
+def init_history(c):
+    # Kept out of the passwords table so listing and search scans never read old versions
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS password_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id INTEGER NOT NULL,
+            password TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            replaced_at REAL NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_password_history_entry ON password_history (entry_id, id)')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS passwords_history_delete AFTER DELETE ON passwords BEGIN
+            DELETE FROM password_history WHERE entry_id = old.id;
+        END
+    ''')
+    # Apply a lowered retention to entries that have not been updated since
+    c.execute('''
+        DELETE FROM password_history WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY entry_id ORDER BY id DESC) AS rank
+                FROM password_history
+            ) WHERE rank > ?
+        )
+    ''', (max(PASSWORD_HISTORY_RETENTION, 0),))
+    c.connection.commit()
+
+def init_sync(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_rows (
+            uid TEXT PRIMARY KEY,
+            entry_id INTEGER UNIQUE,
+            version INTEGER NOT NULL,
+            modified_at REAL NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            content_hash TEXT
+        )
+    ''')
+    # Triggers track every write, however it reaches the table; content hashes are recomputed
+    # lazily by refresh_sync_hashes. Deleted entries keep their row as a tombstone.
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS passwords_sync_insert AFTER INSERT ON passwords BEGIN
+            INSERT INTO sync_rows (uid, entry_id, version, modified_at)
+            VALUES (lower(hex(randomblob(16))), new.id, new.version, {SQL_UNIX_NOW});
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS passwords_sync_update
+        AFTER UPDATE OF site, username, password, password_hmac, notes, category ON passwords BEGIN
+            UPDATE sync_rows SET version = new.version, modified_at = {SQL_UNIX_NOW}, content_hash = NULL
+            WHERE entry_id = new.id;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS passwords_sync_delete AFTER DELETE ON passwords BEGIN
+            UPDATE sync_rows
+            SET entry_id = NULL, deleted = 1, version = old.version + 1, modified_at = {SQL_UNIX_NOW},
+                content_hash = '{SYNC_TOMBSTONE_HASH}'
+            WHERE entry_id = old.id;
+        END
+    ''')
+    c.connection.commit()
+
+def track_existing_rows():
+    # Entries from before sync existed get a uid derived from their id and content, so replicas
+    # copied from the same database agree on it. modified_at 0 lets any real edit win.
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('''
+            SELECT p.id, p.version, p.site, p.username, p.notes, p.category, p.password_hmac
+            FROM passwords p LEFT JOIN sync_rows s ON s.entry_id = p.id
+            WHERE s.uid IS NULL
+        ''')
+        rows = c.fetchall()
+        if not rows:
+            return 0
+        inserts = []
+        for entry_id, version, *content in rows:
+            content_hash = sync_content_hash(*content)
+            uid = hashlib.sha256(f'{entry_id}:{content_hash}'.encode()).hexdigest()[:32]
+            inserts.append((uid, entry_id, version, content_hash))
+        c.executemany('''
+            INSERT OR IGNORE INTO sync_rows (uid, entry_id, version, modified_at, content_hash)
+            VALUES (?, ?, ?, 0, ?)
+        ''', inserts)
+        conn.commit()
+        logging.info(f'Started sync tracking for {len(inserts)} existing entries.')
+        return len(inserts)
+    except Exception as e:
+        rollback_db()
+        logging.error('Error tracking existing entries for sync:', exc_info=True)
+        return 0
+
+def archive_password(c, entry_id, new_hmac):
+    # Runs inside the caller's update transaction, before the row is overwritten. Rewrites that
+    # keep the same password (same HMAC) are not history.
+    if PASSWORD_HISTORY_RETENTION <= 0:
+        return
+    c.execute('''
+        INSERT INTO password_history (entry_id, password, version, replaced_at)
+        SELECT id, password, version, ? FROM passwords WHERE id = ? AND password_hmac IS NOT ?
+    ''', (time.time(), entry_id, new_hmac))
+    if c.rowcount:
+        c.execute('''
+            DELETE FROM password_history WHERE entry_id = ? AND id NOT IN (
+                SELECT id FROM password_history WHERE entry_id = ? ORDER BY id DESC LIMIT ?
+            )
+        ''', (entry_id, entry_id, PASSWORD_HISTORY_RETENTION))
+
+def get_history(master_key, entry_id):
+    try:
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        c = get_db().cursor()
+        c.execute('''
+            SELECT version, replaced_at, password FROM password_history
+            WHERE entry_id = ? ORDER BY id DESC
+        ''', (entry_id,))
+        history = [{'version': version, 'replaced_at': replaced_at,
+                    'password': decrypt_entry(master_key, vault_key, password)}
+                   for version, replaced_at, password in c.fetchall()]
+        logging.info(f'Loaded {len(history)} history versions for entry ID "{entry_id}".')
+        return history
+    except Exception as e:
+        logging.error('Error loading password history:', exc_info=True)
+        return None
+
+def current_change_seq(c):
+    c.execute('SELECT IFNULL(MAX(seq), 0) FROM changelog')
+    return c.fetchone()[0]
+
+def get_changes_since(since_seq):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        seq = current_change_seq(c)
+        c.execute('SELECT MIN(seq) FROM changelog')
+        oldest = c.fetchone()[0]
+        if since_seq is None or (oldest is not None and since_seq < oldest - 1) or since_seq > seq:
+            # The requested point is no longer covered by the changelog
+            logging.info('Change feed reset requested.')
+            return {'seq': seq, 'reset': True, 'changes': []}
+
+        # One change per entry, reflecting its current state; metadata only, like list_entries
+        c.execute('''
+            SELECT ch.entry_id, p.site, p.username, p.notes, p.category
+            FROM (
+                SELECT entry_id, MAX(seq) AS seq FROM changelog
+                WHERE seq > ? AND seq <= ?
+                GROUP BY entry_id
+            ) AS ch
+            LEFT JOIN passwords AS p ON p.id = ch.entry_id
+            ORDER BY ch.seq
+        ''', (since_seq, seq))
+        changes = []
+        for row in c.fetchall():
+            if row[1] is None:
+                changes.append({'op': 'delete', 'id': row[0]})
+            else:
+                changes.append({
+                    'op': 'upsert',
+                    'id': row[0],
+                    'site': row[1],
+                    'username': row[2],
+                    'notes': row[3],
+                    'category': row[4],
+                })
+        logging.info(f'Change feed returned {len(changes)} changes.')
+        return {'seq': seq, 'reset': False, 'changes': changes}
+    except Exception as e:
+        logging.error('Error reading change feed:', exc_info=True)
+        return None
+
+def search_entries(query, limit=SEARCH_DEFAULT_LIMIT):
+    try:
+        query = (query or '').strip()
+        if not query:
+            return []
+        conn = get_db()
+        c = conn.cursor()
+        with span('db_query'):
+            if search_index_available and len(query) >= 3:
+                # Quote the query as one phrase so FTS5 operators in user input are literal
+                phrase = '"' + query.replace('"', '""') + '"'
+                c.execute(f'''
+                    SELECT rowid FROM passwords_fts
+                    WHERE passwords_fts MATCH ?
+                    ORDER BY bm25(passwords_fts, {", ".join(str(w) for w in SEARCH_WEIGHTS)})
+                    LIMIT ?
+                ''', (phrase, int(limit)))
+            else:
+                # Trigrams need at least three characters; shorter queries scan with LIKE
+                pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                c.execute('''
+                    SELECT id FROM passwords
+                    WHERE site LIKE :p ESCAPE '\\' OR username LIKE :p ESCAPE '\\'
+                       OR category LIKE :p ESCAPE '\\' OR notes LIKE :p ESCAPE '\\'
+                    ORDER BY (site LIKE :p ESCAPE '\\') DESC, site COLLATE NOCASE, id
+                    LIMIT :limit
+                ''', {'p': pattern, 'limit': int(limit)})
+            ids = [row[0] for row in c.fetchall()]
+        logging.info(f'Search returned {len(ids)} results.')
+        return ids
+    except Exception as e:
+        logging.error('Error searching entries:', exc_info=True)
+        return []
+
+def federated_search(query, limit=SEARCH_DEFAULT_LIMIT):
+    # Searches the default vault and every open named vault side by side on the worker pool,
+    # then interleaves the ranked lists so each vault's best matches come first
+    with _vaults_lock:
+        vaults = [None] + list(_vaults.values())
+
+    def search_vault(vault):
+        with use_vault(vault):
+            ids = search_entries(query, limit)
+            if not ids:
+                return []
+            c = get_db().cursor()
+            c.execute(f"SELECT id, site, username, category FROM passwords WHERE id IN ({', '.join('?' * len(ids))})",
+                      ids)
+            rows = {row[0]: row for row in c.fetchall()}
+            name = DEFAULT_VAULT if vault is None else vault['name']
+            return [{'vault': name, 'id': entry_id, 'site': rows[entry_id][1], 'username': rows[entry_id][2],
+                     'category': rows[entry_id][3]} for entry_id in ids if entry_id in rows]
+
+    per_vault = list(get_decrypt_pool().map(search_vault, vaults))
+    merged = []
+    for rank in range(max(len(results) for results in per_vault)):
+        merged.extend(results[rank] for results in per_vault if rank < len(results))
+    return merged[:int(limit)]
+
 def add_password(master_key, site, username, password, notes='', category=''):
     try:
-        encrypted_password = encrypt(master_key, password)
-        if encrypted_password is None:
-            raise ValueError('Password encryption failed.')
-        conn = sqlite3.connect(DB_FILE)
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
         c = conn.cursor()
-        c.execute('INSERT INTO passwords (site, username, password, notes, category) VALUES (?, ?, ?, ?, ?)',
-                  (site, username, encrypted_password, notes, category))
+        c.execute('INSERT INTO passwords (site, username, password, password_hmac, strength, notes, category) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (site, username, *password_columns(vault_key, password), notes, category))
         conn.commit()
-        conn.close()
         logging.info(f'Password for site "{site}" added successfully.')
     except Exception as e:
+        rollback_db()
         logging.error('Error adding password:', exc_info=True)
 
 def update_password(master_key, entry_id, site, username, password, notes, category):
     try:
-        encrypted_password = encrypt(master_key, password)
-        if encrypted_password is None:
-            raise ValueError('Password encryption failed.')
-        conn = sqlite3.connect(DB_FILE)
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        encrypted_password, digest, strength = password_columns(vault_key, password)
+        conn = get_db()
         c = conn.cursor()
+        archive_password(c, entry_id, digest)
         c.execute('''
             UPDATE passwords
-            SET site = ?, username = ?, password = ?, notes = ?, category = ?
+            SET site = ?, username = ?, password = ?, password_hmac = ?, strength = ?, notes = ?, category = ?,
+                version = version + 1
             WHERE id = ?
-        ''', (site, username, encrypted_password, notes, category, entry_id))
+        ''', (site, username, encrypted_password, digest, strength, notes, category, entry_id))
         conn.commit()
-        conn.close()
+        cache_invalidate(entry_id)
         logging.info(f'Password for entry ID "{entry_id}" updated successfully.')
     except Exception as e:
+        rollback_db()
         logging.error('Error updating password:', exc_info=True)
 
 def delete_password(entry_id):
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         c = conn.cursor()
         c.execute('DELETE FROM passwords WHERE id = ?', (entry_id,))
         conn.commit()
-        conn.close()
+        cache_invalidate(entry_id)
         logging.info(f'Password for entry ID "{entry_id}" deleted successfully.')
     except Exception as e:
+        rollback_db()
         logging.error('Error deleting password:', exc_info=True)
 
-def get_passwords(master_key):
+class BatchError(ValueError):
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+def _apply_operation(c, vault_key, index, op):
+    kind = op.get('op') if isinstance(op, dict) else None
+    if kind == 'add':
+        if not op.get('site') or not op.get('username') or op.get('password') is None:
+            raise BatchError(index, 'add requires site, username and password')
+        c.execute('INSERT INTO passwords (site, username, password, password_hmac, strength, notes, category) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (op['site'], op['username'], *password_columns(vault_key(), op['password']),
+                   op.get('notes', ''), op.get('category', '')))
+        return {'op': 'add', 'id': c.lastrowid}
+    if kind == 'update':
+        fields = [field for field in BATCH_UPDATE_FIELDS if field in op]
+        if op.get('id') is None or not fields:
+            raise BatchError(index, 'update requires an id and at least one field')
+        columns, values = [], []
+        for field in fields:
+            if field == 'password':
+                password_values = password_columns(vault_key(), op['password'])
+                archive_password(c, op['id'], password_values[1])
+                columns.extend(('password', 'password_hmac', 'strength'))
+                values.extend(password_values)
+            else:
+                columns.append(field)
+                values.append(op[field])
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        c.execute(f'UPDATE passwords SET {assignments}, version = version + 1 WHERE id = ?', (*values, op['id']))
+        if c.rowcount == 0:
+            raise BatchError(index, f"No entry with id {op['id']}")
+        return {'op': 'update', 'id': op['id']}
+    if kind == 'delete':
+        if op.get('id') is None:
+            raise BatchError(index, 'delete requires an id')
+        c.execute('DELETE FROM passwords WHERE id = ?', (op['id'],))
+        if c.rowcount == 0:
+            raise BatchError(index, f"No entry with id {op['id']}")
+        return {'op': 'delete', 'id': op['id']}
+    raise BatchError(index, f'Unknown operation: {kind}')
+
+def apply_batch(master_key, operations):
+    # Every operation lands in one transaction: all of them apply or none do
+    if not isinstance(operations, list) or len(operations) > BATCH_MAX_OPERATIONS:
+        return {'error': f'operations must be a list of at most {BATCH_MAX_OPERATIONS} items'}
+    vault_key_cache = []
+
+    def vault_key():
+        # Only adds and password updates need the vault key
+        if not vault_key_cache:
+            key = get_vault_key(master_key)
+            if key is None:
+                raise ValueError('Vault key unavailable.')
+            vault_key_cache.append(key)
+        return vault_key_cache[0]
+
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         c = conn.cursor()
-        c.execute('SELECT id, site, username, password, notes, category FROM passwords')
+        results = [_apply_operation(c, vault_key, index, op) for index, op in enumerate(operations)]
+        conn.commit()
+        for result in results:
+            if result['op'] != 'add':
+                cache_invalidate(result['id'])
+        logging.info(f'Applied batch of {len(results)} operations.')
+        return {'applied': len(results), 'results': results}
+    except BatchError as e:
+        rollback_db()
+        logging.warning(f'Batch rejected at operation {e.index}: {e}')
+        return {'error': str(e), 'index': e.index}
+    except Exception as e:
+        rollback_db()
+        logging.error('Error applying batch:', exc_info=True)
+        return {'error': 'Failed to apply batch'}
+
+def _update_category(category, statement, params):
+    # One set-based statement in one transaction: triggers write the changelog and sync rows, and
+    # there is no per-entry operation list to outgrow BATCH_MAX_OPERATIONS
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT id FROM passwords WHERE IFNULL(category, '') = ?", (category,))
+        ids = [row[0] for row in c.fetchall()]
+        c.execute(statement, (*params, category))
+        applied = c.rowcount
+        conn.commit()
+        for entry_id in ids:
+            cache_invalidate(entry_id)
+        return {'applied': applied}
+    except Exception as e:
+        rollback_db()
+        logging.error('Error updating category:', exc_info=True)
+        return {'error': 'Failed to update category'}
+
+def rename_category(master_key, old_category, new_category):
+    # '' names the uncategorized entries; a missing category is an error, never a match-all
+    if not isinstance(old_category, str) or not isinstance(new_category, str):
+        return {'error': 'old_category and new_category must be strings'}
+    result = _update_category(
+        old_category,
+        "UPDATE passwords SET category = ?, version = version + 1 WHERE IFNULL(category, '') = ?",
+        (new_category,))
+    if 'error' not in result:
+        logging.info(f'Renamed category on {result["applied"]} entries.')
+    return result
+
+def delete_category(master_key, category):
+    if not isinstance(category, str):
+        return {'error': 'category must be a string'}
+    result = _update_category(category, "DELETE FROM passwords WHERE IFNULL(category, '') = ?", ())
+    if 'error' not in result:
+        logging.info(f'Deleted {result["applied"]} entries in category.')
+    return result
+
+def is_page_cursor(cursor, order_by='id'):
+    # None for the first page, otherwise the next_cursor a previous page returned
+    if cursor is None:
+        return True
+    if not isinstance(cursor, dict) or not isinstance(cursor.get('after_id'), int) or isinstance(cursor['after_id'], bool):
+        return False
+    if ORDER_BY_COLUMNS.get(order_by) is None:
+        return True
+    return isinstance(cursor.get('after_key'), str)
+
+def select_page(c, columns, limit=None, cursor=None, order_by='id'):
+    if order_by not in ORDER_BY_COLUMNS:
+        raise ValueError(f'Unsupported order_by: {order_by}')
+    sort_expr = ORDER_BY_COLUMNS[order_by]
+    # The sort key and id of each row are selected too, so the next cursor carries the values themselves
+    query = f'SELECT {columns}, {sort_expr or "id"}, id FROM passwords'
+    params = []
+    if cursor is not None:
+        if sort_expr is None:
+            query += ' WHERE id > ?'
+            params.append(cursor['after_id'])
+        else:
+            # Keyset paging against literals, so a cursor row deleted between pages does not end paging
+            query += f' WHERE ({sort_expr}, id) > (?, ?)'
+            params.extend([cursor['after_key'], cursor['after_id']])
+    query += ' ORDER BY id' if sort_expr is None else f' ORDER BY {sort_expr}, id'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    with span('db_query'):
+        c.execute(query, params)
         rows = c.fetchall()
-        conn.close()
+    # The cursor follows the last row scanned, whatever the caller makes of it
+    next_cursor = None
+    if limit is not None and len(rows) == int(limit):
+        next_cursor = {'after_key': rows[-1][-2], 'after_id': rows[-1][-1]}
+    return [row[:-2] for row in rows], next_cursor
+
+def get_passwords_page(master_key, limit=None, cursor=None, order_by='id'):
+    try:
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
+        c = conn.cursor()
+        rows, next_cursor = select_page(c, 'id, site, username, password, notes, category, version', limit, cursor, order_by)
 
         result = []
-        for row in rows:
-            decrypted_password = decrypt(master_key, row[3])
+        with span('decrypt'):
+            plaintexts = decrypt_rows_cached(master_key, vault_key, [(row[0], row[6], row[3]) for row in rows])
+            for row, decrypted_password in zip(rows, plaintexts):
+                if decrypted_password is not None:
+                    result.append({
+                        'id': row[0],
+                        'site': row[1],
+                        'username': row[2],
+                        'password': decrypted_password,
+                        'notes': row[4],
+                        'category': row[5],
+                    })
+                else:
+                    logging.warning(f"Failed to decrypt password for entry ID {row[0]}")
+        logging.info(f'Retrieved {len(result)} passwords successfully.')
+        return result, next_cursor
+    except Exception as e:
+        logging.error('Error retrieving passwords:', exc_info=True)
+        return [], None
+
+def get_passwords(master_key, limit=None, cursor=None, order_by='id'):
+    passwords, _ = get_passwords_page(master_key, limit, cursor, order_by)
+    return passwords
+
+def normalize_import_entry(raw):
+    entry = {}
+    lowered = {str(k).strip().lower(): v for k, v in raw.items() if k is not None}
+    for field, aliases in IMPORT_FIELD_ALIASES.items():
+        entry[field] = next((lowered[a] for a in aliases if lowered.get(a)), '')
+    if not (entry['site'] and entry['username'] and entry['password']):
+        return None
+    return entry
+
+def iter_import_file(path):
+    # CSV and JSON Lines are streamed row by row; a JSON array has to be parsed whole
+    lower_path = path.lower()
+    if lower_path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+    elif lower_path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif lower_path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+    else:
+        raise ValueError(f'Unsupported import file type: {path}')
+
+def import_entries(master_key, entries, progress_callback=None):
+    try:
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
+        c = conn.cursor()
+        imported = 0
+        skipped = 0
+        batch = []
+
+        def flush():
+            nonlocal imported
+            c.executemany('INSERT INTO passwords (site, username, password, password_hmac, strength, notes, category) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          batch)
+            imported += len(batch)
+            batch.clear()
+            if progress_callback is not None:
+                progress_callback(imported, skipped)
+
+        # All batches share one transaction: the import lands completely or not at all
+        for raw in entries:
+            entry = normalize_import_entry(raw) if isinstance(raw, dict) else None
+            if entry is None:
+                skipped += 1
+                continue
+            batch.append((entry['site'], entry['username'], *password_columns(vault_key, entry['password']),
+                          entry['notes'], entry['category']))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        conn.commit()
+        logging.info(f'Imported {imported} entries ({skipped} skipped).')
+        return {'imported': imported, 'skipped': skipped}
+    except Exception as e:
+        rollback_db()
+        logging.error('Error importing entries:', exc_info=True)
+        return None
+
+def _frame_aad(index, final):
+    # Binding the position and end marker to each frame detects reordering and truncation
+    return struct.pack('>QB', index, 1 if final else 0)
+
+def _write_frame(f, payload):
+    f.write(struct.pack('>I', len(payload)))
+    f.write(payload)
+
+def _read_frame(f):
+    prefix = f.read(4)
+    if len(prefix) < 4:
+        return None
+    (length,) = struct.unpack('>I', prefix)
+    if length > BACKUP_MAX_FRAME_SIZE:
+        raise ValueError('Backup frame exceeds maximum size.')
+    payload = f.read(length)
+    if len(payload) < length:
+        raise ValueError('Backup file is truncated.')
+    return payload
+
+def export_vault(master_key, path):
+    tmp_path = None
+    try:
+        if not isinstance(path, str) or not path:
+            raise ValueError('Backup path must be a non-empty string.')
+        tmp_path = path + '.tmp'
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        # A fresh key per backup, wrapped with the master key. The header also carries the KDF
+        # header and a key check, so the master password alone re-derives the wrapping key on
+        # restore, even after re-keying or on a fresh install.
+        export_key = os.urandom(32)
+        header = json.dumps({
+            'version': BACKUP_VERSION,
+            'frame_rows': BACKUP_FRAME_ROWS,
+            'kdf': load_kdf_header(),
+            'key_check': base64.b64encode(_seal(master_key, KEY_CHECK_VALUE, aad=KEY_CHECK_AAD)).decode(),
+            'wrapped_key': base64.b64encode(_seal(master_key, export_key, aad=BACKUP_KEY_AAD)).decode(),
+        }).encode()
+
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT id, site, username, password, notes, category FROM passwords ORDER BY id')
+        exported = 0
+        index = 0
+        with open(tmp_path, 'wb') as f:
+            os.chmod(tmp_path, stat.S_IRUSR | stat.S_IWUSR)
+            f.write(BACKUP_MAGIC)
+            _write_frame(f, header)
+            while True:
+                # fetchmany keeps only one frame of rows in memory at a time
+                rows = c.fetchmany(BACKUP_FRAME_ROWS)
+                if not rows:
+                    break
+                entries = []
+                for row in rows:
+                    decrypted_password = decrypt_entry(master_key, vault_key, row[3])
+                    if decrypted_password is None:
+                        raise ValueError(f'Failed to decrypt entry ID {row[0]} for export.')
+                    entries.append({
+                        'site': row[1],
+                        'username': row[2],
+                        'password': decrypted_password,
+                        'notes': row[4],
+                        'category': row[5],
+                    })
+                _write_frame(f, _seal(export_key, json.dumps(entries).encode(), aad=_frame_aad(index, False)))
+                exported += len(entries)
+                index += 1
+            _write_frame(f, _seal(export_key, b'[]', aad=_frame_aad(index, True)))
+        os.replace(tmp_path, path)
+        logging.info(f'Exported {exported} entries in {index} frames.')
+        return {'entries': exported, 'frames': index}
+    except Exception as e:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        logging.error('Error exporting vault:', exc_info=True)
+        return None
+
+def backup_wrapping_key(master_key, header, password=None):
+    # Version 1 headers hold only the wrapped key, so they open with the key that wrote them
+    if header.get('version') == 1:
+        return master_key
+    if check_key(master_key, header['key_check']):
+        return master_key  # Same master key as at export: no extra KDF pass
+    if password is None:
+        raise ValueError('Backup was written under a different master key; its master password is required.')
+    backup_key = get_master_key(password, header['kdf'])
+    if backup_key is None or not check_key(backup_key, header['key_check']):
+        raise ValueError('Incorrect master password for this backup.')
+    return backup_key
+
+def restore_vault(master_key, path, replace=False, progress_callback=None, password=None):
+    try:
+        if not isinstance(path, str) or not path:
+            raise ValueError('Backup path must be a non-empty string.')
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
+        c = conn.cursor()
+        restored = 0
+        with open(path, 'rb') as f:
+            if f.read(len(BACKUP_MAGIC)) != BACKUP_MAGIC:
+                raise ValueError('Not a vault backup file.')
+            header_frame = _read_frame(f)
+            if header_frame is None:
+                raise ValueError('Backup file is truncated.')
+            header = json.loads(header_frame)
+            if header.get('version') not in (1, BACKUP_VERSION):
+                raise ValueError(f"Unsupported backup version: {header.get('version')}")
+            wrapping_key = backup_wrapping_key(master_key, header, password)
+            export_key = _open(wrapping_key, base64.b64decode(header['wrapped_key']), aad=BACKUP_KEY_AAD)
+
+            if replace:
+                c.execute('DELETE FROM passwords')
+                clear_entry_cache()
+            index = 0
+            while True:
+                frame = _read_frame(f)
+                if frame is None:
+                    raise ValueError('Backup file is truncated.')
+                try:
+                    entries = json.loads(_open(export_key, frame, aad=_frame_aad(index, False)))
+                except ValueError:
+                    # Only the closing frame authenticates with the final flag set
+                    _open(export_key, frame, aad=_frame_aad(index, True))
+                    # The final marker must also be the end of the file
+                    if f.read(1):
+                        raise ValueError('Backup file has data after the final frame.')
+                    break
+                c.executemany('INSERT INTO passwords (site, username, password, password_hmac, strength, notes, category) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              [(e['site'], e['username'], *password_columns(vault_key, e['password']),
+                                e['notes'], e['category'])
+                               for e in entries])
+                restored += len(entries)
+                index += 1
+                if progress_callback is not None:
+                    progress_callback(restored)
+        # Nothing is committed until every frame, including the final marker, has verified
+        conn.commit()
+        logging.info(f'Restored {restored} entries from backup.')
+        return {'entries': restored, 'frames': index}
+    except Exception as e:
+        rollback_db()
+        logging.error('Error restoring vault:', exc_info=True)
+        return None
+
+def list_entries_page(limit=None, cursor=None, order_by='id'):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        # Metadata only; the password column is never read or decrypted here
+        rows, next_cursor = select_page(c, 'id, site, username, notes, category', limit, cursor, order_by)
+
+        result = [
+            {
+                'id': row[0],
+                'site': row[1],
+                'username': row[2],
+                'notes': row[3],
+                'category': row[4],
+            }
+            for row in rows
+        ]
+        logging.info('Listed entry metadata successfully.')
+        return result, next_cursor
+    except Exception as e:
+        logging.error('Error listing entries:', exc_info=True)
+        return [], None
+
+def list_entries(limit=None, cursor=None, order_by='id'):
+    entries, _ = list_entries_page(limit, cursor, order_by)
+    return entries
+
+def reveal_password(master_key, entry_id):
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT id, version, password FROM passwords WHERE id = ?', (entry_id,))
+        row = c.fetchone()
+        if row is None:
+            logging.warning(f"Reveal requested for missing entry ID {entry_id}")
+            return None
+
+        decrypted_password = cache_get(row[0], row[1])
+        if decrypted_password is None:
+            if is_legacy_record(row[2]):
+                vault_key = None
+            else:
+                vault_key = get_vault_key(master_key)
+                if vault_key is None:
+                    raise ValueError('Vault key unavailable.')
+            with span('decrypt'):
+                decrypted_password = decrypt_entry(master_key, vault_key, row[2])
             if decrypted_password is not None:
-                result.append({
-                    'id': row[0],
-                    'site': row[1],
-                    'username': row[2],
-                    'password': decrypted_password,
-                    'notes': row[4],
-                    'category': row[5],
-                })
+                cache_put(row[0], row[1], decrypted_password)
+        if decrypted_password is None:
+            logging.warning(f"Failed to decrypt password for entry ID {entry_id}")
+        else:
+            logging.info(f'Password for entry ID "{entry_id}" revealed.')
+        return decrypted_password
+    except Exception as e:
+        logging.error('Error revealing password:', exc_info=True)
+        return None
+
+def _parse_breach_line(line):
+    # Dump lines are "<40 hex SHA-1>:<count>"; anything else is skipped. Records are kept packed:
+    # the digest leads and the count is big-endian, so byte order is digest order.
+    digest_hex, _, count = line.strip().partition(b':')
+    if len(digest_hex) != 40:
+        return None
+    try:
+        # A count outside 0..2**32-1 does not fit the record, so the line counts as malformed
+        return BREACH_RECORD.pack(bytes.fromhex(digest_hex.decode('ascii')), int(count or 1))
+    except (ValueError, struct.error):
+        return None
+
+def _write_breach_run(records, directory):
+    records.sort()
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.run')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b''.join(records))
+    return path
+
+def _iter_breach_run(path):
+    size = BREACH_RECORD.size
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(size * 65536)
+            if not block:
+                return
+            for offset in range(0, len(block), size):
+                yield block[offset:offset + size]
+
+def build_breach_index(source, progress_callback=None):
+    try:
+        # External merge sort: sorted runs of BREACH_SORT_CHUNK_RECORDS on disk, then one k-way
+        # merge into the index, so the dump never has to fit in memory
+        index_dir = os.path.dirname(os.path.abspath(BREACH_INDEX_FILE))
+        tmp_path = BREACH_INDEX_FILE + '.tmp'
+        parsed = 0
+        malformed = 0
+        with tempfile.TemporaryDirectory(dir=index_dir) as run_dir:
+            runs = []
+            chunk = []
+            with open(source, 'rb') as f:
+                for line in f:
+                    record = _parse_breach_line(line)
+                    if record is None:
+                        malformed += 1
+                        continue
+                    chunk.append(record)
+                    if len(chunk) >= BREACH_SORT_CHUNK_RECORDS:
+                        runs.append(_write_breach_run(chunk, run_dir))
+                        parsed += len(chunk)
+                        chunk = []
+                        if progress_callback is not None:
+                            progress_callback(parsed)
+            if chunk:
+                runs.append(_write_breach_run(chunk, run_dir))
+                parsed += len(chunk)
+
+            records = 0
+            last_digest = None
+            with open(tmp_path, 'wb') as out:
+                out.write(BREACH_INDEX_MAGIC + BREACH_HEADER.pack(0))
+                for record in heapq.merge(*(_iter_breach_run(path) for path in runs)):
+                    if record[:20] == last_digest:
+                        continue
+                    out.write(record)
+                    last_digest = record[:20]
+                    records += 1
+                out.seek(len(BREACH_INDEX_MAGIC))
+                out.write(BREACH_HEADER.pack(records))
+        os.replace(tmp_path, BREACH_INDEX_FILE)
+        logging.info(f'Breach index built: {records} hashes from {parsed} dump lines ({malformed} malformed).')
+        return {'records': records, 'malformed': malformed}
+    except Exception as e:
+        if os.path.exists(BREACH_INDEX_FILE + '.tmp'):
+            os.remove(BREACH_INDEX_FILE + '.tmp')
+        logging.error('Error building breach index:', exc_info=True)
+        return None
+
+def open_breach_index():
+    # Maps the index read-only; lookups page in only the records the binary search touches
+    with open(BREACH_INDEX_FILE, 'rb') as f:
+        index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_size = len(BREACH_INDEX_MAGIC) + BREACH_HEADER.size
+    if index[:len(BREACH_INDEX_MAGIC)] != BREACH_INDEX_MAGIC:
+        index.close()
+        raise ValueError('Not a breach index file.')
+    (records,) = BREACH_HEADER.unpack_from(index, len(BREACH_INDEX_MAGIC))
+    if len(index) != header_size + records * BREACH_RECORD.size:
+        index.close()
+        raise ValueError('Breach index is truncated.')
+    return index, records
+
+def lookup_breach_count(index, records, digest):
+    header_size = len(BREACH_INDEX_MAGIC) + BREACH_HEADER.size
+    lo, hi = 0, records
+    while lo < hi:
+        mid = (lo + hi) // 2
+        offset = header_size + mid * BREACH_RECORD.size
+        if index[offset:offset + 20] < digest:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < records:
+        found, count = BREACH_RECORD.unpack_from(index, header_size + lo * BREACH_RECORD.size)
+        if found == digest:
+            return count
+    return 0
+
+def audit_breaches(master_key, source=None, progress_callback=None):
+    try:
+        if source and (not os.path.exists(BREACH_INDEX_FILE)
+                       or os.path.getmtime(source) > os.path.getmtime(BREACH_INDEX_FILE)):
+            # Build once per downloaded dump; later audits reuse the index
+            if build_breach_index(source) is None:
+                return {'error': 'Failed to build breach index'}
+        if not os.path.exists(BREACH_INDEX_FILE):
+            return {'error': 'Breach index not built; pass the downloaded dump as source'}
+
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        index, records = open_breach_index()
+        try:
+            conn = get_db()
+            c = conn.cursor()
+            audited = 0
+            breached = []
+            cursor = None
+            while True:
+                rows, cursor = select_page(c, 'id, site, username, password, version', BREACH_AUDIT_PAGE_ROWS, cursor)
+                if not rows:
+                    break
+                plaintexts = decrypt_rows_cached(master_key, vault_key, [(row[0], row[4], row[3]) for row in rows])
+                page = []
+                for row, plaintext in zip(rows, plaintexts):
+                    if plaintext is None:
+                        continue
+                    count = lookup_breach_count(index, records, hashlib.sha1(plaintext.encode('utf-8')).digest())
+                    if count:
+                        page.append({'id': row[0], 'site': row[1], 'username': row[2], 'count': count})
+                audited += len(rows)
+                breached.extend(page)
+                if progress_callback is not None:
+                    progress_callback(audited, page)
+                if cursor is None:
+                    break
+        finally:
+            index.close()
+        logging.info(f'Breach audit: {len(breached)} of {audited} entries found in the corpus.')
+        return {'audited': audited, 'breached': breached}
+    except Exception as e:
+        logging.error('Error auditing breaches:', exc_info=True)
+        return {'error': 'Failed to audit breaches'}
+
+def audit_vault(master_key, weak_bits=WEAK_PASSWORD_BITS):
+    try:
+        vault_key = get_vault_key(master_key)
+        if vault_key is None:
+            raise ValueError('Vault key unavailable.')
+        conn = get_db()
+        c = conn.cursor()
+        # Reuse groups come straight off the HMAC index: equal digests mean equal passwords
+        c.execute('''
+            SELECT id, site, username, password_hmac FROM passwords
+            WHERE password_hmac IN (
+                SELECT password_hmac FROM passwords
+                WHERE password_hmac IS NOT NULL
+                GROUP BY password_hmac HAVING COUNT(*) > 1
+            )
+            ORDER BY password_hmac, id
+        ''')
+        groups = {}
+        for entry_id, site, username, digest in c.fetchall():
+            groups.setdefault(digest, []).append({'id': entry_id, 'site': site, 'username': username})
+        reused = sorted(({'count': len(entries), 'entries': entries} for entries in groups.values()),
+                        key=lambda group: (-group['count'], group['entries'][0]['id']))
+
+        # Scores are sealed, so each is opened here: one AES-GCM pass over four bytes per row.
+        # Rows the backfill could not decrypt, or has not migrated yet, count as unindexed
+        c.execute('''
+            SELECT id, site, username, strength FROM passwords
+            WHERE password_hmac IS NOT NULL AND strength LIKE ? ORDER BY id
+        ''', (STRENGTH_PREFIX + '%',))
+        levels = {name: 0 for name, _ in STRENGTH_LEVELS}
+        levels['very_strong'] = 0
+        weak = []
+        audited = 0
+        for entry_id, site, username, sealed in c.fetchall():
+            bits = open_strength(vault_key, sealed)
+            levels[strength_level(bits)] += 1
+            audited += 1
+            if bits < int(weak_bits):
+                weak.append({'id': entry_id, 'site': site, 'username': username, 'strength_bits': bits,
+                             'level': strength_level(bits)})
+        weak.sort(key=lambda entry: (entry['strength_bits'], entry['id']))
+        c.execute("SELECT COUNT(*) FROM passwords WHERE password_hmac IS NULL OR IFNULL(strength, '') NOT LIKE ?",
+                  (STRENGTH_PREFIX + '%',))
+        unindexed = c.fetchone()[0]
+        logging.info(f'Vault audit: {len(reused)} reuse groups, {len(weak)} weak of {audited} entries.')
+        return {'audited': audited, 'unindexed': unindexed, 'reused': reused, 'weak': weak, 'strength': levels}
+    except Exception as e:
+        logging.error('Error auditing vault:', exc_info=True)
+        return {'error': 'Failed to audit vault'}
+
+def sync_content_hash(site, username, notes, category, password_hmac):
+    # Same on every replica of a vault: metadata is stored in the clear and the password HMAC is
+    # keyed by the shared vault key. Ciphertexts differ per write, so they are left out.
+    content = json.dumps([site, username, notes, category, password_hmac]).encode('utf-8')
+    return hashlib.sha256(content).hexdigest()[:SYNC_HASH_HEX]
+
+def refresh_sync_hashes(c):
+    c.execute('''
+        SELECT s.uid, p.site, p.username, p.notes, p.category, p.password_hmac
+        FROM sync_rows s JOIN passwords p ON p.id = s.entry_id
+        WHERE s.content_hash IS NULL
+    ''')
+    updates = [(sync_content_hash(*row[1:]), row[0]) for row in c.fetchall()]
+    if updates:
+        c.executemany('UPDATE sync_rows SET content_hash = ? WHERE uid = ?', updates)
+        c.connection.commit()
+    return len(updates)
+
+def merkle_tree(c):
+    # Leaves hash the (uid, content hash) pairs under each SYNC_TREE_DEPTH-character uid prefix and
+    # each parent hashes its children; the root is ''. Empty subtrees are simply absent.
+    level = {}
+    c.execute('SELECT uid, content_hash FROM sync_rows ORDER BY uid')
+    for uid, content_hash in c.fetchall():
+        level.setdefault(uid[:SYNC_TREE_DEPTH], hashlib.sha256()).update(f'{uid}:{content_hash}\n'.encode())
+    tree = {}
+    for depth in range(SYNC_TREE_DEPTH, -1, -1):
+        hashes = {prefix: digest.hexdigest()[:SYNC_HASH_HEX] for prefix, digest in level.items()}
+        tree.update(hashes)
+        level = {}
+        if depth:
+            for prefix in sorted(hashes):
+                level.setdefault(prefix[:depth - 1], hashlib.sha256()).update(f'{prefix}:{hashes[prefix]}\n'.encode())
+    return tree
+
+def sync_summaries(c, prefixes):
+    # uid -> [version, modified_at, deleted, content_hash] for every row under the given leaves
+    summaries = {}
+    for prefix in prefixes:
+        # Uids are lowercase hex, so every one starting with prefix sorts below prefix + 'g'
+        c.execute('''
+            SELECT uid, version, modified_at, deleted, content_hash FROM sync_rows
+            WHERE uid >= ? AND uid < ?
+        ''', (prefix, prefix + 'g'))
+        summaries.update((row[0], list(row[1:])) for row in c.fetchall())
+    return summaries
+
+def _sync_newer(candidate, current):
+    # Last writer wins; version and then content hash break ties identically on both replicas
+    return current is None or (candidate[1], candidate[0], candidate[3]) > (current[1], current[0], current[3])
+
+def export_sync_rows(c, uids):
+    rows = []
+    for start in range(0, len(uids), SYNC_BATCH_ROWS):
+        batch = uids[start:start + SYNC_BATCH_ROWS]
+        c.execute(f'''
+            SELECT s.uid, s.version, s.modified_at, s.deleted, s.content_hash,
+                   p.site, p.username, p.password, p.password_hmac, p.strength, p.notes, p.category
+            FROM sync_rows s LEFT JOIN passwords p ON p.id = s.entry_id
+            WHERE s.uid IN ({', '.join('?' * len(batch))})
+        ''', batch)
+        columns = [column[0] for column in c.description]
+        rows.extend(dict(zip(columns, row)) for row in c.fetchall())
+    return rows
+
+def _apply_sync_row(c, row):
+    # Returns (applied, local entry id or None); the caller owns the transaction
+    c.execute('SELECT entry_id, version, modified_at, deleted, content_hash FROM sync_rows WHERE uid = ?',
+              (row['uid'],))
+    local = c.fetchone()
+    remote = (row['version'], row['modified_at'], row['deleted'], row['content_hash'])
+    if local is not None and not _sync_newer(remote, local[1:]):
+        return False, None
+    entry_id = local[0] if local is not None else None
+
+    if row['deleted']:
+        if entry_id is not None:
+            c.execute('DELETE FROM passwords WHERE id = ?', (entry_id,))  # the trigger leaves a tombstone
+        elif local is None:
+            c.execute('INSERT INTO sync_rows (uid, version, modified_at, deleted) VALUES (?, ?, ?, 1)',
+                      (row['uid'], row['version'], row['modified_at']))
+        c.execute('UPDATE sync_rows SET version = ?, modified_at = ?, content_hash = ? WHERE uid = ?',
+                  (row['version'], row['modified_at'], SYNC_TOMBSTONE_HASH, row['uid']))
+        return True, entry_id
+
+    if not row['password'] or is_legacy_record(row['password']):
+        raise ValueError(f"Sync row {row['uid']} is not in the current record format.")
+    values = (row['site'], row['username'], row['password'], row['password_hmac'], row['strength'],
+              row['notes'], row['category'], row['version'])
+    if entry_id is not None:
+        archive_password(c, entry_id, row['password_hmac'])
+        c.execute('''
+            UPDATE passwords
+            SET site = ?, username = ?, password = ?, password_hmac = ?, strength = ?, notes = ?, category = ?,
+                version = ?
+            WHERE id = ?
+        ''', (*values, entry_id))
+    else:
+        # New here, or deleted here earlier and since rewritten on the peer: replace any tombstone
+        c.execute('DELETE FROM sync_rows WHERE uid = ?', (row['uid'],))
+        c.execute('''
+            INSERT INTO passwords (site, username, password, password_hmac, strength, notes, category, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', values)
+        entry_id = c.lastrowid
+        c.execute('UPDATE sync_rows SET uid = ? WHERE entry_id = ?', (row['uid'], entry_id))
+    # Keep the writer's timestamp rather than the time it arrived here
+    c.execute('UPDATE sync_rows SET version = ?, modified_at = ?, deleted = 0, content_hash = ? WHERE uid = ?',
+              (row['version'], row['modified_at'],
+               sync_content_hash(row['site'], row['username'], row['notes'], row['category'], row['password_hmac']),
+               row['uid']))
+    return True, entry_id
+
+def apply_sync_rows(rows):
+    conn = get_db()
+    c = conn.cursor()
+    try:
+        results = [_apply_sync_row(c, row) for row in rows]
+        conn.commit()
+    except Exception:
+        rollback_db()
+        raise
+    # A synced row can arrive with the version number the cache already holds
+    for applied, entry_id in results:
+        if applied and entry_id is not None:
+            cache_invalidate(entry_id)
+    return sum(1 for applied, _ in results if applied)
+
+class SyncKeyMismatch(ValueError):
+    pass
+
+def sync_key_id(vault_key):
+    return hmac.new(vault_key, SYNC_KEY_ID_CONTEXT, hashlib.sha256).digest()[:8]
+
+def seal_sync_message(vault_key, session_id, seq, direction, message):
+    # The header is authenticated with the body, tying each response to its request
+    header = SYNC_SESSION_HEADER.pack(session_id, seq, direction, sync_key_id(vault_key))
+    return header + _seal(vault_key, json.dumps(message).encode('utf-8'), aad=SYNC_AAD + header)
+
+def open_sync_message(vault_key, frame):
+    header = frame[:SYNC_SESSION_HEADER.size]
+    session_id, seq, direction, key_id = SYNC_SESSION_HEADER.unpack(header)
+    if not hmac.compare_digest(key_id, sync_key_id(vault_key)):
+        raise SyncKeyMismatch(SYNC_KEY_MISMATCH)
+    message = json.loads(_open(vault_key, frame[SYNC_SESSION_HEADER.size:], aad=SYNC_AAD + header))
+    return session_id, seq, direction, message
+
+def sync_responder(master_key):
+    # Returns respond(frame) -> frame for one session plus its state. The tree is built once and
+    # rebuilt only after a push has changed rows.
+    vault_key = get_vault_key(master_key)
+    if vault_key is None:
+        raise ValueError('Vault key unavailable.')
+    state = {'session': None, 'seq': -1, 'tree': None, 'applied': 0, 'done': False, 'error': None}
+
+    def handle(message):
+        c = get_db().cursor()
+        op = message.get('op')
+        if state['tree'] is None:
+            refresh_sync_hashes(c)
+            state['tree'] = merkle_tree(c)
+        if op == 'hello':
+            return {'depth': SYNC_TREE_DEPTH}
+        if op == 'hashes':
+            return {'hashes': {prefix: state['tree'][prefix] for prefix in message['prefixes'] if prefix in state['tree']}}
+        if op == 'rows':
+            return {'rows': sync_summaries(c, message['prefixes'])}
+        if op == 'pull':
+            return {'rows': export_sync_rows(c, message['uids'])}
+        if op == 'push':
+            applied = apply_sync_rows(message['rows'])
+            state['applied'] += applied
+            state['tree'] = None
+            return {'applied': applied}
+        if op == 'done':
+            state['done'] = True
+            return {'status': 'done'}
+        return {'error': f'Unknown sync op: {op}'}
+
+    def respond(frame):
+        try:
+            session_id, seq, direction, message = open_sync_message(vault_key, frame)
+        except SyncKeyMismatch:
+            # Nothing can be sealed for this peer; a bare header with this side's key id lets it
+            # report the mismatch too, and the session ends here
+            session_id, seq = SYNC_SESSION_HEADER.unpack(frame[:SYNC_SESSION_HEADER.size])[:2]
+            state['error'], state['done'] = SYNC_KEY_MISMATCH, True
+            return SYNC_SESSION_HEADER.pack(session_id, seq, SYNC_RESPONSE, sync_key_id(vault_key))
+        if direction != SYNC_REQUEST or state['done'] or seq <= state['seq']:
+            raise ValueError('Unexpected sync message.')
+        # The first hello binds the responder to its session; any other session id is turned away
+        if state['session'] is None:
+            if message.get('op') != 'hello':
+                raise ValueError('Sync session must start with hello.')
+            state['session'] = session_id
+        elif session_id != state['session']:
+            raise ValueError('Sync message from another session.')
+        state['seq'] = seq
+        return seal_sync_message(vault_key, session_id, seq, SYNC_RESPONSE, handle(message))
+
+    return respond, state
+
+def sync_with(master_key, exchange):
+    # exchange(frame) -> frame carries one request to the peer's responder and returns its reply
+    vault_key = get_vault_key(master_key)
+    if vault_key is None:
+        raise ValueError('Vault key unavailable.')
+    c = get_db().cursor()
+    refresh_sync_hashes(c)
+    tree = merkle_tree(c)
+    session_id = os.urandom(16)
+    stats = {'pulled': 0, 'pushed': 0, 'rounds': 0, 'bytes_sent': 0, 'bytes_received': 0}
+
+    def call(message):
+        seq = stats['rounds']
+        frame = seal_sync_message(vault_key, session_id, seq, SYNC_REQUEST, message)
+        reply_frame = exchange(frame)
+        stats['rounds'] += 1
+        stats['bytes_sent'] += len(frame)
+        stats['bytes_received'] += len(reply_frame)
+        reply_session, reply_seq, direction, reply = open_sync_message(vault_key, reply_frame)
+        if (reply_session, reply_seq, direction) != (session_id, seq, SYNC_RESPONSE):
+            raise ValueError('Sync response does not match the request.')
+        if 'error' in reply:
+            raise ValueError(f"Sync peer error: {reply['error']}")
+        return reply
+
+    if call({'op': 'hello'}).get('depth') != SYNC_TREE_DEPTH:
+        raise ValueError('Sync peer uses a different tree depth.')
+    # Walk down from the root, asking only for the children of subtrees that differ
+    leaves = []
+    prefixes = ['']
+    while prefixes:
+        remote = call({'op': 'hashes', 'prefixes': prefixes})['hashes']
+        differing = [prefix for prefix in prefixes if tree.get(prefix) != remote.get(prefix)]
+        leaves.extend(prefix for prefix in differing if len(prefix) == SYNC_TREE_DEPTH)
+        prefixes = [prefix + digit for prefix in differing if len(prefix) < SYNC_TREE_DEPTH
+                    for digit in '0123456789abcdef']
+
+    pull, push = [], []
+    if leaves:
+        local = sync_summaries(c, leaves)
+        remote = call({'op': 'rows', 'prefixes': leaves})['rows']
+        for uid in sorted(set(local) | set(remote)):
+            mine, theirs = local.get(uid), remote.get(uid)
+            if mine is not None and theirs is not None and mine[2:] == theirs[2:]:
+                continue  # same content and deleted flag
+            if theirs is not None and _sync_newer(theirs, mine):
+                pull.append(uid)
             else:
-                logging.warning(f"Failed to decrypt password for entry ID {row[0]}")
-        logging.info('Retrieved all passwords successfully.')
-        return result
+                push.append(uid)
+
+    for start in range(0, len(pull), SYNC_BATCH_ROWS):
+        stats['pulled'] += apply_sync_rows(call({'op': 'pull', 'uids': pull[start:start + SYNC_BATCH_ROWS]})['rows'])
+    for start in range(0, len(push), SYNC_BATCH_ROWS):
+        rows = export_sync_rows(c, push[start:start + SYNC_BATCH_ROWS])
+        stats['pushed'] += call({'op': 'push', 'rows': rows})['applied']
+    call({'op': 'done'})
+    return stats
+
+def _send_sync_frame(sock, frame):
+    sock.sendall(struct.pack('>I', len(frame)) + frame)
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('Sync peer closed the connection.')
+        data += chunk
+    return bytes(data)
+
+def _recv_sync_frame(sock):
+    (size,) = struct.unpack('>I', _recv_exact(sock, 4))
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f'Sync frame of {size} bytes exceeds the limit.')
+    return _recv_exact(sock, size)
+
+@contextmanager
+def socket_sync_transport(host, port):
+    with socket.create_connection((host, port), timeout=SYNC_TIMEOUT_SECONDS) as sock:
+        def exchange(frame):
+            _send_sync_frame(sock, frame)
+            return _recv_sync_frame(sock)
+        yield exchange
+
+def serve_sync_socket(master_key, host='127.0.0.1', port=0, on_listening=None):
+    # Serves a single sync session, then returns its state
+    respond, state = sync_responder(master_key)
+    with socket.create_server((host, port)) as server:
+        server.settimeout(SYNC_TIMEOUT_SECONDS)
+        if on_listening is not None:
+            on_listening(server.getsockname()[1])
+        conn, _ = server.accept()
+        with conn:
+            conn.settimeout(SYNC_TIMEOUT_SECONDS)
+            while not state['done']:
+                _send_sync_frame(conn, respond(_recv_sync_frame(conn)))
+    return state
+
+def _write_drop_file(path, data):
+    # Written under a temporary name first so the peer never reads half a file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def file_drop_sync_transport(directory):
+    # Requests and responses are files in a directory both replicas can reach (a shared or
+    # synced folder, or a USB stick moved between machines while both ends wait)
+    def exchange(frame):
+        name = os.urandom(8).hex()
+        _write_drop_file(os.path.join(directory, name + '.request'), frame)
+        response_path = os.path.join(directory, name + '.response')
+        deadline = time.monotonic() + SYNC_TIMEOUT_SECONDS
+        while not os.path.exists(response_path):
+            if time.monotonic() > deadline:
+                raise TimeoutError('No sync response from the peer.')
+            time.sleep(SYNC_POLL_SECONDS)
+        with open(response_path, 'rb') as f:
+            reply = f.read()
+        os.remove(response_path)
+        return reply
+    yield exchange
+
+def serve_file_drop(master_key, directory):
+    respond, state = sync_responder(master_key)
+    deadline = time.monotonic() + SYNC_TIMEOUT_SECONDS
+    while not state['done']:
+        requests = sorted(name for name in os.listdir(directory) if name.endswith('.request'))
+        if not requests:
+            if time.monotonic() > deadline:
+                raise TimeoutError('No sync request from the peer.')
+            time.sleep(SYNC_POLL_SECONDS)
+            continue
+        for name in requests:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                frame = f.read()
+            os.remove(path)
+            _write_drop_file(path[:-len('.request')] + '.response', respond(frame))
+        deadline = time.monotonic() + SYNC_TIMEOUT_SECONDS
+    return state
+
+def sync_vault(master_key, options):
+    try:
+        transport = options.get('transport')
+        if transport == 'socket':
+            channel = socket_sync_transport(options.get('host', '127.0.0.1'), int(options['port']))
+        elif transport == 'file':
+            channel = file_drop_sync_transport(options['directory'])
+        else:
+            return {'error': f'Unsupported sync transport: {transport}'}
+        with channel as exchange:
+            stats = sync_with(master_key, exchange)
+        logging.info(f"Vault synced: {stats['pulled']} pulled, {stats['pushed']} pushed in {stats['rounds']} rounds.")
+        return stats
+    except SyncKeyMismatch as e:
+        logging.error(f'Vault sync refused: {e}')
+        return {'error': str(e)}
     except Exception as e:
-        logging.error('Error retrieving passwords:', exc_info=True)
-        return []
+        rollback_db()
+        logging.error('Error syncing vault:', exc_info=True)
+        return {'error': 'Failed to sync vault'}
+
+def serve_sync(master_key, options, on_listening=None):
+    try:
+        transport = options.get('transport')
+        if transport == 'socket':
+            state = serve_sync_socket(master_key, options.get('host', '127.0.0.1'), int(options.get('port', 0)),
+                                      on_listening)
+        elif transport == 'file':
+            state = serve_file_drop(master_key, options['directory'])
+        else:
+            return {'error': f'Unsupported sync transport: {transport}'}
+        if state['error']:
+            logging.error(f"Vault sync refused: {state['error']}")
+            return {'error': state['error']}
+        logging.info(f"Served vault sync: {state['applied']} rows received.")
+        return {'applied': state['applied'], 'rounds': state['seq'] + 1}
+    except Exception as e:
+        rollback_db()
+        logging.error('Error serving vault sync:', exc_info=True)
+        return {'error': 'Failed to serve vault sync'}
 
 def setup_mfa(master_key):
     try:
@@ -294,6 +2718,8 @@ def setup_mfa(master_key):
         if totp_secret is None:
             raise ValueError('Failed to generate TOTP secret.')
         store_totp_secret(master_key, totp_secret)
+        import pyotp
+        import qrcode
         totp_uri = pyotp.totp.TOTP(totp_secret).provisioning_uri(name='Secure Password Manager', issuer_name='SecurePasswordManager')
         # Generate QR code
         qr = qrcode.QRCode()
@@ -318,6 +2744,7 @@ def verify_mfa(master_key, token):
         if totp_secret is None:
             logging.warning('MFA is enabled but TOTP secret is not set up.')
             return {'error': 'MFA not set up'}
+        import pyotp
         totp = pyotp.TOTP(totp_secret)
         if totp.verify(token):
             logging.info('MFA token verified successfully.')
@@ -334,7 +2761,7 @@ def is_mfa_enabled(master_key):
         if not MFA_ENABLED:
             logging.info('MFA is disabled globally.')
             return {'mfaEnabled': False}
-        if os.path.exists(TOTP_SECRET_FILE):
+        if os.path.exists(vault_file(TOTP_SECRET_FILE)):
             logging.info('MFA is enabled and TOTP secret is set up.')
             return {'mfaEnabled': True}
         else:
@@ -347,8 +2774,9 @@ def is_mfa_enabled(master_key):
 def disable_mfa(master_key):
     try:
         # Remove the TOTP secret file
-        if os.path.exists(TOTP_SECRET_FILE):
-            os.remove(TOTP_SECRET_FILE)
+        totp_secret_file = vault_file(TOTP_SECRET_FILE)
+        if os.path.exists(totp_secret_file):
+            os.remove(totp_secret_file)
             logging.info('MFA has been disabled and TOTP secret removed.')
             return {"status": "MFA disabled"}
         else:
@@ -358,155 +2786,517 @@ def disable_mfa(master_key):
         logging.error('Error disabling MFA:', exc_info=True)
         return {"error": "Failed to disable MFA."}
 
-def main():
-    init_db()
-    master_key = None
+_stdout_lock = threading.Lock()
 
-    for line in sys.stdin:
-        try:
-            request = json.loads(line)
-            command = request.get('command')
-            data = request.get('data')
-            logging.debug(f"Received command: {command}")
+def send_message(message, request_id=None):
+    global _bytes_written, _messages_written
+    # Every line written for a request echoes its id so replies can arrive out of order
+    if request_id is not None:
+        message = {**message, "id": request_id}
+    with _stdout_lock:
+        with span('serialize'):
+            if _framing_mode == 'msgpack':
+                payload = msgpack.packb(message, use_bin_type=True)
+                payload = struct.pack('>I', len(payload)) + payload
+            else:
+                payload = json.dumps(message)
+        if _framing_mode == 'msgpack':
+            sys.stdout.buffer.write(payload)
+            sys.stdout.buffer.flush()
+        else:
+            print(payload)  # Send JSON to stdout
+            sys.stdout.flush()
+        with _metrics_lock:
+            _bytes_written += len(payload) + (0 if _framing_mode == 'msgpack' else 1)
+            _messages_written += 1
 
-            if command == 'shutdown':
-                logging.info('Shutdown command received. Exiting backend process.')
-                print(json.dumps({"status": "shutdown"}))
-                sys.stdout.flush()
-                break  # Exit the loop to end the process
+def read_request(stream):
+    # Returns the next decoded request, or None at end of input
+    if _framing_mode == 'msgpack':
+        prefix = stream.read(4)
+        if len(prefix) < 4:
+            return None
+        (length,) = struct.unpack('>I', prefix)
+        if length > MAX_FRAME_SIZE:
+            # The stream cannot be resynchronised after a bad length prefix
+            raise EOFError(f'Frame of {length} bytes exceeds the maximum size')
+        payload = stream.read(length)
+        if len(payload) < length:
+            return None
+        return msgpack.unpackb(payload, raw=False)
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
 
-            elif command == 'disable_mfa':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
+def recover_request_id(error):
+    # A request that failed to parse may still show its id, so the reply can settle it
+    doc = getattr(error, 'doc', None)  # Set by json.JSONDecodeError
+    match = REQUEST_ID_PATTERN.search(doc) if isinstance(doc, str) else None
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+def check_framing_mode(mode):
+    if mode not in FRAMING_MODES:
+        return {"error": "Unsupported framing mode"}
+    if mode == 'msgpack' and (msgpack is None or not hasattr(sys.stdin, 'buffer') or not hasattr(sys.stdout, 'buffer')):
+        return {"error": "Framing mode unavailable"}
+    return {"status": "Framing set", "framing": mode}
+
+def handle_command(session, command, data, emit):
+    vault = current_vault()
+    master_key = session['master_key'] if vault is None else vault['master_key']
+
+    if command == 'disable_mfa':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = disable_mfa(master_key)
+
+    elif command == 'is_master_password_set':
+        if os.path.exists(vault_file(MASTER_PASSWORD_FILE)):
+            response = {"isSet": True}
+        else:
+            response = {"isSet": False}
+
+    elif command == 'get_metrics':
+        # Timings and byte counts only, so this is available before unlock
+        response = {"metrics": get_metrics()}
+        if data.get('reset'):
+            reset_metrics()
+
+    elif command == 'set_master_password':
+        # A failed attempt leaves the session, and any named vaults hanging off it, as they were;
+        # a successful one starts from an empty cache
+        if os.path.exists(vault_file(MASTER_PASSWORD_FILE)):
+            # Verify existing master password
+            success, master_key = verify_master_password(data.get('master_password'))
+            if success:
+                clear_entry_cache()
+                set_session_key(session, master_key)
+                init_db(master_key)
+                response = {"status": "Master password verified"}
+            else:
+                response = {"error": "Incorrect master password"}
+        else:
+            # Set new master password; the same derivation yields the verifier and the key
+            master_key = hash_master_password(data.get('master_password'))
+            if master_key is None:
+                response = {"error": "Failed to set master password"}
+            else:
+                clear_entry_cache()
+                set_session_key(session, master_key)
+                init_db(master_key)
+                response = {"status": "Master password set"}
+
+    elif command == 'lock':
+        lock_session(session, forget_quick_unlock=bool(data.get('forget_pin')))
+        response = {"status": "Locked", "quickUnlock": session['quick_unlock'] is not None}
+
+    elif command == 'set_pin':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = enable_quick_unlock(session, data.get('pin'))
+
+    elif command == 'unlock_with_pin':
+        response = unlock_with_pin(session, data.get('pin'))
+
+    elif command == 'set_auto_lock':
+        seconds = data.get('seconds')
+        if not isinstance(seconds, (int, float)) or seconds < 0:
+            response = {"error": "seconds must be a non-negative number"}
+        else:
+            session['auto_lock_seconds'] = seconds  # 0 disables auto-lock
+            response = {"status": "Auto-lock updated", "seconds": seconds}
+
+    elif command == 'calibrate_kdf':
+        target_ms = data.get('target_ms', KDF_TARGET_SECONDS * 1000)
+        response = {"params": calibrate_kdf_params(target_ms / 1000)}
+
+    elif command == 'set_kdf_params':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            # Re-keying needs the password itself, not just the current key
+            success, current_key = verify_master_password(data.get('master_password'))
+            if not success:
+                response = {"error": "Incorrect master password"}
+            else:
+                if data.get('params') is None:
+                    checked = {'params': calibrate_kdf_params(data.get('target_ms', KDF_TARGET_SECONDS * 1000) / 1000)}
                 else:
-                    response = disable_mfa(master_key)
-                print(json.dumps(response))
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-            elif command == 'is_master_password_set':
-                if os.path.exists(MASTER_PASSWORD_FILE):
-                    response = {"isSet": True}
+                    checked = check_kdf_params(data.get('params'))
+                if 'error' in checked:
+                    response = checked
                 else:
-                    response = {"isSet": False}
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-            elif command == 'set_master_password':
-                if os.path.exists(MASTER_PASSWORD_FILE):
-                    # Verify existing master password
-                    success, master_key = verify_master_password(data.get('master_password'))
-                    if success:
-                        response = {"status": "Master password verified"}
+                    kdf_params = checked['params']
+                    new_master_key = rekey_master_key(current_key, data.get('master_password'), kdf_params)
+                    if new_master_key is None:
+                        response = {"error": "Failed to update KDF parameters"}
                     else:
-                        response = {"error": "Incorrect master password"}
-                else:
-                    # Set new master password
-                    hash_master_password(data.get('master_password'))
-                    master_key = get_master_key(data.get('master_password'))
-                    response = {"status": "Master password set"}
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-            elif command == 'add_password':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    site = data.get('site')
-                    username = data.get('username')
-                    password = data.get('password')
-                    notes = data.get('notes', '')
-                    category = data.get('category', '')
-                    add_password(master_key, site, username, password, notes, category)
-                    response = {"status": "Password added"}
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-            elif command == 'update_password':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    entry_id = data.get('id')
-                    site = data.get('site')
-                    username = data.get('username')
-                    password = data.get('password')
-                    notes = data.get('notes')
-                    category = data.get('category')
-                    update_password(master_key, entry_id, site, username, password, notes, category)
-                    response = {"status": "Password updated"}
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-            elif command == 'delete_password':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    entry_id = data.get('id')
-                    delete_password(entry_id)
-                    response = {"status": "Password deleted"}
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-            elif command == 'get_passwords':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    passwords = get_passwords(master_key)
-                    response = {"passwords": passwords}
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
+                        set_session_key(session, new_master_key)
+                        # The PIN wrapping holds the old key
+                        session['quick_unlock'] = None
+                        response = {"status": "KDF parameters updated", "params": kdf_params}
 
-            elif command == 'setup_mfa':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    response = setup_mfa(master_key)
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
+    elif command == 'add_password':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            site = data.get('site')
+            username = data.get('username')
+            password = data.get('password')
+            notes = data.get('notes', '')
+            category = data.get('category', '')
+            add_password(master_key, site, username, password, notes, category)
+            response = {"status": "Password added"}
 
-            elif command == 'verify_mfa':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    token = data.get('token')
-                    response = verify_mfa(master_key, token)
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
+    elif command == 'update_password':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            entry_id = data.get('id')
+            site = data.get('site')
+            username = data.get('username')
+            password = data.get('password')
+            notes = data.get('notes')
+            category = data.get('category')
+            update_password(master_key, entry_id, site, username, password, notes, category)
+            response = {"status": "Password updated"}
 
-            elif command == 'is_mfa_enabled':
-                if master_key is None:
-                    response = {"error": "Master password not verified"}
-                else:
-                    response = is_mfa_enabled(master_key)
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
+    elif command == 'delete_password':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            entry_id = data.get('id')
+            delete_password(entry_id)
+            response = {"status": "Password deleted"}
+
+    elif command == 'apply_batch':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = apply_batch(master_key, data.get('operations'))
+
+    elif command == 'rename_category':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = rename_category(master_key, data.get('old_category'), data.get('new_category'))
+
+    elif command == 'delete_category':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = delete_category(master_key, data.get('category'))
 
+    elif command == 'get_passwords':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        elif data.get('order_by', 'id') not in ORDER_BY_COLUMNS:
+            response = {"error": "Invalid order_by"}
+        elif not is_page_cursor(data.get('cursor'), data.get('order_by', 'id')):
+            response = {"error": "Invalid cursor"}
+        else:
+            passwords, next_cursor = get_passwords_page(
+                master_key,
+                data.get('limit'),
+                data.get('cursor'),
+                data.get('order_by', 'id'),
+            )
+            response = {"passwords": passwords, "next_cursor": next_cursor}
+
+    elif command == 'list_entries':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        elif data.get('order_by', 'id') not in ORDER_BY_COLUMNS:
+            response = {"error": "Invalid order_by"}
+        elif not is_page_cursor(data.get('cursor'), data.get('order_by', 'id')):
+            response = {"error": "Invalid cursor"}
+        else:
+            # Sequence read before the first page, so changes made while paging are replayed
+            seq = current_change_seq(get_db().cursor()) if data.get('cursor') is None else None
+            entries, next_cursor = list_entries_page(data.get('limit'), data.get('cursor'), data.get('order_by', 'id'))
+            response = {"entries": entries, "next_cursor": next_cursor, "seq": seq}
+
+    elif command == 'get_history':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            history = get_history(master_key, data.get('id'))
+            if history is None:
+                response = {"error": "Failed to load password history"}
             else:
-                response = {"error": "Unknown command"}
-                logging.warning(f"Unknown command received: {command}")
-                print(json.dumps(response))  # Send JSON to stdout
-                sys.stdout.flush()
-                logging.debug(f"Response: {response}")
-
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error: {e}", exc_info=True)
-            response = {"error": "Invalid JSON format"}
-            print(json.dumps(response))  # Send error to stdout
-            sys.stdout.flush()
-        except Exception as e:
-            logging.error("An unexpected error occurred:", exc_info=True)
-            response = {"error": "An internal error occurred"}
-            print(json.dumps(response))  # Send error to stdout
-            sys.stdout.flush()
+                response = {"history": history}
+
+    elif command == 'get_changes_since':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            changes = get_changes_since(data.get('seq'))
+            if changes is None:
+                response = {"error": "Failed to read changes"}
+            else:
+                response = changes
+
+    elif command == 'reveal_password':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            entry_id = data.get('id')
+            password = reveal_password(master_key, entry_id)
+            if password is None:
+                response = {"error": "Failed to reveal password"}
+            else:
+                response = {"entry_id": entry_id, "password": password}
+
+    elif command == 'import_entries':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            def report_progress(imported, skipped):
+                # Progress lines carry a "progress" key so the frontend does not treat them as the reply
+                emit({"progress": {"command": "import_entries", "imported": imported, "skipped": skipped}})
+
+            if data.get('path'):
+                entries = iter_import_file(data.get('path'))
+            else:
+                entries = data.get('entries', [])
+            result = import_entries(master_key, entries, report_progress)
+            if result is None:
+                response = {"error": "Failed to import entries"}
+            else:
+                response = {"status": "Entries imported", **result}
+
+    elif command == 'audit_breaches':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            def report_progress(audited, breached):
+                emit({"progress": {"command": "audit_breaches", "audited": audited, "breached": breached}})
+
+            response = audit_breaches(master_key, data.get('source'), report_progress)
+
+    elif command == 'audit_vault':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = audit_vault(master_key, data.get('weak_bits', WEAK_PASSWORD_BITS))
+
+    elif command == 'export_vault':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            result = export_vault(master_key, data.get('path'))
+            if result is None:
+                response = {"error": "Failed to export vault"}
+            else:
+                response = {"status": "Vault exported", **result}
+
+    elif command == 'restore_vault':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            def report_progress(restored):
+                emit({"progress": {"command": "restore_vault", "restored": restored}})
+
+            result = restore_vault(master_key, data.get('path'), data.get('replace', False), report_progress,
+                                   data.get('master_password'))
+            if result is None:
+                response = {"error": "Failed to restore vault"}
+            else:
+                response = {"status": "Vault restored", **result}
+
+    elif command == 'search':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            limit = data.get('limit', SEARCH_DEFAULT_LIMIT)
+            if vault is None and _vaults:
+                results = federated_search(data.get('query'), limit)
+                response = {"ids": [r['id'] for r in results if r['vault'] == DEFAULT_VAULT], "results": results}
+            else:
+                response = {"ids": search_entries(data.get('query'), limit)}
+
+    elif command == 'sync_vault':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            result = sync_vault(master_key, data)
+            response = result if 'error' in result else {"status": "Vault synced", **result}
+
+    elif command == 'serve_sync':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            def report_listening(port):
+                emit({"progress": {"command": "serve_sync", "port": port}})
+
+            result = serve_sync(master_key, data, report_listening)
+            response = result if 'error' in result else {"status": "Sync served", **result}
+
+    elif command == 'open_vault':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = open_vault(data.get('name'), data.get('directory'), data.get('master_password'),
+                                  bool(data.get('create')), data.get('token'))
+
+    elif command == 'close_vault':
+        response = close_vault(data.get('name'))
+
+    elif command == 'list_vaults':
+        response = {"vaults": list_vaults(session)}
+
+    elif command == 'setup_mfa':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = setup_mfa(master_key)
+
+    elif command == 'verify_mfa':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            token = data.get('token')
+            response = verify_mfa(master_key, token)
+
+    elif command == 'is_mfa_enabled':
+        if master_key is None:
+            response = {"error": "Master password not verified"}
+        else:
+            response = is_mfa_enabled(master_key)
+
+    else:
+        response = {"error": "Unknown command"}
+        logging.warning(f"Unknown command received: {command}")
+
+    return response
+
+
+def dispatch_command(session, command, data, emit):
+    # Commands whose data names another vault run with that vault's files, connections, key and cache
+    name = data.get('vault', DEFAULT_VAULT)
+    if name == DEFAULT_VAULT:
+        return handle_command(session, command, data, emit)
+    if command in SERIAL_COMMANDS:
+        return {"error": f"{command} applies to the default vault only"}
+    with _vaults_lock:
+        vault = _vaults.get(name)
+    if vault is None:
+        return {"error": f'Vault "{name}" is not open'}
+    with use_vault(vault):
+        return handle_command(session, command, data, emit)
+
+def run_command(session, request_id, command, data):
+    _span_context.command = command
+    _span_context.request_id = request_id
+    with session['lock']:
+        session['active'] += 1
+    try:
+        with span(f"command:{command if command in COMMANDS else 'unknown'}"):
+            try:
+                response = dispatch_command(session, command, data, lambda message: send_message(message, request_id))
+            except Exception as e:
+                logging.error("An unexpected error occurred:", exc_info=True)
+                response = {"error": "An internal error occurred"}
+            send_message(response, request_id)
+    finally:
+        with session['lock']:
+            session['active'] -= 1
+            session['last_activity'] = time.monotonic()
+        _span_context.command = None
+        _span_context.request_id = None
+    # Responses are never logged: they can hold secrets and formatting them costs as much as sending
+    logging.debug(f"Response sent for {command} (id {request_id})")
+
+def main():
+    global _framing_mode
+    _framing_mode = 'json'  # Every session starts in JSON lines until set_framing
+    if os.environ.get(TRACE_FILE_ENV):
+        open_trace_file(os.environ[TRACE_FILE_ENV])
+    open_db()
+    init_db()
+    session = new_session()
+    in_flight = set()
+    # Read raw bytes so the same stream can switch from JSON lines to binary frames
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stop_auto_lock = threading.Event()
+    threading.Thread(target=auto_lock_worker, args=(session, stop_auto_lock), name='auto-lock', daemon=True).start()
+
+    try:
+        serve_requests(session, stdin, in_flight)
+    finally:
+        stop_auto_lock.set()
+        lock_session(session, forget_quick_unlock=True)
+
+def serve_requests(session, stdin, in_flight):
+    global _framing_mode
+    barrier = None  # The last serial command submitted
+    with ThreadPoolExecutor(max_workers=COMMAND_WORKERS, thread_name_prefix='command') as executor:
+        while True:
+            try:
+                request = read_request(stdin)
+                if request is None:
+                    break
+                if not isinstance(request, dict):
+                    raise ValueError('Request must be a JSON object')
+            except EOFError as e:
+                logging.error(f"Framing error: {e}")
+                break
+            except ValueError as e:
+                logging.error(f"JSON decode error: {e}", exc_info=True)
+                send_message({"error": "Invalid JSON format"}, recover_request_id(e))
+                continue
+
+            request_id = request.get('id')
+            command = request.get('command')
+            data = request.get('data') or {}
+            if not isinstance(command, str) or not isinstance(data, dict):
+                send_message({"error": "command must be a string and data an object"}, request_id)
+                continue
+            logging.debug(f"Received command: {command} (id {request_id})")
+
+            if command in STREAM_COMMANDS:
+                wait(list(in_flight))
+                if command == 'shutdown':
+                    logging.info('Shutdown command received. Exiting backend process.')
+                    clear_entry_cache()
+                    close_db()
+                    close_trace_file()
+                    send_message({"status": "shutdown"}, request_id)
+                    break  # Exit the loop to end the process
+                response = check_framing_mode(data.get('mode'))
+                # The acknowledgement goes out in the old framing; everything after it uses the new one
+                send_message(response, request_id)
+                if 'error' not in response:
+                    _framing_mode = response['framing']
+                    logging.info(f'IPC framing switched to {_framing_mode}.')
+                continue
+
+            # The reader never blocks here: a serial command waits in the pool for the earlier commands
+            # that use the session, and later ones wait for it, so a slow command only holds up those
+            if command in SERIAL_COMMANDS:
+                earlier = [f for f in list(in_flight) if f.uses_session]
+                future = executor.submit(run_after, earlier, session, request_id, command, data)
+                barrier = future
+            elif command in SESSION_FREE_COMMANDS:
+                future = executor.submit(run_command, session, request_id, command, data)
+            else:
+                future = executor.submit(run_after, [barrier] if barrier else [], session, request_id, command, data)
+            future.uses_session = command not in SESSION_FREE_COMMANDS
+            in_flight.add(future)
+            future.add_done_callback(in_flight.discard)
+
+def run_after(futures, session, request_id, command, data):
+    # Pool threads pick up work in submission order, so everything waited on here is already running
+    wait(futures)
+    run_command(session, request_id, command, data)
 
 if __name__ == '__main__':
     signal.signal(signal.SIGINT, handle_exit_signals)
@@ -0,0 +1,90 @@
+# benchmarks/bench_db.py
+#
+# Compares the old connect/execute/commit/close-per-operation pattern with the
+# backend's persistent WAL connection. Run from the project root:
+#
+#   python benchmarks/bench_db.py --ops 2000
+#
+# Results are printed as JSON so runs can be diffed or collected.
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import backend  # noqa: E402
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS passwords (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site TEXT NOT NULL,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        notes TEXT,
+        category TEXT
+    )
+'''
+
+def run_ops(execute, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        execute('INSERT INTO passwords (site, username, password, notes, category) VALUES (?, ?, ?, ?, ?)',
+                (f'site{i}.com', 'user', 'v1:ciphertext', '', 'bench'))
+    for i in range(ops):
+        execute('UPDATE passwords SET username = ? WHERE id = ?', ('user2', i + 1))
+    for i in range(ops):
+        execute('DELETE FROM passwords WHERE id = ?', (i + 1,))
+    elapsed = time.perf_counter() - start
+    return round(3 * ops / elapsed, 1)
+
+def bench_connection_per_op(db_file, ops):
+    conn = sqlite3.connect(db_file)
+    conn.execute(SCHEMA)
+    conn.close()
+
+    def execute(sql, params):
+        conn = sqlite3.connect(db_file)
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    return run_ops(execute, ops)
+
+def bench_persistent_connection(db_file, ops):
+    backend.DB_FILE = db_file
+    backend.init_db()
+    conn = backend.get_db()
+
+    def execute(sql, params):
+        conn.execute(sql, params)
+        conn.commit()
+
+    try:
+        return run_ops(execute, ops)
+    finally:
+        backend.close_db()
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite connection strategy benchmark')
+    parser.add_argument('--ops', type=int, default=1000, help='operations per phase (insert, update, delete)')
+    args = parser.parse_args()
+
+    backend.logging.disable(backend.logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        before = bench_connection_per_op(os.path.join(tmp, 'before.db'), args.ops)
+        after = bench_persistent_connection(os.path.join(tmp, 'after.db'), args.ops)
+
+    print(json.dumps({
+        'benchmark': 'db_connection',
+        'ops_per_phase': args.ops,
+        'connection_per_op_ops_per_sec': before,
+        'persistent_wal_ops_per_sec': after,
+        'speedup': round(after / before, 2),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_ipc.py
+#
+# Measures get_passwords round trips through a real backend process over its
+# stdin/stdout pipe, first with newline-delimited JSON and then after
+# negotiating length-prefixed msgpack framing. Run from the project root:
+#
+#   python benchmarks/bench_ipc.py --entries 5000 --rounds 20
+#
+# The backend's entry cache is off unless --entry-cache is given, so every round
+# trip includes the decrypt it would cost on a first view.
+# The binary half of the run is skipped when the optional msgpack package is missing.
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import msgpack
+except ImportError:  # JSON lines only
+    msgpack = None
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'backend.py')
+
+class BackendPipe:
+    def __init__(self, cwd, entry_cache=True):
+        env = dict(os.environ)
+        if not entry_cache:
+            env['SPM_ENTRY_CACHE'] = '0'
+        self.process = subprocess.Popen(
+            [sys.executable, BACKEND],
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.framing = 'json'
+        self.next_id = 1
+        self.bytes_read = 0
+
+    def request(self, command, data=None):
+        message = {'id': self.next_id, 'command': command, 'data': data or {}}
+        self.next_id += 1
+        if self.framing == 'msgpack':
+            payload = msgpack.packb(message, use_bin_type=True)
+            self.process.stdin.write(struct.pack('>I', len(payload)) + payload)
+        else:
+            self.process.stdin.write(json.dumps(message).encode() + b'\n')
+        self.process.stdin.flush()
+        while True:
+            response = self.read()
+            if 'progress' not in response:
+                return response
+
+    def read(self):
+        stdout = self.process.stdout
+        if self.framing == 'msgpack':
+            (length,) = struct.unpack('>I', stdout.read(4))
+            self.bytes_read += 4 + length
+            return msgpack.unpackb(stdout.read(length), raw=False)
+        line = stdout.readline()
+        self.bytes_read += len(line)
+        return json.loads(line)
+
+    def close(self):
+        self.request('shutdown')
+        self.process.wait(timeout=10)
+
+def time_round_trips(pipe, rounds):
+    # One untimed round trip first, so neither framing pays for a cold backend
+    assert 'passwords' in pipe.request('get_passwords')
+    pipe.bytes_read = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        response = pipe.request('get_passwords')
+        assert 'passwords' in response, response
+    elapsed = time.perf_counter() - start
+    return {
+        'ms_per_round_trip': round(1000 * elapsed / rounds, 2),
+        'bytes_per_response': pipe.bytes_read // rounds,
+        'mb_per_sec': round(pipe.bytes_read / elapsed / 1e6, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend pipe framing benchmark')
+    parser.add_argument('--entries', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--entry-cache', action='store_true', help='Leave the decrypted-entry cache on')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pipe = BackendPipe(tmp, entry_cache=args.entry_cache)
+        pipe.request('set_master_password', {'master_password': 'benchmark'})
+        entries = [
+            {'site': f'site{i}.example.com', 'username': f'user{i}', 'password': os.urandom(12).hex(),
+             'notes': 'benchmark entry', 'category': 'bench'}
+            for i in range(args.entries)
+        ]
+        pipe.request('import_entries', {'entries': entries})
+
+        json_results = time_round_trips(pipe, args.rounds)
+        msgpack_results = None
+        if msgpack is not None:
+            ack = pipe.request('set_framing', {'mode': 'msgpack'})
+            assert ack.get('framing') == 'msgpack', ack
+            pipe.framing = 'msgpack'
+            msgpack_results = time_round_trips(pipe, args.rounds)
+        pipe.close()
+
+    print(json.dumps({
+        'benchmark': 'ipc_framing',
+        'entries': args.entries,
+        'rounds': args.rounds,
+        'entry_cache': args.entry_cache,
+        'json_lines': json_results,
+        'msgpack': msgpack_results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
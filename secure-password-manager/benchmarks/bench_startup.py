@@ -0,0 +1,66 @@
+# benchmarks/bench_startup.py
+#
+# Measures backend cold start as the UI sees it: the time from spawning the
+# process to reading its first is_master_password_set response. Run from the
+# project root:
+#
+#   python benchmarks/bench_startup.py --runs 10
+#   python benchmarks/bench_startup.py --executable backend/backend/dist/win/backend.exe
+#
+# Without --executable the script runs backend/backend.py with this interpreter;
+# pass a PyInstaller build to compare --onefile against --onedir.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'backend.py')
+
+def time_first_response(command, cwd):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    process.stdin.write(json.dumps({'id': 1, 'command': 'is_master_password_set', 'data': {}}).encode() + b'\n')
+    process.stdin.flush()
+    response = json.loads(process.stdout.readline())
+    elapsed = time.perf_counter() - start
+    assert 'isSet' in response, response
+
+    process.stdin.write(json.dumps({'id': 2, 'command': 'shutdown', 'data': {}}).encode() + b'\n')
+    process.stdin.flush()
+    process.wait(timeout=10)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend cold start benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--executable', help='Built backend executable; defaults to backend.py')
+    args = parser.parse_args()
+
+    command = [os.path.abspath(args.executable)] if args.executable else [sys.executable, BACKEND]
+    with tempfile.TemporaryDirectory() as tmp:
+        # The first launch warms the OS file cache and is reported separately
+        first = time_first_response(command, tmp)
+        samples = [time_first_response(command, tmp) for _ in range(args.runs)]
+
+    print(json.dumps({
+        'benchmark': 'startup',
+        'target': args.executable or 'backend.py',
+        'runs': args.runs,
+        'first_run_ms': round(first * 1000, 1),
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'min_ms': round(min(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# benchmarks/bench_suite.py
+#
+# End-to-end backend benchmark over synthetic vaults: unlock, listing and
+# search latency, add/update throughput, and JSON round trips through a real
+# backend process. Run from the project root:
+#
+#   python benchmarks/bench_suite.py --sizes 1000 10000 --output results.json
+#   python benchmarks/bench_suite.py --sizes 1000 10000 --baseline results.json
+#
+# With --baseline the run exits non-zero when a latency (*_ms) grows, or a
+# throughput (*_per_sec) drops, by more than --tolerance against the baseline.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from bench_ipc import BackendPipe
+from vault_generator import MASTER_PASSWORD, backend, generate_vault, use_vault_dir
+
+SEARCH_QUERIES = ('mail', 'bank', 'travel42', 'zzz', 'ab')
+
+def median_ms(func, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 2)
+
+def per_sec(func, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        func(i)
+    return round(ops / (time.perf_counter() - start), 1)
+
+def bench_in_process(directory, repeats, write_ops):
+    use_vault_dir(directory)
+    results = {}
+    results['unlock_ms'] = median_ms(lambda: backend.verify_master_password(MASTER_PASSWORD), repeats)
+    _, master_key = backend.verify_master_password(MASTER_PASSWORD)
+    backend.init_db(master_key)
+
+    # Cold: every entry decrypted, as on the first view after unlock. Warm: served from the entry cache
+    cache_enabled, backend.ENTRY_CACHE_ENABLED = backend.ENTRY_CACHE_ENABLED, False
+    try:
+        results['get_passwords_ms'] = median_ms(lambda: backend.get_passwords(master_key), repeats)
+    finally:
+        backend.ENTRY_CACHE_ENABLED = cache_enabled
+    backend.get_passwords(master_key)
+    results['get_passwords_cached_ms'] = median_ms(lambda: backend.get_passwords(master_key), repeats)
+    results['list_entries_page_ms'] = median_ms(lambda: backend.list_entries(500, None, 'site'), repeats)
+    results['list_entries_full_ms'] = median_ms(lambda: backend.list_entries(), repeats)
+    results['search_ms'] = median_ms(
+        lambda: [backend.search_entries(query) for query in SEARCH_QUERIES], repeats)
+
+    results['add_per_sec'] = per_sec(
+        lambda i: backend.add_password(master_key, f'bench{i}.example.com', 'user', 'secret', '', 'bench'),
+        write_ops)
+    ids = [entry['id'] for entry in backend.list_entries(write_ops, None, 'id')]
+    results['update_per_sec'] = per_sec(
+        lambda i: backend.update_password(master_key, ids[i], f'bench{i}.example.com', 'user2', 'secret2', '', 'bench'),
+        len(ids))
+    backend.close_db()
+    return results
+
+def bench_ipc(directory, repeats):
+    results = {}
+    pipe = BackendPipe(directory)
+    try:
+        start = time.perf_counter()
+        response = pipe.request('set_master_password', {'master_password': MASTER_PASSWORD})
+        results['ipc_unlock_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        assert response.get('status') == 'Master password verified', response
+
+        results['ipc_round_trip_ms'] = median_ms(lambda: pipe.request('is_master_password_set'), repeats * 10)
+        results['ipc_list_entries_page_ms'] = median_ms(
+            lambda: pipe.request('list_entries', {'limit': 500, 'order_by': 'site'}), repeats)
+        results['ipc_search_ms'] = median_ms(lambda: pipe.request('search', {'query': 'mail'}), repeats)
+    finally:
+        pipe.close()
+    return results
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for size, metrics in results['vaults'].items():
+        for name, value in metrics.items():
+            old = baseline.get('vaults', {}).get(size, {}).get(name)
+            if not old:
+                continue
+            if name.endswith('_ms') and value > old * (1 + tolerance):
+                regressions.append(f'{size}/{name}: {old} -> {value}')
+            elif name.endswith('_per_sec') and value < old * (1 - tolerance):
+                regressions.append(f'{size}/{name}: {old} -> {value}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='Vault sizes to generate; 100000 takes a few minutes')
+    parser.add_argument('--repeats', type=int, default=5, help='Samples per latency metric')
+    parser.add_argument('--write-ops', type=int, default=200, help='Adds and updates per throughput metric')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    backend.logging.disable(backend.logging.INFO)
+    results = {
+        'benchmark': 'suite',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'kdf': backend.DEFAULT_KDF_PARAMS,
+        'vaults': {},
+    }
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            generate_vault(tmp, size)
+            backend.close_db()
+            metrics = {'generate_s': round(time.perf_counter() - start, 2)}
+            metrics.update(bench_in_process(tmp, args.repeats, args.write_ops))
+            metrics.update(bench_ipc(tmp, args.repeats))
+        results['vaults'][str(size)] = metrics
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,11 @@
+import argparse
 import os
 import platform
 import subprocess
 import shutil
 import sys  # Import sys module
 
-def build_backend():
+def build_backend(mode='onefile'):
     system = platform.system()
     backend_dir = os.path.join('backend', 'dist')
 
@@ -12,38 +13,27 @@ def build_backend():
 
     if system == 'Windows':
         executable_name = 'backend.exe'
-        pyinstaller_command = [
-            sys.executable, '-m', 'PyInstaller',
-            '--onefile',
-            '--windowed',  # Added this option
-            '--name', executable_base_name,
-            'backend.py'
-        ]
         output_dir = os.path.join(backend_dir, 'win')
     elif system == 'Darwin':
         executable_name = 'backend'
-        pyinstaller_command = [
-            sys.executable, '-m', 'PyInstaller',
-            '--onefile',
-            '--windowed',  # Added this option (optional for macOS)
-            '--name', executable_base_name,
-            'backend.py'
-        ]
         output_dir = os.path.join(backend_dir, 'mac')
     elif system == 'Linux':
         executable_name = 'backend'
-        pyinstaller_command = [
-            sys.executable, '-m', 'PyInstaller',
-            '--onefile',
-            '--windowed',  # Added this option (optional for Linux)
-            '--name', executable_base_name,
-            'backend.py'
-        ]
         output_dir = os.path.join(backend_dir, 'linux')
     else:
         print('Unsupported platform:', system)
         return
 
+    # --onefile unpacks the whole bundle to a temp dir on every launch; --onedir ships the
+    # unpacked tree so the backend starts straight away
+    pyinstaller_command = [
+        sys.executable, '-m', 'PyInstaller',
+        f'--{mode}',
+        '--windowed',  # Added this option (optional for macOS and Linux)
+        '--name', executable_base_name,
+        'backend.py'
+    ]
+
     # Change to the backend directory
     os.chdir('backend')
 
@@ -51,16 +41,21 @@ def build_backend():
     # Run PyInstaller
     subprocess.run(pyinstaller_command, check=True)
 
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    # Start from an empty output directory so a previous build of the other mode cannot linger
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
 
-    # Move the executable to the appropriate dist folder
-    source_executable = os.path.join('dist', executable_name)
+    if mode == 'onedir':
+        # Move the executable together with its _internal directory; main.js still finds it
+        # at backend/<executable_name>
+        source_dir = os.path.join('dist', executable_base_name)
+        for name in os.listdir(source_dir):
+            os.replace(os.path.join(source_dir, name), os.path.join(output_dir, name))
+    else:
+        # Move the executable to the appropriate dist folder
+        os.replace(os.path.join('dist', executable_name), os.path.join(output_dir, executable_name))
     destination_executable = os.path.join(output_dir, executable_name)
-    if os.path.exists(destination_executable):
-        os.remove(destination_executable)
-    os.replace(source_executable, destination_executable)
 
     # Clean up build files
     spec_file_name = executable_base_name + '.spec'
@@ -72,7 +67,11 @@ def build_backend():
     if os.path.exists('dist'):
         shutil.rmtree('dist')
 
-    print(f'Backend built for {system} at {destination_executable}')
+    print(f'Backend built for {system} ({mode}) at {destination_executable}')
 
 if __name__ == '__main__':
-    build_backend()
+    parser = argparse.ArgumentParser(description='Build the backend executable with PyInstaller')
+    parser.add_argument('--onedir', action='store_const', const='onedir', dest='mode', default='onefile',
+                        help='Build an unpacked directory instead of a single self-extracting file (faster startup)')
+    args = parser.parse_args()
+    build_backend(args.mode)
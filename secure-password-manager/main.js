@@ -4,8 +4,22 @@ const { spawn } = require('child_process');
 const fs = require('fs');
 const isDev = require('electron-is-dev');
 
+let msgpack = null;
+try {
+  // Optional: binary framing is negotiated only when @msgpack/msgpack is installed
+  msgpack = require('@msgpack/msgpack');
+} catch (err) {
+  msgpack = null;
+}
+
 let pythonProcess;
-let commandQueue = [];
+// Requests awaiting a reply, keyed by the id echoed back by the backend
+const pendingRequests = new Map();
+let nextRequestId = 1;
+// Pipe framing: 'json' (newline-delimited) until the backend acknowledges 'msgpack'
+let framingMode = 'json';
+let stdoutBuffer = Buffer.alloc(0);
+let framingReady = Promise.resolve();
 let clipboardTimeout;
 
 const logFile = path.join(app.getPath('userData'), 'main.log');
@@ -104,23 +118,10 @@ function startPythonProcess(retryCount = 0) {
   });
 
   // Handle stdout data from the backend
-  pythonProcess.stdout.on('data', (data) => {
-    const messages = data.toString().split('\n').filter(line => line.trim());
-    messages.forEach(message => {
-      try {
-        const parsedResponse = JSON.parse(message);
-        if (commandQueue.length > 0) {
-          const { resolve } = commandQueue.shift();
-          resolve(parsedResponse);
-        } else {
-          log('Received response but commandQueue is empty');
-        }
-      } catch (err) {
-        log(`Error parsing Python response: ${err}`);
-        console.error('Error parsing Python response:', err);
-      }
-    });
-  });
+  framingMode = 'json';
+  stdoutBuffer = Buffer.alloc(0);
+  pythonProcess.stdout.on('data', handleStdoutChunk);
+  framingReady = negotiateFraming();
 
   // Handle stderr data from the backend
   pythonProcess.stderr.on('data', (data) => {
@@ -162,26 +163,167 @@ function startPythonProcess(retryCount = 0) {
   
   pythonProcess.on('exit', (code, signal) => {
     log(`Python process exited with code ${code} and signal ${signal}`);
+    // Nothing will answer outstanding requests any more
+    pendingRequests.forEach(({ reject }) => reject(new Error('Python process exited')));
+    pendingRequests.clear();
   });
   
   log('Python backend process started');
 }
 
+/**
+ * Reassembles complete messages from stdout chunks; a message may span several chunks.
+ * @param {Buffer} chunk - Raw bytes read from the backend's stdout.
+ */
+function handleStdoutChunk(chunk) {
+  stdoutBuffer = Buffer.concat([stdoutBuffer, chunk]);
+  for (;;) {
+    let decode;
+    if (framingMode === 'msgpack') {
+      if (stdoutBuffer.length < 4) break;
+      const length = stdoutBuffer.readUInt32BE(0);
+      if (stdoutBuffer.length < 4 + length) break;
+      const payload = stdoutBuffer.subarray(4, 4 + length);
+      decode = () => msgpack.decode(payload);
+      stdoutBuffer = stdoutBuffer.subarray(4 + length);
+    } else {
+      const newline = stdoutBuffer.indexOf(0x0a);
+      if (newline === -1) break;
+      const line = stdoutBuffer.subarray(0, newline).toString('utf8');
+      stdoutBuffer = stdoutBuffer.subarray(newline + 1);
+      if (!line.trim()) continue;
+      decode = () => JSON.parse(line);
+    }
+    // Handled synchronously so a framing switch applies to the very next bytes in the buffer
+    handleBackendMessage(decode);
+  }
+}
+
+/**
+ * Routes one decoded backend message to its pending request or to the progress listeners.
+ * @param {Function} decode - Returns the decoded message object.
+ */
+function handleBackendMessage(decode) {
+  try {
+    const { id, ...parsedResponse } = decode();
+    if (parsedResponse.progress) {
+      // Progress lines precede the final reply and must not settle the request
+      forwardProgress({ id, ...parsedResponse.progress });
+      return;
+    }
+    if (parsedResponse.event) {
+      // Unsolicited notices such as auto-lock carry no request id
+      forwardEvent(parsedResponse);
+      return;
+    }
+    if ((id === undefined || id === null) && parsedResponse.error) {
+      // The backend could not read a request well enough to echo its id. Fail every outstanding
+      // request now rather than leave the unreadable one waiting forever
+      log(`Backend rejected an unreadable request: ${parsedResponse.error}`);
+      pendingRequests.forEach(({ reject }) => reject(new Error(`Backend error: ${parsedResponse.error}`)));
+      pendingRequests.clear();
+      return;
+    }
+    if (parsedResponse.framing) {
+      framingMode = parsedResponse.framing;
+      log(`Backend IPC framing switched to ${framingMode}`);
+    }
+    const pending = pendingRequests.get(id);
+    if (pending) {
+      pendingRequests.delete(id);
+      pending.resolve(parsedResponse);
+    } else {
+      log(`Received response for unknown request id: ${id}`);
+    }
+  } catch (err) {
+    log(`Error parsing Python response: ${err}`);
+    console.error('Error parsing Python response:', err);
+  }
+}
+
+/**
+ * Encodes a request for the current framing mode.
+ * @param {object} request - The request object to send.
+ * @returns {Buffer|string} - The bytes to write to the backend's stdin.
+ */
+function encodeRequest(request) {
+  if (framingMode === 'msgpack') {
+    const payload = Buffer.from(msgpack.encode(request));
+    const header = Buffer.alloc(4);
+    header.writeUInt32BE(payload.length, 0);
+    return Buffer.concat([header, payload]);
+  }
+  return JSON.stringify(request) + '\n';
+}
+
+/**
+ * Asks the backend to switch to length-prefixed msgpack framing when available.
+ * Other commands wait on the returned promise so nothing is written mid-switch.
+ * Set SPM_IPC_FRAMING=json to keep newline-delimited JSON.
+ * @returns {Promise<void>}
+ */
+function negotiateFraming() {
+  if (!msgpack || process.env.SPM_IPC_FRAMING === 'json') {
+    return Promise.resolve();
+  }
+  return writeCommand('set_framing', { mode: 'msgpack' })
+    .then((response) => {
+      if (response.error) {
+        log(`Backend declined msgpack framing: ${response.error}`);
+      }
+    })
+    .catch((err) => log(`Framing negotiation failed: ${err}`));
+}
+
+/**
+ * Forwards unsolicited backend events (e.g. auto-lock) to every open window.
+ * @param {object} event - The event payload emitted by the backend.
+ */
+function forwardEvent(event) {
+  log(`Backend event: ${JSON.stringify(event)}`);
+  BrowserWindow.getAllWindows().forEach((win) => {
+    win.webContents.send('backend-event', event);
+  });
+}
+
+/**
+ * Forwards backend progress updates to every open window.
+ * @param {object} progress - The progress payload emitted by the backend.
+ */
+function forwardProgress(progress) {
+  log(`Backend progress: ${JSON.stringify(progress)}`);
+  BrowserWindow.getAllWindows().forEach((win) => {
+    win.webContents.send('backend-progress', progress);
+  });
+}
+
 /**
  * Sends commands to the Python backend process.
+ * Each request carries an id; replies may arrive in any order and are matched by that id.
  * @param {string} command - The command to send.
  * @param {object} data - The data associated with the command.
  * @returns {Promise<object>} - The response from the backend.
  */
 function sendCommandToPython(command, data) {
+  return framingReady.then(() => writeCommand(command, data));
+}
+
+/**
+ * Writes one request in the current framing and tracks it until its reply arrives.
+ * @param {string} command - The command to send.
+ * @param {object} data - The data associated with the command.
+ * @returns {Promise<object>} - The response from the backend.
+ */
+function writeCommand(command, data) {
   return new Promise((resolve, reject) => {
     if (!pythonProcess || pythonProcess.killed) {
       const errorMsg = 'Python process is not running';
-      log(`sendCommandToPython error: ${errorMsg}`);
+      log(`writeCommand error: ${errorMsg}`);
       return reject(new Error(errorMsg));
     }
 
-    const message = JSON.stringify({ command, data }) + '\n';
+    const id = nextRequestId++;
+    const message = encodeRequest({ id, command, data });
 
     // Special handling for shutdown command
     if (command === 'shutdown' || command === 'disable_mfa') {
@@ -197,11 +339,12 @@ function sendCommandToPython(command, data) {
       return;
     }
 
-    commandQueue.push({ resolve, reject });
+    pendingRequests.set(id, { resolve, reject });
 
     pythonProcess.stdin.write(message, (err) => {
       if (err) {
         log(`Failed to write to Python process stdin: ${err}`);
+        pendingRequests.delete(id);
         reject(err);
       } else {
         log(`Sent command to Python backend: ${command}`);
@@ -333,11 +476,81 @@ ipcMain.handle('delete-password', async (event, data) => {
   }
 });
 
-ipcMain.handle('get-passwords', async () => {
+ipcMain.handle('apply-batch', async (event, data) => {
+  try {
+    log('IPC: apply-batch invoked');
+    const response = await sendCommandToPython('apply_batch', data);
+    log(`IPC: apply-batch response: ${response.applied !== undefined ? `${response.applied} operations applied` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in apply-batch IPC handler: ${error}`);
+    console.error('Error in apply-batch IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to apply changes: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('rename-category', async (event, data) => {
+  try {
+    log('IPC: rename-category invoked');
+    const response = await sendCommandToPython('rename_category', data);
+    log(`IPC: rename-category response: ${response.applied !== undefined ? `${response.applied} operations applied` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in rename-category IPC handler: ${error}`);
+    console.error('Error in rename-category IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to rename category: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('delete-category', async (event, data) => {
+  try {
+    log('IPC: delete-category invoked');
+    const response = await sendCommandToPython('delete_category', data);
+    log(`IPC: delete-category response: ${response.applied !== undefined ? `${response.applied} operations applied` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in delete-category IPC handler: ${error}`);
+    console.error('Error in delete-category IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to delete category: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('audit-breaches', async (event, data) => {
+  try {
+    log('IPC: audit-breaches invoked');
+    const response = await sendCommandToPython('audit_breaches', data);
+    log(`IPC: audit-breaches response: ${response.breached ? `${response.breached.length} of ${response.audited} entries breached` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in audit-breaches IPC handler: ${error}`);
+    console.error('Error in audit-breaches IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to check for breached passwords: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('audit-vault', async (event, data) => {
+  try {
+    log('IPC: audit-vault invoked');
+    const response = await sendCommandToPython('audit_vault', data);
+    log(`IPC: audit-vault response: ${response.reused ? `${response.reused.length} reuse groups, ${response.weak.length} weak of ${response.audited} entries` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in audit-vault IPC handler: ${error}`);
+    console.error('Error in audit-vault IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to audit vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('get-passwords', async (event, params = {}) => {
   try {
     log('IPC: get-passwords invoked');
-    const response = await sendCommandToPython('get_passwords', {});
-    log(`IPC: get-passwords response: ${JSON.stringify(response)}`);
+    const response = await sendCommandToPython('get_passwords', params);
+    log(`IPC: get-passwords response: ${response.passwords ? `${response.passwords.length} entries` : JSON.stringify(response)}`);
     return response;
   } catch (error) {
     log(`Error in get-passwords IPC handler: ${error}`);
@@ -347,6 +560,289 @@ ipcMain.handle('get-passwords', async () => {
   }
 });
 
+ipcMain.handle('list-entries', async (event, params = {}) => {
+  try {
+    log('IPC: list-entries invoked');
+    const response = await sendCommandToPython('list_entries', params);
+    log(`IPC: list-entries response: ${response.entries ? `${response.entries.length} entries` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in list-entries IPC handler: ${error}`);
+    console.error('Error in list-entries IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to list entries: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('get-changes', async (event, data) => {
+  try {
+    log('IPC: get-changes invoked');
+    const response = await sendCommandToPython('get_changes_since', data);
+    log(`IPC: get-changes response: ${response.changes ? `${response.changes.length} changes, seq ${response.seq}` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in get-changes IPC handler: ${error}`);
+    console.error('Error in get-changes IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to load changes: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('reveal-password', async (event, data) => {
+  try {
+    log('IPC: reveal-password invoked');
+    const response = await sendCommandToPython('reveal_password', data);
+    // Never log the revealed secret
+    log(`IPC: reveal-password ${response.error ? `error: ${response.error}` : 'succeeded'}`);
+    return response;
+  } catch (error) {
+    log(`Error in reveal-password IPC handler: ${error}`);
+    console.error('Error in reveal-password IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to reveal password: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('get-history', async (event, data) => {
+  try {
+    log('IPC: get-history invoked');
+    const response = await sendCommandToPython('get_history', data);
+    // The history holds old secrets: log only how many versions came back
+    log(`IPC: get-history ${response.history ? `returned ${response.history.length} versions` : `error: ${response.error}`}`);
+    return response;
+  } catch (error) {
+    log(`Error in get-history IPC handler: ${error}`);
+    console.error('Error in get-history IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to load password history: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('import-entries', async (event, data) => {
+  try {
+    log('IPC: import-entries invoked');
+    const response = await sendCommandToPython('import_entries', data);
+    log(`IPC: import-entries response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in import-entries IPC handler: ${error}`);
+    console.error('Error in import-entries IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to import entries: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('export-vault', async (event, data) => {
+  try {
+    log('IPC: export-vault invoked');
+    const response = await sendCommandToPython('export_vault', data);
+    log(`IPC: export-vault response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in export-vault IPC handler: ${error}`);
+    console.error('Error in export-vault IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to export vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('restore-vault', async (event, data) => {
+  try {
+    log('IPC: restore-vault invoked');
+    const response = await sendCommandToPython('restore_vault', data);
+    log(`IPC: restore-vault response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in restore-vault IPC handler: ${error}`);
+    console.error('Error in restore-vault IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to restore vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('lock', async (event, data) => {
+  try {
+    log('IPC: lock invoked');
+    const response = await sendCommandToPython('lock', data);
+    log(`IPC: lock response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in lock IPC handler: ${error}`);
+    console.error('Error in lock IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to lock the vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('set-pin', async (event, data) => {
+  try {
+    log('IPC: set-pin invoked');
+    const response = await sendCommandToPython('set_pin', data);
+    log(`IPC: set-pin response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in set-pin IPC handler: ${error}`);
+    console.error('Error in set-pin IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to set the unlock PIN: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('unlock-with-pin', async (event, data) => {
+  try {
+    log('IPC: unlock-with-pin invoked');
+    const response = await sendCommandToPython('unlock_with_pin', data);
+    log(`IPC: unlock-with-pin response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in unlock-with-pin IPC handler: ${error}`);
+    console.error('Error in unlock-with-pin IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to unlock with PIN: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('set-auto-lock', async (event, data) => {
+  try {
+    log('IPC: set-auto-lock invoked');
+    const response = await sendCommandToPython('set_auto_lock', data);
+    log(`IPC: set-auto-lock response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in set-auto-lock IPC handler: ${error}`);
+    console.error('Error in set-auto-lock IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to update auto-lock: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('calibrate-kdf', async (event, data) => {
+  try {
+    log('IPC: calibrate-kdf invoked');
+    const response = await sendCommandToPython('calibrate_kdf', data);
+    log(`IPC: calibrate-kdf response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in calibrate-kdf IPC handler: ${error}`);
+    console.error('Error in calibrate-kdf IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to calibrate key derivation: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('set-kdf-params', async (event, data) => {
+  try {
+    log('IPC: set-kdf-params invoked');
+    const response = await sendCommandToPython('set_kdf_params', data);
+    log(`IPC: set-kdf-params response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in set-kdf-params IPC handler: ${error}`);
+    console.error('Error in set-kdf-params IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to update key derivation settings: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('get-metrics', async (event, data) => {
+  try {
+    log('IPC: get-metrics invoked');
+    const response = await sendCommandToPython('get_metrics', data);
+    log(`IPC: get-metrics response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in get-metrics IPC handler: ${error}`);
+    console.error('Error in get-metrics IPC handler:', error);
+    throw error;
+  }
+});
+
+ipcMain.handle('search', async (event, data) => {
+  try {
+    log('IPC: search invoked');
+    const response = await sendCommandToPython('search', data);
+    log(`IPC: search response: ${response.results ? `${response.results.length} results across vaults` : response.ids ? `${response.ids.length} results` : JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in search IPC handler: ${error}`);
+    console.error('Error in search IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to search entries: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('open-vault', async (event, data) => {
+  try {
+    log(`IPC: open-vault invoked for ${data && data.name}`);
+    // data carries the vault's master password: never log it
+    const response = await sendCommandToPython('open_vault', data);
+    log(`IPC: open-vault response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in open-vault IPC handler: ${error}`);
+    console.error('Error in open-vault IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to open vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('close-vault', async (event, data) => {
+  try {
+    log('IPC: close-vault invoked');
+    const response = await sendCommandToPython('close_vault', data);
+    log(`IPC: close-vault response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in close-vault IPC handler: ${error}`);
+    console.error('Error in close-vault IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to close vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('list-vaults', async () => {
+  try {
+    log('IPC: list-vaults invoked');
+    const response = await sendCommandToPython('list_vaults', {});
+    log(`IPC: list-vaults response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in list-vaults IPC handler: ${error}`);
+    console.error('Error in list-vaults IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to list vaults: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('sync-vault', async (event, data) => {
+  try {
+    log('IPC: sync-vault invoked');
+    const response = await sendCommandToPython('sync_vault', data);
+    log(`IPC: sync-vault response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in sync-vault IPC handler: ${error}`);
+    console.error('Error in sync-vault IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to sync vault: ${error.message}`);
+    throw error;
+  }
+});
+
+ipcMain.handle('serve-sync', async (event, data) => {
+  try {
+    log('IPC: serve-sync invoked');
+    // Resolves once the peer has finished; the listening port arrives earlier as a backend-progress event
+    const response = await sendCommandToPython('serve_sync', data);
+    log(`IPC: serve-sync response: ${JSON.stringify(response)}`);
+    return response;
+  } catch (error) {
+    log(`Error in serve-sync IPC handler: ${error}`);
+    console.error('Error in serve-sync IPC handler:', error);
+    dialog.showErrorBox('Error', `Failed to serve vault sync: ${error.message}`);
+    throw error;
+  }
+});
+
 ipcMain.handle('is-master-password-set', async () => {
   try {
     log('IPC: is-master-password-set invoked');
@@ -365,7 +861,7 @@ ipcMain.handle('setup-mfa', async () => {
   try {
     log('IPC: setup-mfa invoked');
     const response = await sendCommandToPython('setup_mfa', {});
-    log(`IPC: setup-mfa response: ${JSON.stringify(response)}`);
+    log(`IPC: setup-mfa response: ${response.status || JSON.stringify(response)}`);
     return response;
   } catch (error) {
     log(`Error in setup-mfa IPC handler: ${error}`);
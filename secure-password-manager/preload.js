@@ -2,10 +2,37 @@ const { contextBridge, ipcRenderer } = require('electron');
 
 contextBridge.exposeInMainWorld('electronAPI', {
   setMasterPassword: (password) => ipcRenderer.invoke('set-master-password', password),
+  lock: (data) => ipcRenderer.invoke('lock', data),
+  setPin: (data) => ipcRenderer.invoke('set-pin', data),
+  unlockWithPin: (data) => ipcRenderer.invoke('unlock-with-pin', data),
+  setAutoLock: (data) => ipcRenderer.invoke('set-auto-lock', data),
   addPassword: (data) => ipcRenderer.invoke('add-password', data),
   updatePassword: (data) => ipcRenderer.invoke('update-password', data),
   deletePassword: (data) => ipcRenderer.invoke('delete-password', data),
-  getPasswords: () => ipcRenderer.invoke('get-passwords'),
+  applyBatch: (data) => ipcRenderer.invoke('apply-batch', data),
+  renameCategory: (data) => ipcRenderer.invoke('rename-category', data),
+  deleteCategory: (data) => ipcRenderer.invoke('delete-category', data),
+  getPasswords: (params) => ipcRenderer.invoke('get-passwords', params),
+  listEntries: (params) => ipcRenderer.invoke('list-entries', params),
+  revealPassword: (data) => ipcRenderer.invoke('reveal-password', data),
+  getHistory: (data) => ipcRenderer.invoke('get-history', data),
+  getChanges: (data) => ipcRenderer.invoke('get-changes', data),
+  importEntries: (data) => ipcRenderer.invoke('import-entries', data),
+  search: (data) => ipcRenderer.invoke('search', data),
+  openVault: (data) => ipcRenderer.invoke('open-vault', data),
+  closeVault: (data) => ipcRenderer.invoke('close-vault', data),
+  listVaults: () => ipcRenderer.invoke('list-vaults'),
+  syncVault: (data) => ipcRenderer.invoke('sync-vault', data),
+  serveSync: (data) => ipcRenderer.invoke('serve-sync', data),
+  auditBreaches: (data) => ipcRenderer.invoke('audit-breaches', data),
+  auditVault: (data) => ipcRenderer.invoke('audit-vault', data),
+  getMetrics: (data) => ipcRenderer.invoke('get-metrics', data),
+  calibrateKdf: (data) => ipcRenderer.invoke('calibrate-kdf', data),
+  setKdfParams: (data) => ipcRenderer.invoke('set-kdf-params', data),
+  exportVault: (data) => ipcRenderer.invoke('export-vault', data),
+  restoreVault: (data) => ipcRenderer.invoke('restore-vault', data),
+  onBackendProgress: (callback) => ipcRenderer.on('backend-progress', (event, progress) => callback(progress)),
+  onBackendEvent: (callback) => ipcRenderer.on('backend-event', (event, payload) => callback(payload)),
   isMasterPasswordSet: () => ipcRenderer.invoke('is-master-password-set'),
   setupMFA: () => ipcRenderer.invoke('setup-mfa'),
   verifyMFA: (token) => ipcRenderer.invoke('verify-mfa', token),
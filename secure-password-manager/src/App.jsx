@@ -1,6 +1,6 @@
 // src/App.jsx
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Snackbar,
   Alert,
@@ -32,6 +32,8 @@ function App() {
   const [qrCode, setQRCode] = useState(null);
   const [isEditing, setIsEditing] = useState(false);
   const [editEntryId, setEditEntryId] = useState(null);
+  // Change-feed position of the loaded entries; mutations pull only what changed after it
+  const changeSeq = useRef(null);
 
   // Snackbar state
   const [snackbarMessage, setSnackbarMessage] = useState('');
@@ -49,6 +51,7 @@ function App() {
   const [isMFASetUp, setIsMFASetUp] = useState(false);
 
   const MFA_ENABLED = true; // Set to false to disable MFA globally
+  const PAGE_SIZE = 500; // Entries per backend response, keeps each IPC message bounded
 
   useEffect(() => {
     async function checkMasterPassword() {
@@ -62,8 +65,56 @@ function App() {
     checkMasterPassword();
   }, []);
 
-  const handleCopyPassword = async (password) => {
+  useEffect(() => {
+    // The backend drops its key after an idle timeout; return to the login screen when it does
+    window.electronAPI.onBackendEvent((event) => {
+      if (event.event === 'locked') {
+        setIsAuthenticated(false);
+        setPasswords([]);
+        setMasterPassword('');
+        setMFAToken('');
+        changeSeq.current = null;
+        setErrorMessage('Vault locked after inactivity.');
+      }
+    });
+  }, []);
+
+  const handleRevealPassword = async (entryId) => {
+    try {
+      const response = await window.electronAPI.revealPassword({ id: entryId });
+      if (response.error) {
+        alert(response.error);
+        return null;
+      }
+      return response.password;
+    } catch (error) {
+      console.error('Error revealing password:', error);
+      setErrorMessage('An error occurred. Please try again.');
+      return null;
+    }
+  };
+
+  const handleSearch = async (query) => {
     try {
+      const response = await window.electronAPI.search({ query, limit: passwords.length || 50 });
+      if (response.error) {
+        setErrorMessage(response.error);
+        return [];
+      }
+      return response.ids;
+    } catch (error) {
+      console.error('Error searching entries:', error);
+      setErrorMessage('An error occurred. Please try again.');
+      return [];
+    }
+  };
+
+  const handleCopyPassword = async (entryId) => {
+    try {
+      const password = await handleRevealPassword(entryId);
+      if (password === null) {
+        return;
+      }
       const response = await window.electronAPI.copyToClipboard(password);
       if (response.status === 'success') {
         setSnackbarMessage('Password copied to clipboard. It will be cleared in 15 seconds.');
@@ -166,14 +217,66 @@ function App() {
 
   const fetchPasswords = async () => {
     try {
-      const response = await window.electronAPI.getPasswords();
-      if (response.passwords) {
-        setPasswords(response.passwords);
-      } else if (response.error) {
+      // Metadata only; secrets are decrypted on demand via revealPassword
+      const entries = [];
+      let cursor = null;
+      let seq = null;
+      do {
+        const response = await window.electronAPI.listEntries({
+          limit: PAGE_SIZE,
+          cursor,
+          order_by: 'site',
+        });
+        if (response.error) {
+          alert(response.error);
+          return;
+        }
+        if (cursor === null) {
+          seq = response.seq;
+        }
+        entries.push(...response.entries);
+        cursor = response.next_cursor;
+      } while (cursor !== null);
+      changeSeq.current = seq;
+      setPasswords(entries);
+    } catch (error) {
+      console.error('Error fetching passwords:', error);
+      setErrorMessage('An error occurred. Please try again.');
+    }
+  };
+
+  const compareEntries = (a, b) =>
+    a.site.localeCompare(b.site, undefined, { sensitivity: 'accent' }) || a.id - b.id;
+
+  const applyChanges = async () => {
+    try {
+      const response = await window.electronAPI.getChanges({ seq: changeSeq.current });
+      if (response.error) {
         alert(response.error);
+        return;
       }
+      if (response.reset) {
+        // The backend no longer holds changes that far back
+        fetchPasswords();
+        return;
+      }
+      changeSeq.current = response.seq;
+      if (response.changes.length === 0) {
+        return;
+      }
+      setPasswords((current) => {
+        const byId = new Map(current.map((entry) => [entry.id, entry]));
+        response.changes.forEach(({ op, ...entry }) => {
+          if (op === 'delete') {
+            byId.delete(entry.id);
+          } else {
+            byId.set(entry.id, entry);
+          }
+        });
+        return [...byId.values()].sort(compareEntries);
+      });
     } catch (error) {
-      console.error('Error fetching passwords:', error);
+      console.error('Error applying changes:', error);
       setErrorMessage('An error occurred. Please try again.');
     }
   };
@@ -183,7 +286,7 @@ function App() {
     try {
       const response = await window.electronAPI.addPassword(form);
       if (response.status === 'Password added') {
-        fetchPasswords();
+        applyChanges();
         setForm({ site: '', username: '', password: '', notes: '', category: '' });
         setSnackbarMessage('Password added successfully.');
         setSnackbarOpen(true);
@@ -196,13 +299,17 @@ function App() {
     }
   };
 
-  const handleEditPassword = (entry) => {
+  const handleEditPassword = async (entry) => {
+    const password = await handleRevealPassword(entry.id);
+    if (password === null) {
+      return;
+    }
     setIsEditing(true);
     setEditEntryId(entry.id);
     setForm({
       site: entry.site,
       username: entry.username,
-      password: entry.password,
+      password,
       notes: entry.notes || '',
       category: entry.category || '',
     });
@@ -217,7 +324,7 @@ function App() {
         ...form,
       });
       if (response.status === 'Password updated') {
-        fetchPasswords();
+        applyChanges();
         setForm({ site: '', username: '', password: '', notes: '', category: '' });
         setIsEditing(false);
         setEditEntryId(null);
@@ -237,7 +344,7 @@ function App() {
       try {
         const response = await window.electronAPI.deletePassword({ id: entryId });
         if (response.status === 'Password deleted') {
-          fetchPasswords();
+          applyChanges();
           setSnackbarMessage('Password deleted successfully.');
           setSnackbarOpen(true);
         } else {
@@ -314,6 +421,8 @@ function App() {
         <PasswordList
           passwords={passwords}
           handleCopyPassword={handleCopyPassword}
+          handleRevealPassword={handleRevealPassword}
+          handleSearch={handleSearch}
           handleEditPassword={handleEditPassword}
           handleDeletePassword={handleDeletePassword}
           categories={categories}
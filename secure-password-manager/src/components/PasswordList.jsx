@@ -1,6 +1,6 @@
 // src/components/PasswordList.jsx
 
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import {
   TextField,
   InputLabel,
@@ -25,19 +25,73 @@ import {
 function PasswordList({
   passwords,
   handleCopyPassword,
+  handleRevealPassword,
+  handleSearch,
   handleEditPassword,
   handleDeletePassword,
   categories,
 }) {
   const [searchQuery, setSearchQuery] = useState('');
-  const [showPasswords, setShowPasswords] = useState(false);
+  // Plaintexts for entries the user chose to reveal, keyed by entry id, each with the entry object
+  // it was revealed for. Edits and change-feed updates replace that object, so a stale plaintext
+  // is never shown for a changed row
+  const [revealedPasswords, setRevealedPasswords] = useState({});
 
-  // Filtered Passwords based on searchQuery
-  const filteredPasswords = passwords.filter((entry) =>
-    entry.site.toLowerCase().includes(searchQuery.toLowerCase()) ||
-    entry.username.toLowerCase().includes(searchQuery.toLowerCase()) ||
-    (entry.category && entry.category.toLowerCase().includes(searchQuery.toLowerCase()))
-  );
+  const revealedFor = (entry) => {
+    const revealed = revealedPasswords[entry.id];
+    return revealed && revealed.entry === entry ? revealed.password : null;
+  };
+
+  const toggleReveal = async (entry) => {
+    if (revealedFor(entry) !== null) {
+      const { [entry.id]: _hidden, ...rest } = revealedPasswords;
+      setRevealedPasswords(rest);
+      return;
+    }
+    const password = await handleRevealPassword(entry.id);
+    if (password !== null) {
+      setRevealedPasswords((prev) => ({ ...prev, [entry.id]: { entry, password } }));
+    }
+  };
+
+  // Forget plaintexts for rows that changed or went away; locking empties the list, and with it this
+  useEffect(() => {
+    setRevealedPasswords((prev) => {
+      const current = new Map(passwords.map((entry) => [entry.id, entry]));
+      const kept = Object.fromEntries(
+        Object.entries(prev).filter(([id, revealed]) => current.get(Number(id)) === revealed.entry),
+      );
+      return Object.keys(kept).length === Object.keys(prev).length ? prev : kept;
+    });
+  }, [passwords]);
+
+  // Ranked ids from the backend search index; null means no active search
+  const [matchIds, setMatchIds] = useState(null);
+
+  useEffect(() => {
+    if (!searchQuery.trim()) {
+      setMatchIds(null);
+      return undefined;
+    }
+    let cancelled = false;
+    // Debounce keystrokes so only the settled query hits the backend
+    const timer = setTimeout(async () => {
+      const ids = await handleSearch(searchQuery);
+      if (!cancelled) {
+        setMatchIds(ids);
+      }
+    }, 150);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery, passwords]);
+
+  // Filtered Passwords based on searchQuery, in search rank order
+  const entriesById = new Map(passwords.map((entry) => [entry.id, entry]));
+  const filteredPasswords = matchIds === null
+    ? passwords
+    : matchIds.map((id) => entriesById.get(id)).filter(Boolean);
 
   return (
     <Grid2 container spacing={1} sx={{ padding: 2 }}>
@@ -85,12 +139,12 @@ function PasswordList({
                   </Typography>
                   <Typography variant="body2">
                     <strong>Password:</strong>{' '}
-                    {showPasswords ? entry.password : '•'.repeat(8)}
+                    {revealedFor(entry) ?? '•'.repeat(8)}
                     <IconButton
-                      onClick={() => setShowPasswords(!showPasswords)}
+                      onClick={() => toggleReveal(entry)}
                       size="small"
                     >
-                      {showPasswords ? <VisibilityOff fontSize="small" /> : <Visibility fontSize="small" />}
+                      {revealedFor(entry) !== null ? <VisibilityOff fontSize="small" /> : <Visibility fontSize="small" />}
                     </IconButton>
                   </Typography>
                   {entry.category && (
@@ -106,7 +160,7 @@ function PasswordList({
                 </CardContent>
                 <CardActions disableSpacing>
                   <IconButton
-                    onClick={() => handleCopyPassword(entry.password)}
+                    onClick={() => handleCopyPassword(entry.id)}
                     color="primary"
                     size="small"
                   >
@@ -7,16 +7,20 @@ TEST_DB_FILE = 'test_passwords.db'
 TEST_SALT_FILE = 'test_salt.bin'
 TEST_MASTER_PASSWORD_FILE = 'test_master_password.bin'
 TEST_TOTP_SECRET_FILE = 'test_totp_secret.bin'
+TEST_FILES = [
+    TEST_DB_FILE, TEST_DB_FILE + '-wal', TEST_DB_FILE + '-shm',
+    TEST_SALT_FILE, TEST_MASTER_PASSWORD_FILE, TEST_TOTP_SECRET_FILE, TEST_TOTP_SECRET_FILE + '.rekey',
+]
 
 @pytest.fixture(scope='function', autouse=True)
 def cleanup_files():
     # Before each test, remove any test files if they exist
-    for f in [TEST_DB_FILE, TEST_SALT_FILE, TEST_MASTER_PASSWORD_FILE, TEST_TOTP_SECRET_FILE]:
+    for f in TEST_FILES:
         if os.path.exists(f):
             os.remove(f)
     yield
     # After the test, ensure cleanup again
-    for f in [TEST_DB_FILE, TEST_SALT_FILE, TEST_MASTER_PASSWORD_FILE, TEST_TOTP_SECRET_FILE]:
+    for f in TEST_FILES:
         if os.path.exists(f):
             os.remove(f)
 
@@ -27,3 +31,8 @@ def mock_paths(monkeypatch):
     monkeypatch.setattr('backend.backend.MASTER_PASSWORD_FILE', TEST_MASTER_PASSWORD_FILE)
     monkeypatch.setattr('backend.backend.TOTP_SECRET_FILE', TEST_TOTP_SECRET_FILE)
     yield
+    # Release the shared connection and cached plaintexts so the next test starts from a fresh file
+    from backend.backend import close_db, close_vaults, clear_entry_cache
+    close_vaults()
+    clear_entry_cache()
+    close_db()
@@ -1,4 +1,5 @@
 # tests/test_auth.py
+import json
 import pytest
 from backend.backend import hash_master_password, verify_master_password, get_master_key
 
@@ -21,3 +22,128 @@ def test_get_master_key(mock_paths):
     key = get_master_key(password)
     assert key is not None
     assert len(key) == 32  # Argon2 derived key length
+
+def count_kdf_calls(monkeypatch):
+    import backend.backend as backend
+    calls = []
+    original = backend.hash_secret_raw
+    def counting_kdf(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(backend, 'hash_secret_raw', counting_kdf)
+    return calls
+
+def test_set_and_unlock_run_one_kdf_each(mock_paths, monkeypatch):
+    calls = count_kdf_calls(monkeypatch)
+    master_key = hash_master_password("MySuperSecret")
+    assert len(calls) == 1
+
+    success, unlocked_key = verify_master_password("MySuperSecret")
+    assert success is True
+    assert unlocked_key == master_key
+    assert len(calls) == 2
+
+def test_verifier_stores_no_password_hash(mock_paths):
+    hash_master_password("MySuperSecret")
+    with open('test_master_password.bin') as f:
+        stored = json.load(f)
+    assert set(stored) == {"version", "kdf", "key_check"}
+    assert "$argon2" not in stored["key_check"]
+
+def test_legacy_verifier_is_upgraded(mock_paths):
+    from backend.backend import ph
+    with open('test_master_password.bin', 'w') as f:
+        f.write(ph.hash("MySuperSecret"))
+
+    success, master_key = verify_master_password("MySuperSecret")
+    assert success is True
+    assert master_key == get_master_key("MySuperSecret")
+    with open('test_master_password.bin') as f:
+        assert json.load(f)["kdf"]["time_cost"] == 2
+
+    assert verify_master_password("WrongPassword") == (False, None)
+    assert verify_master_password("MySuperSecret")[0] is True
+
+def test_kcv1_verifier_is_upgraded(mock_paths):
+    from backend.backend import KEY_CHECK_AAD, KEY_CHECK_VALUE, _seal
+    import base64
+    master_key = get_master_key("MySuperSecret")
+    with open('test_master_password.bin', 'w') as f:
+        f.write("kcv1:" + base64.b64encode(_seal(master_key, KEY_CHECK_VALUE, aad=KEY_CHECK_AAD)).decode())
+
+    assert verify_master_password("MySuperSecret") == (True, master_key)
+    with open('test_master_password.bin') as f:
+        assert json.load(f)["version"] == 2
+    assert verify_master_password("MySuperSecret") == (True, master_key)
+
+SMALL_KDF_PARAMS = {'time_cost': 1, 'memory_cost': 8192, 'parallelism': 1}
+
+def test_hash_master_password_records_kdf_params(mock_paths):
+    master_key = hash_master_password("MySuperSecret", SMALL_KDF_PARAMS)
+    with open('test_master_password.bin') as f:
+        kdf = json.load(f)["kdf"]
+    assert kdf["memory_cost"] == 8192
+    assert kdf["parallelism"] == 1
+    assert verify_master_password("MySuperSecret") == (True, master_key)
+
+def test_rekey_keeps_entries_and_totp(mock_paths):
+    from backend.backend import (init_db, add_password, get_passwords, get_vault_key,
+                                 rekey_master_key, store_totp_secret, load_totp_secret)
+    old_key = hash_master_password("MySuperSecret")
+    init_db(old_key)
+    add_password(old_key, "example.com", "user", "pw", "")
+    store_totp_secret(old_key, "JBSWY3DPEHPK3PXP")
+
+    new_key = rekey_master_key(old_key, "MySuperSecret", SMALL_KDF_PARAMS)
+    assert new_key is not None and new_key != old_key
+    assert verify_master_password("MySuperSecret") == (True, new_key)
+    assert get_passwords(new_key)[0]["password"] == "pw"
+    assert load_totp_secret(new_key) == "JBSWY3DPEHPK3PXP"
+    assert get_vault_key(old_key) is None
+
+def test_rekey_interrupted_after_verifier_swap_keeps_totp(mock_paths, monkeypatch):
+    import os
+    import backend.backend as backend
+    from backend.backend import init_db, get_vault_key, rekey_master_key, store_totp_secret, load_totp_secret
+    old_key = hash_master_password("MySuperSecret")
+    init_db(old_key)
+    store_totp_secret(old_key, "JBSWY3DPEHPK3PXP")
+    store_key_check = backend.store_key_check
+
+    def crash_after_verifier_swap(master_key, kdf_header):
+        store_key_check(master_key, kdf_header)
+        raise OSError('simulated crash')
+
+    monkeypatch.setattr(backend, 'store_key_check', crash_after_verifier_swap)
+    assert rekey_master_key(old_key, "MySuperSecret", SMALL_KDF_PARAMS) is None
+    success, new_key = verify_master_password("MySuperSecret")
+    assert success and new_key != old_key
+    assert get_vault_key(new_key) is not None
+    assert load_totp_secret(new_key) == "JBSWY3DPEHPK3PXP"
+    assert not os.path.exists('test_totp_secret.bin.rekey')
+
+def test_calibrate_kdf_params(mock_paths):
+    from backend.backend import calibrate_kdf_params, KDF_MIN_TIME_COST, KDF_MAX_TIME_COST
+    params = calibrate_kdf_params(target_seconds=0.05, memory_cost=8192)
+    assert KDF_MIN_TIME_COST <= params["time_cost"] <= KDF_MAX_TIME_COST
+    assert params["memory_cost"] == 8192
+    assert params["parallelism"] >= 1
+
+def test_check_kdf_params_enforces_floors_and_fixed_fields():
+    from backend.backend import check_kdf_params
+    checked = check_kdf_params({'time_cost': 3, 'memory_cost': 65536, 'parallelism': 2})
+    assert checked == {'params': {'algorithm': 'argon2id', 'hash_len': 32,
+                                  'time_cost': 3, 'memory_cost': 65536, 'parallelism': 2}}
+    for params in ({'time_cost': 1}, {'memory_cost': 8192}, {'parallelism': 0}, {'time_cost': '3'},
+                   {'time_cost': True}, {'hash_len': 4}, {'algorithm': 'argon2i'}, [3]):
+        assert 'error' in check_kdf_params(params)
+
+def test_set_kdf_params_rejects_weak_params(mock_paths):
+    from backend.backend import handle_command, new_session, set_session_key
+    session = new_session()
+    master_key = hash_master_password("MySuperSecret")
+    set_session_key(session, master_key)
+    response = handle_command(session, 'set_kdf_params', {'master_password': "MySuperSecret",
+                                                          'params': {'time_cost': 1, 'memory_cost': 8}}, None)
+    assert 'error' in response
+    assert verify_master_password("MySuperSecret") == (True, master_key)
@@ -0,0 +1,127 @@
+# tests/test_backup.py
+import pytest
+import os
+from backend.backend import (
+    init_db,
+    get_master_key,
+    add_password,
+    get_passwords,
+    delete_password,
+    export_vault,
+    restore_vault,
+    hash_master_password,
+    close_db,
+    list_entries,
+)
+
+def fill_vault(master_key, count):
+    for i in range(count):
+        add_password(master_key, f"site{i}.com", "user", f"pass{i}", notes=f"n{i}", category="c")
+
+def test_export_and_restore_roundtrip(mock_paths, monkeypatch, tmp_path):
+    monkeypatch.setattr('backend.backend.BACKUP_FRAME_ROWS', 2)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    fill_vault(master_key, 5)
+    backup = str(tmp_path / "vault.bak")
+
+    assert export_vault(master_key, backup) == {"entries": 5, "frames": 3}
+    with open(backup, 'rb') as f:
+        assert b"pass0" not in f.read()
+
+    for p in get_passwords(master_key):
+        delete_password(p['id'])
+    progress = []
+    assert restore_vault(master_key, backup, progress_callback=progress.append) == {"entries": 5, "frames": 3}
+    assert progress == [2, 4, 5]
+    assert [p['password'] for p in get_passwords(master_key)] == [f"pass{i}" for i in range(5)]
+
+def test_restore_replace(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    fill_vault(master_key, 2)
+    backup = str(tmp_path / "vault.bak")
+    export_vault(master_key, backup)
+    add_password(master_key, "extra.com", "user", "extra")
+
+    restore_vault(master_key, backup, replace=True)
+    assert [p['site'] for p in get_passwords(master_key)] == ["site0.com", "site1.com"]
+
+def test_restore_rejects_tampered_frame(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    fill_vault(master_key, 3)
+    backup = tmp_path / "vault.bak"
+    export_vault(master_key, str(backup))
+    data = bytearray(backup.read_bytes())
+    data[-40] ^= 0x01  # Flip a bit inside the closing frame
+    backup.write_bytes(bytes(data))
+
+    assert restore_vault(master_key, str(backup)) is None
+    assert len(get_passwords(master_key)) == 3  # Nothing half-restored
+
+def test_restore_rejects_truncated_backup(mock_paths, monkeypatch, tmp_path):
+    monkeypatch.setattr('backend.backend.BACKUP_FRAME_ROWS', 1)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    fill_vault(master_key, 3)
+    backup = tmp_path / "vault.bak"
+    export_vault(master_key, str(backup))
+    data = backup.read_bytes()
+    # Drop the closing frame (4-byte length + nonce, tag and "[]")
+    backup.write_bytes(data[:-(4 + 12 + 16 + 2)])
+
+    assert restore_vault(master_key, str(backup), replace=True) is None
+    assert len(get_passwords(master_key)) == 3
+
+def test_restore_rejects_data_after_final_frame(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    fill_vault(master_key, 2)
+    backup = tmp_path / "vault.bak"
+    export_vault(master_key, str(backup))
+    data = backup.read_bytes()
+
+    backup.write_bytes(data + b"junk")
+    assert restore_vault(master_key, str(backup), replace=True) is None
+    # A second backup concatenated after the first is rejected as well
+    backup.write_bytes(data + data)
+    assert restore_vault(master_key, str(backup)) is None
+    assert len(get_passwords(master_key)) == 2
+
+def test_restore_with_wrong_master_key(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    fill_vault(master_key, 1)
+    backup = str(tmp_path / "vault.bak")
+    export_vault(master_key, backup)
+
+    assert restore_vault(get_master_key("OtherPass"), backup) is None
+
+def test_restore_on_fresh_install_with_backup_password(mock_paths, tmp_path):
+    master_key = hash_master_password("MasterPass")
+    init_db(master_key)
+    fill_vault(master_key, 2)
+    backup = str(tmp_path / "vault.bak")
+    export_vault(master_key, backup)
+
+    # A new vault with its own salt and master password
+    close_db()
+    for name in os.listdir('.'):
+        if name.startswith(('test_passwords.db', 'test_master_password.bin')):
+            os.remove(name)
+    new_key = hash_master_password("NewPass")
+    init_db(new_key)
+
+    assert restore_vault(new_key, backup) is None
+    assert restore_vault(new_key, backup, password="WrongPass") is None
+    assert restore_vault(new_key, backup, password="MasterPass") == {"entries": 2, "frames": 1}
+    assert [p['password'] for p in get_passwords(new_key)] == ["pass0", "pass1"]
+
+def test_backup_rejects_missing_path(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    assert export_vault(master_key, None) is None
+    assert export_vault(master_key, "") is None
+    assert restore_vault(master_key, None) is None
+    assert not any(name.endswith('.tmp') for name in os.listdir('.'))
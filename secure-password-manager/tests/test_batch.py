@@ -0,0 +1,112 @@
+# tests/test_batch.py
+import pytest
+import backend.backend as backend
+from backend.backend import (
+    init_db,
+    get_master_key,
+    add_password,
+    get_passwords,
+    list_entries,
+    apply_batch,
+    rename_category,
+    delete_category,
+)
+
+def seed(master_key):
+    add_password(master_key, "a.com", "user", "pass-a", category="work")
+    add_password(master_key, "b.com", "user", "pass-b", category="work")
+    add_password(master_key, "c.com", "user", "pass-c", category="home")
+    return {e['site']: e['id'] for e in list_entries()}
+
+def test_apply_batch_runs_mixed_operations(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    ids = seed(master_key)
+
+    result = apply_batch(master_key, [
+        {"op": "add", "site": "d.com", "username": "new", "password": "pass-d"},
+        {"op": "update", "id": ids["a.com"], "password": "pass-a2", "notes": "rotated"},
+        {"op": "delete", "id": ids["c.com"]},
+    ])
+    assert result["applied"] == 3
+    assert [r["op"] for r in result["results"]] == ["add", "update", "delete"]
+
+    passwords = {p['site']: p for p in get_passwords(master_key)}
+    assert set(passwords) == {"a.com", "b.com", "d.com"}
+    assert passwords["a.com"]["password"] == "pass-a2"
+    assert passwords["a.com"]["notes"] == "rotated"
+    assert passwords["a.com"]["category"] == "work"  # untouched fields keep their values
+    assert passwords["d.com"]["id"] == result["results"][0]["id"]
+
+def test_apply_batch_is_all_or_nothing(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    ids = seed(master_key)
+    before = get_passwords(master_key)
+
+    result = apply_batch(master_key, [
+        {"op": "delete", "id": ids["a.com"]},
+        {"op": "update", "id": 9999, "category": "x"},
+    ])
+    assert result == {"error": "No entry with id 9999", "index": 1}
+    assert get_passwords(master_key) == before
+
+    assert apply_batch(master_key, [{"op": "rename"}])["index"] == 0
+    assert "error" in apply_batch(master_key, "not a list")
+
+def test_batch_commits_once(mock_paths, monkeypatch):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    backend.get_vault_key(master_key)  # Created (and committed) on first use
+    conn = backend.get_db()
+    commits = []
+    monkeypatch.setattr(backend, 'get_db', lambda: CommitCounter(conn, commits))
+
+    apply_batch(master_key, [
+        {"op": "add", "site": f"s{i}.com", "username": "u", "password": "p"} for i in range(50)
+    ])
+    assert len(commits) == 1
+
+class CommitCounter:
+    def __init__(self, conn, commits):
+        self.conn = conn
+        self.commits = commits
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def commit(self):
+        self.commits.append(1)
+        self.conn.commit()
+
+def test_rename_and_delete_category(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    seed(master_key)
+
+    assert rename_category(master_key, "work", "office")["applied"] == 2
+    assert sorted(e['category'] for e in list_entries()) == ["home", "office", "office"]
+
+    assert delete_category(master_key, "office")["applied"] == 2
+    assert [e['site'] for e in list_entries()] == ["c.com"]
+
+def test_category_helpers_reject_missing_category(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "pass-a")
+    add_password(master_key, "b.com", "user", "pass-b")
+
+    assert "error" in delete_category(master_key, None)
+    assert "error" in rename_category(master_key, None, "x")
+    assert len(list_entries()) == 2
+
+def test_category_helpers_have_no_batch_ceiling(mock_paths, monkeypatch):
+    monkeypatch.setattr('backend.backend.BATCH_MAX_OPERATIONS', 2)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for i in range(5):
+        add_password(master_key, f"site{i}.com", "user", "p", category="bulk")
+
+    assert rename_category(master_key, "bulk", "archive") == {"applied": 5}
+    assert delete_category(master_key, "archive") == {"applied": 5}
+    assert list_entries() == []
@@ -0,0 +1,61 @@
+# tests/test_breach.py
+import pytest
+import hashlib
+import backend.backend as backend
+from backend.backend import (
+    init_db,
+    get_master_key,
+    add_password,
+    build_breach_index,
+    open_breach_index,
+    lookup_breach_count,
+    audit_breaches,
+)
+
+def sha1_hex(text):
+    return hashlib.sha1(text.encode()).hexdigest().upper()
+
+@pytest.fixture
+def breach_dump(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, 'BREACH_INDEX_FILE', str(tmp_path / 'breach_index.bin'))
+    monkeypatch.setattr(backend, 'BREACH_SORT_CHUNK_RECORDS', 3)  # Force several sorted runs
+    lines = [f"{sha1_hex(f'filler{i}')}:{i + 1}" for i in range(10)]
+    lines += [f"{sha1_hex('password123')}:24230577", f"{sha1_hex('letmein')}:512", "not a hash line"]
+    lines += [f"{sha1_hex('negative')}:-5", f"{sha1_hex('oversized')}:{2 ** 32}"]  # counts that do not fit
+    lines.append(f"{sha1_hex('letmein')}:512")  # duplicates collapse
+    dump = tmp_path / 'pwned-passwords-sha1.txt'
+    dump.write_bytes(('\r\n'.join(reversed(lines)) + '\r\n').encode())
+    return dump
+
+def test_build_and_lookup_breach_index(mock_paths, breach_dump):
+    assert build_breach_index(str(breach_dump)) == {'records': 12, 'malformed': 3}
+    index, records = open_breach_index()
+    try:
+        assert records == 12
+        assert lookup_breach_count(index, records, hashlib.sha1(b'password123').digest()) == 24230577
+        assert lookup_breach_count(index, records, hashlib.sha1(b'filler0').digest()) == 1
+        assert lookup_breach_count(index, records, hashlib.sha1(b'correct horse').digest()) == 0
+        assert lookup_breach_count(index, records, b'\xff' * 20) == 0
+    finally:
+        index.close()
+
+def test_audit_breaches_streams_results(mock_paths, breach_dump, monkeypatch):
+    monkeypatch.setattr(backend, 'BREACH_AUDIT_PAGE_ROWS', 2)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "password123")
+    add_password(master_key, "b.com", "user", "a-unique-passphrase")
+    add_password(master_key, "c.com", "user", "letmein")
+
+    progress = []
+    result = audit_breaches(master_key, str(breach_dump), lambda audited, page: progress.append((audited, page)))
+    assert result['audited'] == 3
+    assert [(b['site'], b['count']) for b in result['breached']] == [("a.com", 24230577), ("c.com", 512)]
+    assert [audited for audited, _ in progress] == [2, 3]
+
+    # The index is reused without the dump
+    assert audit_breaches(master_key)['audited'] == 3
+
+def test_audit_breaches_requires_index(mock_paths, tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, 'BREACH_INDEX_FILE', str(tmp_path / 'missing.bin'))
+    assert 'error' in audit_breaches(get_master_key("MasterPass"))
@@ -20,3 +20,24 @@ def test_decrypt_with_wrong_key(mock_paths):
     decrypted = decrypt(other_key, encrypted)
     # Decryption should fail or return None
     assert decrypted is None
+
+def test_encrypt_uses_versioned_format(mock_paths):
+    master_key = get_master_key("MySuperSecret")
+    encrypted = encrypt(master_key, "SensitiveData123")
+    assert encrypted.startswith("v1:")
+    # A fresh nonce per record means equal plaintexts never share ciphertext
+    assert encrypted != encrypt(master_key, "SensitiveData123")
+
+def test_decrypt_legacy_format(mock_paths):
+    import os, base64
+    from Cryptodome.Cipher import AES
+    from Cryptodome.Protocol.KDF import PBKDF2
+    from Cryptodome.Hash import SHA256
+
+    master_key = get_master_key("MySuperSecret")
+    salt, nonce = os.urandom(16), os.urandom(12)
+    aes_key = PBKDF2(master_key, salt, dkLen=32, count=100000, hmac_hash_module=SHA256)
+    ciphertext, tag = AES.new(aes_key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(b"OldSecret")
+    legacy = base64.b64encode(salt + nonce + tag + ciphertext).decode()
+
+    assert decrypt(master_key, legacy) == "OldSecret"
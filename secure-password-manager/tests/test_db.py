@@ -1,7 +1,45 @@
 # tests/test_db.py
 import pytest
 import os
-from backend.backend import init_db, add_password, get_passwords, update_password, delete_password, get_master_key
+import base64
+import sqlite3
+from Cryptodome.Cipher import AES
+from Cryptodome.Protocol.KDF import PBKDF2
+from Cryptodome.Hash import SHA256
+from backend.backend import (
+    init_db,
+    add_password,
+    get_passwords,
+    update_password,
+    delete_password,
+    get_master_key,
+    list_entries,
+    list_entries_page,
+    is_page_cursor,
+    reveal_password,
+    get_passwords_page,
+    get_db,
+    close_db,
+    get_changes_since,
+    audit_vault,
+    apply_batch,
+    estimate_strength_bits,
+    get_history,
+)
+
+def legacy_encrypt(master_key, plaintext):
+    # Record format v0: salt || nonce || tag || ct, per-record PBKDF2 key
+    salt, nonce = os.urandom(16), os.urandom(12)
+    aes_key = PBKDF2(master_key, salt, dkLen=32, count=100000, hmac_hash_module=SHA256)
+    ciphertext, tag = AES.new(aes_key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(plaintext.encode())
+    return base64.b64encode(salt + nonce + tag + ciphertext).decode()
+
+def insert_legacy_row(master_key, site, password):
+    conn = sqlite3.connect('test_passwords.db')
+    conn.execute('INSERT INTO passwords (site, username, password, notes, category) VALUES (?, ?, ?, ?, ?)',
+                 (site, 'user', legacy_encrypt(master_key, password), '', ''))
+    conn.commit()
+    conn.close()
 
 def test_init_db(mock_paths):
     init_db()
@@ -46,3 +84,366 @@ def test_delete_password(mock_paths):
     delete_password(entry_id)
     passwords = get_passwords(master_key)
     assert len(passwords) == 0
+
+def test_passwords_stored_under_vault_key(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "example.com", "user", "pass123")
+
+    conn = sqlite3.connect('test_passwords.db')
+    stored = conn.execute('SELECT password FROM passwords').fetchone()[0]
+    wrapped = conn.execute('SELECT version, wrapped_key FROM vault_keys').fetchall()
+    conn.close()
+    assert stored.startswith("v1:")
+    assert len(wrapped) == 1 and wrapped[0][0] == 1
+
+def test_legacy_rows_readable_before_migration(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    insert_legacy_row(master_key, "old.com", "oldpass")
+    add_password(master_key, "new.com", "user", "newpass")
+
+    passwords = {p['site']: p['password'] for p in get_passwords(master_key)}
+    assert passwords == {"old.com": "oldpass", "new.com": "newpass"}
+
+def test_init_db_migrates_legacy_rows(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    insert_legacy_row(master_key, "old.com", "oldpass")
+
+    init_db(master_key)
+
+    conn = sqlite3.connect('test_passwords.db')
+    stored = conn.execute('SELECT password FROM passwords').fetchone()[0]
+    conn.close()
+    assert stored.startswith("v1:")
+    assert get_passwords(master_key)[0]['password'] == "oldpass"
+
+def test_list_entries_returns_metadata_only(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "example.com", "user", "pass123", notes="n", category="email")
+
+    entries = list_entries()
+    assert len(entries) == 1
+    assert entries[0]['site'] == "example.com"
+    assert entries[0]['category'] == "email"
+    assert 'password' not in entries[0]
+
+def test_reveal_password(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "example.com", "user", "pass123")
+    insert_legacy_row(master_key, "old.com", "oldpass")
+    ids = {e['site']: e['id'] for e in list_entries()}
+
+    assert reveal_password(master_key, ids["example.com"]) == "pass123"
+    assert reveal_password(master_key, ids["old.com"]) == "oldpass"
+    assert reveal_password(master_key, 9999) is None
+
+def test_get_passwords_keyset_pagination(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for i in range(5):
+        add_password(master_key, f"site{i}.com", "user", f"pass{i}")
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = get_passwords_page(master_key, limit=2, cursor=cursor)
+        seen.extend(p['password'] for p in page)
+        if cursor is None:
+            break
+    assert seen == [f"pass{i}" for i in range(5)]
+
+def test_get_passwords_order_by_site_and_category(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "charlie.com", "user", "p", category="work")
+    add_password(master_key, "Alpha.com", "user", "p", category="")
+    add_password(master_key, "bravo.com", "user", "p", category="email")
+
+    first, cursor = get_passwords_page(master_key, limit=2, order_by='site')
+    rest, _ = get_passwords_page(master_key, limit=2, cursor=cursor, order_by='site')
+    assert [p['site'] for p in first + rest] == ["Alpha.com", "bravo.com", "charlie.com"]
+
+    by_category = get_passwords(master_key, order_by='category')
+    assert [p['category'] for p in by_category] == ["", "email", "work"]
+    cursor = {'after_key': '', 'after_id': by_category[0]['id']}
+    assert [e['site'] for e in list_entries(limit=1, cursor=cursor, order_by='category')] == ["bravo.com"]
+
+def test_keyset_paging_survives_deleted_cursor_row(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for site in ["delta.com", "alpha.com", "echo.com", "charlie.com", "bravo.com"]:
+        add_password(master_key, site, "user", "p")
+
+    first, cursor = list_entries_page(limit=2, order_by='site')
+    assert cursor == {'after_key': "bravo.com", 'after_id': first[-1]['id']}
+    delete_password(first[-1]['id'])
+    rest, _ = list_entries_page(limit=5, cursor=cursor, order_by='site')
+    assert [e['site'] for e in rest] == ["charlie.com", "delta.com", "echo.com"]
+    assert not is_page_cursor({'after_id': 1}, 'site')
+    assert not is_page_cursor({'after_key': "a", 'after_id': "1"}, 'site')
+
+def test_persistent_connection_uses_wal(mock_paths):
+    init_db()
+    conn = get_db()
+    assert get_db() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+
+    close_db()
+    assert get_db() is not conn
+
+def test_change_feed_returns_only_changes_since_seq(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "p")
+    add_password(master_key, "b.com", "user", "p")
+    start = get_changes_since(0)
+    assert start['reset'] is False
+    assert [c['site'] for c in start['changes']] == ["a.com", "b.com"]
+
+    ids = {e['site']: e['id'] for e in list_entries()}
+    update_password(master_key, ids["a.com"], "a2.com", "user", "p2", "", "")
+    update_password(master_key, ids["a.com"], "a3.com", "user", "p3", "", "")
+    delete_password(ids["b.com"])
+    add_password(master_key, "c.com", "user", "p")
+
+    delta = get_changes_since(start['seq'])
+    # Repeated edits collapse to the entry's current state; secrets are never included
+    assert delta['changes'] == [
+        {'op': 'upsert', 'id': ids["a.com"], 'site': "a3.com", 'username': "user", 'notes': "", 'category': ""},
+        {'op': 'delete', 'id': ids["b.com"]},
+        {'op': 'upsert', 'id': ids["b.com"] + 1, 'site': "c.com", 'username': "user", 'notes': "", 'category': ""},
+    ]
+    assert get_changes_since(delta['seq'])['changes'] == []
+
+def test_change_feed_resets_when_seq_is_pruned(mock_paths, monkeypatch):
+    import backend.backend as backend
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for i in range(5):
+        add_password(master_key, f"site{i}.com", "user", "p")
+    monkeypatch.setattr(backend, 'CHANGELOG_RETENTION', 2)
+    init_db()
+
+    assert get_changes_since(0)['reset'] is True
+    assert get_changes_since(None)['reset'] is True
+    assert get_changes_since(3)['reset'] is False
+
+def force_parallel_decrypt(monkeypatch):
+    import backend.backend as backend
+    monkeypatch.setattr(backend, 'DECRYPT_WORKERS', 4)
+    monkeypatch.setattr(backend, 'DECRYPT_CHUNK_ROWS', 3)
+    monkeypatch.setattr(backend, 'PARALLEL_DECRYPT_MIN_ROWS', 1)
+    monkeypatch.setattr(backend, '_decrypt_pool', None)
+
+def test_parallel_decrypt_keeps_row_order(mock_paths, monkeypatch):
+    force_parallel_decrypt(monkeypatch)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for i in range(20):
+        add_password(master_key, f"site{i:02}.com", "user", f"pass{i}")
+
+    passwords = get_passwords(master_key, order_by='site')
+    assert [p['password'] for p in passwords] == [f"pass{i}" for i in range(20)]
+
+def test_parallel_migration_of_legacy_rows(mock_paths, monkeypatch):
+    force_parallel_decrypt(monkeypatch)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for i in range(5):
+        insert_legacy_row(master_key, f"old{i}.com", f"oldpass{i}")
+
+    init_db(master_key)
+
+    assert {p['site']: p['password'] for p in get_passwords(master_key)} == {
+        f"old{i}.com": f"oldpass{i}" for i in range(5)}
+
+def count_decrypts(monkeypatch):
+    import backend.backend as backend
+    calls = []
+    original = backend.decrypt_entry
+    def counting_decrypt_entry(*args):
+        calls.append(1)
+        return original(*args)
+    monkeypatch.setattr(backend, 'decrypt_entry', counting_decrypt_entry)
+    return calls
+
+def test_entry_cache_serves_repeat_reads(mock_paths, monkeypatch):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "pass-a")
+    add_password(master_key, "b.com", "user", "pass-b")
+    calls = count_decrypts(monkeypatch)
+
+    assert [p['password'] for p in get_passwords(master_key)] == ["pass-a", "pass-b"]
+    assert len(calls) == 2
+    assert [p['password'] for p in get_passwords(master_key)] == ["pass-a", "pass-b"]
+    assert reveal_password(master_key, get_passwords(master_key)[0]['id']) == "pass-a"
+    assert len(calls) == 2
+
+def test_entry_cache_can_be_disabled(mock_paths, monkeypatch):
+    import backend.backend as backend
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "pass-a")
+    monkeypatch.setattr(backend, 'ENTRY_CACHE_ENABLED', False)
+    calls = count_decrypts(monkeypatch)
+
+    get_passwords(master_key)
+    get_passwords(master_key)
+    assert len(calls) == 2
+    assert backend._entry_cache == {}
+
+def test_entry_cache_invalidated_by_update_and_delete(mock_paths):
+    import backend.backend as backend
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "old")
+    entry_id = list_entries()[0]['id']
+    assert reveal_password(master_key, entry_id) == "old"
+    _, buffer, _ = backend._entry_cache[entry_id]
+
+    update_password(master_key, entry_id, "a.com", "user", "new", "", "")
+    assert entry_id not in backend._entry_cache
+    assert buffer == bytearray(3)  # wiped, not just dropped
+    assert reveal_password(master_key, entry_id) == "new"
+
+    delete_password(entry_id)
+    assert entry_id not in backend._entry_cache
+
+def test_entry_cache_ttl_and_size_cap(mock_paths, monkeypatch):
+    import backend.backend as backend
+    init_db()
+    master_key = get_master_key("MasterPass")
+    for i in range(3):
+        add_password(master_key, f"site{i}.com", "user", f"pass{i}")
+
+    monkeypatch.setattr(backend, 'ENTRY_CACHE_MAX_ENTRIES', 2)
+    get_passwords(master_key)
+    assert len(backend._entry_cache) == 2
+
+    monkeypatch.setattr(backend, 'ENTRY_CACHE_TTL_SECONDS', 0)
+    backend._sweep_entry_cache()
+    assert len(backend._entry_cache) == 0
+
+def test_clear_entry_cache_wipes_buffers(mock_paths):
+    import backend.backend as backend
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "secret")
+    get_passwords(master_key)
+    buffers = [buffer for _, buffer, _ in backend._entry_cache.values()]
+
+    backend.clear_entry_cache()
+    assert backend._entry_cache == {}
+    assert buffers == [bytearray(6)]
+
+def test_audit_vault_groups_reused_passwords(mock_paths, monkeypatch):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "shared-Secret-1")
+    add_password(master_key, "b.com", "user", "unique-Secret-2")
+    add_password(master_key, "c.com", "user", "shared-Secret-1")
+    apply_batch(master_key, [{'op': 'add', 'site': 'd.com', 'username': 'user', 'password': 'shared-Secret-1'}])
+    calls = count_decrypts(monkeypatch)
+
+    report = audit_vault(master_key)
+    assert calls == []  # served from the index columns alone
+    assert report['audited'] == 4
+    assert [[e['site'] for e in group['entries']] for group in report['reused']] == [["a.com", "c.com", "d.com"]]
+
+    # Changing the password moves the entry out of the group
+    entry_id = report['reused'][0]['entries'][0]['id']
+    update_password(master_key, entry_id, "a.com", "user", "another-Secret-3", "", "")
+    assert [group['count'] for group in audit_vault(master_key)['reused']] == [2]
+
+def test_audit_vault_reports_weak_passwords(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "weak.com", "user", "aaaaaaaaaaaa")
+    add_password(master_key, "strong.com", "user", "x7#Qp!2vLm9$Rt4&Zk")
+
+    report = audit_vault(master_key)
+    assert [e['site'] for e in report['weak']] == ["weak.com"]
+    assert report['weak'][0]['level'] == 'very_weak'
+    assert report['strength']['very_weak'] == 1
+    assert estimate_strength_bits("aaaaaaaaaaaa") == estimate_strength_bits("aa")
+    assert estimate_strength_bits("x7#Qp!2vLm9$Rt4&Zk") > 100
+
+    # Scores are stored sealed; a plaintext score left by an older version is re-sealed on unlock
+    c = get_db().cursor()
+    c.execute("SELECT COUNT(*) FROM passwords WHERE strength NOT LIKE 's1:%'")
+    assert c.fetchone()[0] == 0
+    c.execute("UPDATE passwords SET strength = 40 WHERE site = 'strong.com'")
+    get_db().commit()
+    assert audit_vault(master_key)['unindexed'] == 1
+    init_db(master_key)
+    assert audit_vault(master_key) == report
+
+def test_init_db_backfills_password_index(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    insert_legacy_row(master_key, "old.com", "samepass")
+    insert_legacy_row(master_key, "older.com", "samepass")
+    assert audit_vault(master_key)['unindexed'] == 2
+
+    init_db(master_key)
+
+    report = audit_vault(master_key)
+    assert report['unindexed'] == 0
+    assert [group['count'] for group in report['reused']] == [2]
+
+def test_init_db_migrates_integer_strength_column(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "weak.com", "user", "aaaaaaaaaaaa")
+    conn = get_db()
+    # The schema before scores were sealed
+    conn.execute("ALTER TABLE passwords DROP COLUMN strength")
+    conn.execute("ALTER TABLE passwords ADD COLUMN strength INTEGER")
+    conn.execute("UPDATE passwords SET strength = 20")
+    conn.commit()
+
+    init_db(master_key)
+    types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(passwords)")}
+    assert types["strength"] == "TEXT"
+    report = audit_vault(master_key)
+    assert report["unindexed"] == 0
+    assert [e["site"] for e in report["weak"]] == ["weak.com"]
+
+def test_password_history_keeps_previous_versions(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "first")
+    entry_id = list_entries()[0]['id']
+    update_password(master_key, entry_id, "a.com", "user", "second", "", "")
+    update_password(master_key, entry_id, "a.com", "renamed", "second", "", "")  # password unchanged
+    apply_batch(master_key, [{'op': 'update', 'id': entry_id, 'password': 'third'}])
+
+    history = get_history(master_key, entry_id)
+    assert [h['password'] for h in history] == ["second", "first"]
+    assert [h['version'] for h in history] == [3, 1]
+
+    delete_password(entry_id)
+    assert get_history(master_key, entry_id) == []
+
+def test_password_history_retention_cap(mock_paths, monkeypatch):
+    import backend.backend as backend
+    monkeypatch.setattr(backend, 'PASSWORD_HISTORY_RETENTION', 2)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "a.com", "user", "pass0")
+    entry_id = list_entries()[0]['id']
+    for i in range(1, 5):
+        update_password(master_key, entry_id, "a.com", "user", f"pass{i}", "", "")
+
+    assert [h['password'] for h in get_history(master_key, entry_id)] == ["pass3", "pass2"]
+
+    # A lower cap applies to existing history on the next start
+    monkeypatch.setattr(backend, 'PASSWORD_HISTORY_RETENTION', 1)
+    init_db()
+    assert [h['password'] for h in get_history(master_key, entry_id)] == ["pass3"]
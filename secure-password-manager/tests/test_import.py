@@ -0,0 +1,52 @@
+# tests/test_import.py
+import pytest
+import json
+from backend.backend import init_db, get_master_key, get_passwords, import_entries, iter_import_file
+
+def test_import_entries_batch(mock_paths, monkeypatch):
+    monkeypatch.setattr('backend.backend.IMPORT_BATCH_SIZE', 2)
+    init_db()
+    master_key = get_master_key("MasterPass")
+    entries = [
+        {"site": f"site{i}.com", "username": "user", "password": f"pass{i}", "category": "imported"}
+        for i in range(5)
+    ]
+    entries.append({"site": "missing-password.com", "username": "user"})
+
+    progress = []
+    result = import_entries(master_key, entries, lambda imported, skipped: progress.append(imported))
+
+    assert result == {"imported": 5, "skipped": 1}
+    assert progress == [2, 4, 5]
+    passwords = get_passwords(master_key)
+    assert [p['password'] for p in passwords] == [f"pass{i}" for i in range(5)]
+    assert all(p['category'] == "imported" for p in passwords)
+
+def test_import_csv_with_aliased_columns(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    path = tmp_path / "export.csv"
+    path.write_text("name,url,username,password,folder\nEx,https://example.com,alice,s3cret,work\n")
+
+    result = import_entries(master_key, iter_import_file(str(path)))
+
+    assert result == {"imported": 1, "skipped": 0}
+    p = get_passwords(master_key)[0]
+    assert (p['site'], p['username'], p['password'], p['category']) == ("https://example.com", "alice", "s3cret", "work")
+
+def test_import_jsonl_file(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    path = tmp_path / "export.jsonl"
+    path.write_text("\n".join(json.dumps({"site": f"s{i}", "username": "u", "password": "p"}) for i in range(3)))
+
+    assert import_entries(master_key, iter_import_file(str(path))) == {"imported": 3, "skipped": 0}
+
+def test_failed_import_rolls_back(mock_paths, tmp_path):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    path = tmp_path / "broken.jsonl"
+    path.write_text(json.dumps({"site": "a", "username": "u", "password": "p"}) + "\n{not json\n")
+
+    assert import_entries(master_key, iter_import_file(str(path))) is None
+    assert get_passwords(master_key) == []
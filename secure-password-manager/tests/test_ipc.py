@@ -0,0 +1,345 @@
+# tests/test_ipc.py
+import pytest
+import io
+import json
+import logging
+import threading
+import backend.backend as backend
+
+def run_backend(monkeypatch, capsys, requests):
+    lines = [r if isinstance(r, str) else json.dumps(r) for r in requests]
+    monkeypatch.setattr('sys.stdin', io.StringIO('\n'.join(lines) + '\n'))
+    backend.main()
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_responses_echo_request_id(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "is_master_password_set", "data": {}},
+        {"id": 2, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 3, "command": "add_password", "data": {"site": "a.com", "username": "u", "password": "p"}},
+        {"id": "last", "command": "shutdown", "data": {}},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert by_id[1] == {"id": 1, "isSet": False}
+    assert by_id[2]["status"] == "Master password set"
+    assert by_id[3]["status"] == "Password added"
+    assert responses[-1] == {"id": "last", "status": "shutdown"}
+
+def test_slow_command_does_not_block_others(mock_paths, monkeypatch, capsys):
+    released = threading.Event()
+
+    def slow_setup_mfa(master_key):
+        # Only finishes once a later command has already completed
+        assert released.wait(5)
+        return {"status": "MFA setup", "qr_code": ""}
+
+    def fast_is_mfa_enabled(master_key):
+        released.set()
+        return {"mfaEnabled": False}
+
+    monkeypatch.setattr(backend, 'setup_mfa', slow_setup_mfa)
+    monkeypatch.setattr(backend, 'is_mfa_enabled', fast_is_mfa_enabled)
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "setup_mfa", "data": {}},
+        {"id": 3, "command": "is_mfa_enabled", "data": {}},
+        {"id": 4, "command": "shutdown", "data": {}},
+    ])
+    assert [r["id"] for r in responses] == [1, 3, 2, 4]
+
+def test_progress_lines_carry_request_id(mock_paths, monkeypatch, capsys):
+    monkeypatch.setattr('backend.backend.IMPORT_BATCH_SIZE', 1)
+    entries = [{"site": f"s{i}", "username": "u", "password": "p"} for i in range(2)]
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 7, "command": "import_entries", "data": {"entries": entries}},
+        {"id": 8, "command": "shutdown", "data": {}},
+    ])
+    import_lines = [r for r in responses if r["id"] == 7]
+    assert [r["progress"]["imported"] for r in import_lines[:-1]] == [1, 2]
+    assert import_lines[-1]["status"] == "Entries imported"
+
+def test_invalid_json_does_not_stop_backend(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        "{not json",
+        "[1, 2]",
+        {"id": 1, "command": "no_such_command"},
+        {"id": 2, "command": "shutdown"},
+    ])
+    assert responses == [
+        {"error": "Invalid JSON format"},
+        {"error": "Invalid JSON format"},
+        {"id": 1, "error": "Unknown command"},
+        {"id": 2, "status": "shutdown"},
+    ]
+
+def test_invalid_json_reply_keeps_recoverable_id(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        '{"id": 7, "command": "get_passwords", "data": {',
+        '{"command": "x", "id": "req-8" oops',
+        {"id": 9, "command": "shutdown"},
+    ])
+    assert responses == [
+        {"id": 7, "error": "Invalid JSON format"},
+        {"id": "req-8", "error": "Invalid JSON format"},
+        {"id": 9, "status": "shutdown"},
+    ]
+
+def test_malformed_command_or_data_gets_error_reply(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": ["x"]},
+        {"id": 2, "command": "set_framing", "data": [1]},
+        {"id": 3, "command": "get_passwords", "data": "x"},
+        {"id": 4, "command": "shutdown"},
+    ])
+    error = "command must be a string and data an object"
+    assert responses == [
+        {"id": 1, "error": error},
+        {"id": 2, "error": error},
+        {"id": 3, "error": error},
+        {"id": 4, "status": "shutdown"},
+    ]
+
+def test_serial_command_waits_without_blocking_session_free_ones(mock_paths, monkeypatch, capsys):
+    released = threading.Event()
+
+    def slow_setup_mfa(master_key):
+        assert released.wait(5)
+        return {"status": "MFA setup", "qr_code": ""}
+
+    def releasing_get_metrics():
+        released.set()
+        return {}
+
+    monkeypatch.setattr(backend, 'setup_mfa', slow_setup_mfa)
+    monkeypatch.setattr(backend, 'get_metrics', releasing_get_metrics)
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "setup_mfa", "data": {}},
+        {"id": 3, "command": "set_pin", "data": {"pin": "4821"}},
+        {"id": 4, "command": "get_metrics", "data": {}},
+        {"id": 5, "command": "shutdown", "data": {}},
+    ])
+    # set_pin waits for setup_mfa, but the reader keeps going and get_metrics runs meanwhile
+    ids = [r["id"] for r in responses]
+    assert ids.index(4) < ids.index(2) < ids.index(3) < ids.index(5)
+    assert next(r for r in responses if r["id"] == 3)["status"] == "PIN set"
+
+def frame(msgpack, message):
+    payload = msgpack.packb(message, use_bin_type=True)
+    return len(payload).to_bytes(4, 'big') + payload
+
+def read_frames(msgpack, data):
+    messages = []
+    while data:
+        length = int.from_bytes(data[:4], 'big')
+        messages.append(msgpack.unpackb(data[4:4 + length], raw=False))
+        data = data[4 + length:]
+    return messages
+
+def test_msgpack_framing_negotiation(mock_paths, monkeypatch):
+    msgpack = pytest.importorskip('msgpack')
+    stdin = json.dumps({"id": 1, "command": "set_framing", "data": {"mode": "msgpack"}}).encode() + b"\n"
+    stdin += frame(msgpack, {"id": 2, "command": "is_master_password_set", "data": {}})
+    stdin += frame(msgpack, {"id": 3, "command": "shutdown", "data": {}})
+    stdout = io.BytesIO()
+    monkeypatch.setattr('sys.stdin', io.TextIOWrapper(io.BytesIO(stdin)))
+    monkeypatch.setattr('sys.stdout', io.TextIOWrapper(stdout, write_through=True))
+
+    backend.main()
+
+    ack, rest = stdout.getvalue().split(b"\n", 1)
+    assert json.loads(ack) == {"id": 1, "status": "Framing set", "framing": "msgpack"}
+    assert read_frames(msgpack, rest) == [{"id": 2, "isSet": False}, {"id": 3, "status": "shutdown"}]
+
+def test_unsupported_framing_stays_on_json(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_framing", "data": {"mode": "cbor"}},
+        {"id": 2, "command": "is_master_password_set", "data": {}},
+        {"id": 3, "command": "shutdown", "data": {}},
+    ])
+    assert responses[0] == {"id": 1, "error": "Unsupported framing mode"}
+    assert responses[1] == {"id": 2, "isSet": False}
+
+def test_get_metrics_and_trace_file(mock_paths, monkeypatch, capsys, tmp_path):
+    trace_path = tmp_path / 'trace.jsonl'
+    monkeypatch.setenv(backend.TRACE_FILE_ENV, str(trace_path))
+    backend.reset_metrics()
+    run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "add_password", "data": {"site": "a.com", "username": "u", "password": "p"}},
+        {"id": 3, "command": "get_passwords", "data": {}},
+        {"id": 4, "command": "shutdown", "data": {}},
+    ])
+    metrics = backend.get_metrics()
+    spans = metrics["spans"]
+    assert spans["kdf"]["count"] == 1
+    assert spans["command:get_passwords"]["count"] == 1
+    for name in ("db_query", "decrypt", "serialize"):
+        assert spans[name]["count"] >= 1
+        assert spans[name]["p50_ms"] <= spans[name]["p95_ms"] <= spans[name]["p99_ms"] <= spans[name]["max_ms"]
+    assert metrics["messages_written"] == 4
+    assert metrics["bytes_written"] > 0
+
+    trace = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    kdf = next(t for t in trace if t["span"] == "kdf")
+    assert (kdf["command"], kdf["request_id"]) == ("set_master_password", 1)
+
+    # The command reports the same numbers over the pipe and can reset them
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "get_metrics", "data": {"reset": True}},
+        {"id": 2, "command": "shutdown", "data": {}},
+    ])
+    reported = responses[0]["metrics"]
+    assert reported["spans"]["kdf"]["count"] == 1
+    assert reported["trace_file"] == str(trace_path)
+    assert "kdf" not in backend.get_metrics()["spans"]
+
+def test_unknown_commands_share_one_metric(mock_paths, monkeypatch, capsys):
+    import inspect
+    import re
+    backend.reset_metrics()
+    run_backend(monkeypatch, capsys, [{"id": i, "command": f"made_up_{i}"} for i in range(5)] + [
+        {"id": 5, "command": "is_master_password_set"},
+        {"id": 6, "command": "shutdown"},
+    ])
+    spans = backend.get_metrics()["spans"]
+    assert spans["command:unknown"]["count"] == 5
+    assert spans["command:is_master_password_set"]["count"] == 1
+    assert not any(name.startswith("command:made_up") for name in spans)
+    # Every command handle_command answers is timed under its own name
+    handled = set(re.findall(r"command == '(\w+)'", inspect.getsource(backend.handle_command)))
+    assert handled <= backend.COMMANDS
+
+def test_redact_masks_secret_fields():
+    assert backend.redact("{'password': 'hunter2', 'site': 'a.com'}") == "{'password': '[REDACTED]', 'site': 'a.com'}"
+    assert backend.redact('{"master_password": "x y", "id": 3}') == '{"master_password": \'[REDACTED]\', "id": 3}'
+    assert backend.redact("token=123456 accepted") == "token='[REDACTED]' accepted"
+    assert backend.redact('Password for site "a.com" added') == 'Password for site "a.com" added'
+
+def test_backend_log_omits_responses_and_secrets(mock_paths, monkeypatch, capsys):
+    # The stream the backend logged to before this test; capsys's own stream closes with the test
+    original_stream = backend._log_listener.handlers[0].stream
+    stream = io.StringIO()
+    monkeypatch.setattr('sys.stderr', stream)
+    backend.configure_logging('DEBUG')
+    try:
+        run_backend(monkeypatch, capsys, [
+            {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+            {"id": 2, "command": "add_password", "data": {"site": "a.com", "username": "u", "password": "hunter2"}},
+            {"id": 3, "command": "get_passwords", "data": {}},
+            {"id": 4, "command": "shutdown", "data": {}},
+        ])
+        logging.info("Logged {'password': 'hunter2'}")
+        backend.stop_logging()
+    finally:
+        monkeypatch.setattr('sys.stderr', original_stream)
+        backend.configure_logging()
+
+    log = stream.getvalue()
+    assert "Response sent for get_passwords (id 3)" in log
+    assert "{'password': '[REDACTED]'}" in log
+    assert "hunter2" not in log
+    assert "MasterPass" not in log
+
+def test_lock_and_quick_unlock_with_pin(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "add_password", "data": {"site": "a.com", "username": "u", "password": "p"}},
+        {"id": 3, "command": "set_pin", "data": {"pin": "2468"}},
+        {"id": 4, "command": "lock", "data": {}},
+        {"id": 5, "command": "get_passwords", "data": {}},
+        {"id": 6, "command": "unlock_with_pin", "data": {"pin": "0000"}},
+        {"id": 7, "command": "unlock_with_pin", "data": {"pin": "2468"}},
+        {"id": 8, "command": "get_passwords", "data": {}},
+        {"id": 9, "command": "lock", "data": {"forget_pin": True}},
+        {"id": 10, "command": "unlock_with_pin", "data": {"pin": "2468"}},
+        {"id": 11, "command": "shutdown", "data": {}},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert by_id[3]["status"] == "PIN set"
+    assert by_id[4] == {"id": 4, "status": "Locked", "quickUnlock": True}
+    assert by_id[5]["error"] == "Master password not verified"
+    assert by_id[6] == {"id": 6, "error": "Incorrect PIN", "attempts_left": 2}
+    assert by_id[7]["status"] == "Unlocked"
+    assert by_id[8]["passwords"][0]["password"] == "p"
+    assert by_id[10]["error"] == "Quick unlock unavailable"
+
+def test_wrong_master_password_keeps_session_unlocked(mock_paths, monkeypatch, capsys):
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "set_master_password", "data": {"master_password": "WrongPass"}},
+        {"id": 3, "command": "add_password", "data": {"site": "a.com", "username": "u", "password": "p"}},
+        {"id": 4, "command": "shutdown", "data": {}},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert by_id[2] == {"id": 2, "error": "Incorrect master password"}
+    assert by_id[3]["status"] == "Password added"
+
+def test_quick_unlock_discarded_after_too_many_attempts(mock_paths, monkeypatch, capsys):
+    wrong = [{"id": i, "command": "unlock_with_pin", "data": {"pin": "9999"}} for i in range(4, 7)]
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "set_pin", "data": {"pin": "2468"}},
+        {"id": 3, "command": "lock", "data": {}},
+        *wrong,
+        {"id": 7, "command": "unlock_with_pin", "data": {"pin": "2468"}},
+        {"id": 8, "command": "shutdown", "data": {}},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert by_id[6]["error"] == "Too many incorrect PINs"
+    assert by_id[7]["error"] == "Quick unlock unavailable"
+
+def test_auto_lock_wipes_idle_session_key():
+    session = backend.new_session()
+    backend.set_session_key(session, b"k" * 32)
+    key_buffer = session["master_key"]
+    now = session["last_activity"]
+
+    assert backend.maybe_auto_lock(session, now + backend.AUTO_LOCK_SECONDS - 1) is False
+    session["active"] = 1
+    assert backend.maybe_auto_lock(session, now + backend.AUTO_LOCK_SECONDS) is False  # never mid-command
+    session["active"] = 0
+    assert backend.maybe_auto_lock(session, now + backend.AUTO_LOCK_SECONDS + 1) is True
+    assert session["master_key"] is None
+    assert key_buffer == bytearray(32)
+
+    session["auto_lock_seconds"] = 0  # disabled
+    backend.set_session_key(session, b"k" * 32)
+    assert backend.maybe_auto_lock(session, now + 10 ** 6) is False
+
+def test_named_vaults_open_alongside_default(mock_paths, monkeypatch, capsys, tmp_path):
+    team_dir = str(tmp_path / "team")
+    responses = run_backend(monkeypatch, capsys, [
+        {"id": 1, "command": "set_master_password", "data": {"master_password": "MasterPass"}},
+        {"id": 2, "command": "add_password", "data": {"site": "mail.personal.com", "username": "me", "password": "p1"}},
+        {"id": 3, "command": "open_vault", "data": {"name": "team", "directory": team_dir,
+                                                    "master_password": "TeamPass", "create": True}},
+        {"id": 4, "command": "add_password", "data": {"vault": "team", "site": "mail.team.com",
+                                                      "username": "ops", "password": "p2"}},
+        # Serial commands wait for in-flight work, so the add lands before the reads below
+        {"id": "sync", "command": "set_auto_lock", "data": {"seconds": 300}},
+        {"id": 5, "command": "get_passwords", "data": {"vault": "team"}},
+        {"id": 6, "command": "search", "data": {"query": "mail"}},
+        {"id": 7, "command": "list_vaults", "data": {}},
+        {"id": 8, "command": "close_vault", "data": {"name": "team"}},
+        {"id": 9, "command": "get_passwords", "data": {"vault": "team"}},
+        {"id": 10, "command": "open_vault", "data": {"name": "team", "directory": team_dir,
+                                                     "master_password": "wrong"}},
+        {"id": 11, "command": "open_vault", "data": {"name": "team", "directory": team_dir,
+                                                     "master_password": "TeamPass"}},
+        {"id": 12, "command": "get_passwords", "data": {"vault": "team"}},
+        {"id": 13, "command": "shutdown", "data": {}},
+    ])
+    by_id = {r["id"]: r for r in responses}
+    assert by_id[3] == {"id": 3, "status": "Vault opened", "vault": "team", "created": True}
+    assert [p["password"] for p in by_id[5]["passwords"]] == ["p2"]
+    # Both vaults number their first entry 1; results say which vault each came from
+    assert sorted((r["vault"], r["id"], r["site"]) for r in by_id[6]["results"]) == [
+        ("default", 1, "mail.personal.com"), ("team", 1, "mail.team.com")]
+    assert by_id[6]["ids"] == [1]
+    assert [v["name"] for v in by_id[7]["vaults"]] == ["default", "team"]
+    assert by_id[9]["error"] == 'Vault "team" is not open'
+    assert by_id[10]["error"] == "Incorrect master password"
+    assert [p["site"] for p in by_id[12]["passwords"]] == ["mail.team.com"]
+    assert backend._vaults == {}
@@ -51,3 +51,13 @@ def test_disable_mfa(mock_paths):
 
     enabled_resp = is_mfa_enabled(master_key)
     assert enabled_resp.get('mfaEnabled') is False
+
+def test_mfa_dependencies_not_imported_at_startup():
+    import os
+    import subprocess
+    import sys
+    # A fresh interpreter, since this test session has already imported pyotp
+    code = "import sys, backend.backend; print(sorted(m for m in ('pyotp', 'qrcode', 'PIL') if m in sys.modules))"
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', code], cwd=project_dir, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
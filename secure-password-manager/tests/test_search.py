@@ -0,0 +1,73 @@
+# tests/test_search.py
+import pytest
+import sqlite3
+from backend.backend import (
+    init_db,
+    get_master_key,
+    add_password,
+    update_password,
+    delete_password,
+    list_entries,
+    search_entries,
+)
+
+def ids_by_site():
+    return {e['site']: e['id'] for e in list_entries()}
+
+def test_search_matches_all_metadata_fields(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "github.com", "octocat", "p", notes="work laptop", category="dev")
+    add_password(master_key, "mail.example.com", "alice", "p", notes="", category="email")
+    ids = ids_by_site()
+
+    assert search_entries("GitHub") == [ids["github.com"]]
+    assert search_entries("octo") == [ids["github.com"]]
+    assert search_entries("laptop") == [ids["github.com"]]  # notes are searchable
+    assert search_entries("email") == [ids["mail.example.com"]]
+    assert search_entries("zzz") == []
+
+def test_search_ranks_site_matches_first(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "bank.com", "user", "p", notes="shop account")
+    add_password(master_key, "shop.com", "user", "p")
+    ids = ids_by_site()
+
+    assert search_entries("shop") == [ids["shop.com"], ids["bank.com"]]
+
+def test_search_index_follows_updates_and_deletes(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "oldname.com", "user", "p")
+    entry_id = ids_by_site()["oldname.com"]
+
+    update_password(master_key, entry_id, "newname.com", "user", "p", "", "")
+    assert search_entries("oldname") == []
+    assert search_entries("newname") == [entry_id]
+
+    delete_password(entry_id)
+    assert search_entries("newname") == []
+
+def test_short_and_special_queries(mock_paths):
+    init_db()
+    master_key = get_master_key("MasterPass")
+    add_password(master_key, "x.io", "me", "p")
+    add_password(master_key, 'quote"d AND site', "user_1", "p")
+    ids = ids_by_site()
+
+    assert search_entries("x.") == [ids["x.io"]]  # Shorter than a trigram
+    assert search_entries('"d AND') == [ids['quote"d AND site']]
+    assert search_entries("r_1") == [ids['quote"d AND site']]
+    assert search_entries("%") == []
+
+def test_search_index_built_for_existing_rows(mock_paths):
+    conn = sqlite3.connect('test_passwords.db')
+    conn.execute('CREATE TABLE passwords (id INTEGER PRIMARY KEY AUTOINCREMENT, site TEXT NOT NULL, '
+                 'username TEXT NOT NULL, password TEXT NOT NULL, notes TEXT, category TEXT)')
+    conn.execute("INSERT INTO passwords (site, username, password) VALUES ('legacy.org', 'bob', 'x')")
+    conn.commit()
+    conn.close()
+
+    init_db()
+    assert search_entries("legacy") == [1]
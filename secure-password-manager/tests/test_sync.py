@@ -0,0 +1,189 @@
+# tests/test_sync.py
+import pytest
+import os
+import shutil
+import threading
+import time
+import backend.backend as backend
+from backend.backend import (
+    init_db,
+    hash_master_password,
+    add_password,
+    update_password,
+    delete_password,
+    get_passwords,
+    get_history,
+    import_entries,
+    list_entries,
+    open_vault,
+    close_db,
+    use_vault,
+    sync_with,
+    sync_vault,
+    serve_sync,
+    sync_responder,
+    SyncKeyMismatch,
+    get_vault_key,
+    seal_sync_message,
+    open_sync_message,
+    backfill_password_index,
+    get_db,
+)
+
+def make_replicas(tmp_path, entries=3):
+    # The default vault plus a copy of its files opened as "peer": two replicas of one vault
+    master_key = hash_master_password("MasterPass")
+    init_db(master_key)
+    for i in range(entries):
+        add_password(master_key, f"site{i}.com", "user", f"pass{i}")
+    close_db()
+    peer_dir = tmp_path / "peer"
+    peer_dir.mkdir()
+    for name in (backend.DB_FILE, backend.MASTER_PASSWORD_FILE):
+        shutil.copy(name, peer_dir / name)
+    assert open_vault("peer", str(peer_dir), "MasterPass")["status"] == "Vault opened"
+    return master_key, backend._vaults["peer"]
+
+def in_process_peer(vault):
+    with use_vault(vault):
+        respond, state = sync_responder(vault["master_key"])
+
+    def exchange(frame):
+        with use_vault(vault):
+            return respond(frame)
+    return exchange
+
+def snapshot(master_key):
+    return sorted((p["site"], p["username"], p["password"]) for p in get_passwords(master_key))
+
+def ids_by_site():
+    return {e["site"]: e["id"] for e in list_entries()}
+
+def test_sync_merges_changes_from_both_replicas(mock_paths, tmp_path):
+    master_key, peer = make_replicas(tmp_path)
+    ids = ids_by_site()
+    update_password(master_key, ids["site0.com"], "site0.com", "user", "local-edit", "", "")
+    delete_password(ids["site1.com"])
+    add_password(master_key, "local-only.com", "user", "l")
+    update_password(master_key, ids["site2.com"], "site2.com", "user", "older-edit", "", "")
+    time.sleep(0.01)
+    with use_vault(peer):
+        add_password(master_key, "peer-only.com", "user", "p")
+        update_password(master_key, ids["site2.com"], "site2.com", "user", "newer-edit", "", "")
+
+    stats = sync_with(master_key, in_process_peer(peer))
+
+    assert (stats["pulled"], stats["pushed"]) == (2, 3)
+    expected = [("local-only.com", "user", "l"), ("peer-only.com", "user", "p"),
+                ("site0.com", "user", "local-edit"), ("site2.com", "user", "newer-edit")]
+    assert snapshot(master_key) == expected
+    with use_vault(peer):
+        assert snapshot(master_key) == expected
+    # The losing local edit is kept in history
+    assert [h["password"] for h in get_history(master_key, ids["site2.com"])][0] == "older-edit"
+
+    again = sync_with(master_key, in_process_peer(peer))
+    assert (again["pulled"], again["pushed"], again["rounds"]) == (0, 0, 3)
+
+def test_sync_moves_only_changed_rows(mock_paths, tmp_path):
+    master_key, peer = make_replicas(tmp_path, entries=0)
+    import_entries(master_key, ({"site": f"bulk{i}.com", "username": "u", "password": f"secret-{i}"}
+                                for i in range(2000)))
+    full = sync_with(master_key, in_process_peer(peer))
+    assert full["pushed"] == 2000
+    for site, entry_id in list(ids_by_site().items())[:3]:
+        update_password(master_key, entry_id, site, "u", "changed", "", "")
+
+    stats = sync_with(master_key, in_process_peer(peer))
+
+    assert stats["pushed"] == 3
+    moved = stats["bytes_sent"] + stats["bytes_received"]
+    assert moved < 20000
+    assert moved * 20 < full["bytes_sent"] + full["bytes_received"]
+
+@pytest.mark.parametrize("transport", ["socket", "file"])
+def test_sync_over_transport(mock_paths, tmp_path, transport):
+    master_key, peer = make_replicas(tmp_path)
+    with use_vault(peer):
+        add_password(master_key, "peer-only.com", "user", "p")
+    options = {"transport": transport, "directory": str(tmp_path)}
+    listening = threading.Event()
+    served = {}
+
+    def on_listening(port):
+        options["port"] = port
+        listening.set()
+
+    def serve():
+        with use_vault(peer):
+            served.update(serve_sync(peer["master_key"], options, on_listening))
+    thread = threading.Thread(target=serve)
+    thread.start()
+    if transport == "socket":
+        assert listening.wait(5)
+    result = sync_vault(master_key, options)
+    thread.join(5)
+
+    assert result["pulled"] == 1
+    assert served["rounds"] == result["rounds"]
+    assert ("peer-only.com", "user", "p") in snapshot(master_key)
+    assert not any(name.endswith((".request", ".response")) for name in os.listdir(tmp_path))
+
+def test_sync_refuses_replicas_upgraded_separately(mock_paths, tmp_path):
+    # Copied before the first unlock created a vault key, so each copy generates its own
+    master_key = hash_master_password("MasterPass")
+    init_db()
+    close_db()
+    peer_dir = tmp_path / "peer"
+    peer_dir.mkdir()
+    for name in (backend.DB_FILE, backend.MASTER_PASSWORD_FILE):
+        shutil.copy(name, peer_dir / name)
+    init_db(master_key)
+    add_password(master_key, "local.com", "user", "p")
+    assert open_vault("peer", str(peer_dir), "MasterPass")["status"] == "Vault opened"
+    peer = backend._vaults["peer"]
+
+    with use_vault(peer):
+        respond, state = sync_responder(peer["master_key"])
+
+    def exchange(frame):
+        with use_vault(peer):
+            return respond(frame)
+    with pytest.raises(SyncKeyMismatch):
+        sync_with(master_key, exchange)
+    assert state["done"] and "Vault key mismatch" in state["error"]
+    with use_vault(peer):
+        assert list_entries() == []
+
+def test_sync_responder_binds_to_first_session(mock_paths, tmp_path):
+    master_key, peer = make_replicas(tmp_path)
+    vault_key = get_vault_key(master_key)
+    exchange = in_process_peer(peer)
+    first, second = os.urandom(16), os.urandom(16)
+
+    with pytest.raises(ValueError):
+        exchange(seal_sync_message(vault_key, first, 0, backend.SYNC_REQUEST, {'op': 'hashes', 'prefixes': ['']}))
+    reply = exchange(seal_sync_message(vault_key, first, 1, backend.SYNC_REQUEST, {'op': 'hello'}))
+    assert open_sync_message(vault_key, reply)[0] == first
+    with pytest.raises(ValueError):
+        exchange(seal_sync_message(vault_key, second, 2, backend.SYNC_REQUEST, {'op': 'hello'}))
+    exchange(seal_sync_message(vault_key, first, 2, backend.SYNC_REQUEST, {'op': 'done'}))
+
+def test_index_backfill_does_not_count_as_an_edit(mock_paths, tmp_path):
+    master_key, peer = make_replicas(tmp_path)
+    c = get_db().cursor()
+    c.execute("UPDATE passwords SET strength = 40")  # plaintext scores left by an older version
+    get_db().commit()
+    c.execute("SELECT MAX(seq) FROM changelog")
+    last_seq = c.fetchone()[0]
+    c.execute("SELECT uid, version, modified_at FROM sync_rows ORDER BY uid")
+    before = c.fetchall()
+
+    assert backfill_password_index(master_key) == 3
+    c.execute("SELECT MAX(seq) FROM changelog")
+    assert c.fetchone()[0] == last_seq
+    c.execute("SELECT uid, version, modified_at FROM sync_rows ORDER BY uid")
+    assert c.fetchall() == before
+    stats = sync_with(master_key, in_process_peer(peer))
+    assert (stats["pulled"], stats["pushed"]) == (0, 0)
+